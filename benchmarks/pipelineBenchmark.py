@@ -0,0 +1,272 @@
+import argparse
+import json
+import os, sys
+import platform
+import resource
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+#add root and camera folders to path, like the GUI does
+topSrcFolder = str(Path(os.path.dirname(os.path.abspath(__file__))).parents[0])
+sys.path.append(topSrcFolder)
+sys.path.append(os.path.join(topSrcFolder, 'camera'))
+
+from replayPolarCam import ReplayPolarCam
+from polarCamBase import PolarCamBase
+from enhancement.imageEnhancements import exposureFusion, clahe
+from utils.imageUtils import save_image_to_folder
+from utils.imageWriter import AsyncImageWriter
+
+#End to end benchmark of the capture pipeline, from GetNextImage to the pixels shown in cameraFeedLabel.
+#
+#The stages run the GUI code paths on synthetic 2448x2048 Polarized8 frames served by the replay
+#camera, no hardware needed. Every stage reports p50 / p99 / mean latency, throughput, how much
+#it raised the peak RSS of the process and that peak once it ran, written as JSON. The peak is
+#cumulative over the stages run before, it depends on the stage order:
+#
+#   python benchmarks/pipelineBenchmark.py --output result.json
+#
+#Runs are compared with a baseline of the same machine, the exit code is 1 when a stage got slower
+#by more than --tolerance, or when a stage of the baseline did not run, e.g. because it raised.
+#Store the baseline once with --save-baseline. Baselines depend on the machine, they are not committed.
+
+STAGES = ('grab', 'grab_all_polarized_image', 'append_images_to_panel', 'display_convert', 'craft_text_characters',
+          'exposure_fusion', 'clahe', 'save_png_sync', 'save_async_submit')
+
+DEFAULT_BASELINE = os.path.join(topSrcFolder, 'benchmarks', 'baseline.json')
+
+#maximumSize of cameraFeedLabel in the GUI
+DISPLAY_HEIGHT = 950
+
+
+def peak_rss_mb() -> float:
+    #ru_maxrss is in KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+def time_stage(fn, iterations, warmup=1) -> dict:
+    """Latency statistics of iterations calls of fn, after warmup calls
+    """
+    start_peak_rss_mb = peak_rss_mb()
+    for _ in range(warmup):
+        fn()
+
+    samples_ms = np.empty(iterations)
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples_ms[i] = (time.perf_counter() - start) * 1000.0
+
+    return {'iterations': iterations,
+            'p50_ms': float(np.percentile(samples_ms, 50)),
+            'p99_ms': float(np.percentile(samples_ms, 99)),
+            'mean_ms': float(samples_ms.mean()),
+            'throughput_per_s': float(1000.0 / max(samples_ms.mean(), 1e-9)),
+            #ru_maxrss only grows, a stage staying below an earlier peak adds 0
+            'peak_rss_delta_mb': peak_rss_mb() - start_peak_rss_mb,
+            'peak_rss_cumulative_mb': peak_rss_mb()}
+
+
+def display_convert(image, display_height=DISPLAY_HEIGHT):
+    """The resize and color conversion of PolarCamMainApp.displayImageOnQLabel, without the widget
+    """
+    h, w = image.shape[:2]
+    display_width = int(w / (float(h) / display_height))
+    resized = cv2.resize(image, (display_width, display_height), interpolation=cv2.INTER_AREA)
+
+    if image.ndim == 3:
+        return cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+    return cv2.cvtColor(resized, cv2.COLOR_GRAY2RGB)
+
+
+def run_pipeline(iterations=20, craft_iterations=3, stages=STAGES, craft_weights=None) -> dict:
+    """Run the selected stages and return the results, see the module comment
+    """
+    results = {}
+    skipped = {}
+
+    polar_cam = ReplayPolarCam(fps=None)
+    polar_cam.start_acquisition()
+
+    #one frame through the preview path, the inputs of the later stages
+    with polar_cam.grab_image_lease() as frame:
+        raw_image = frame.array.copy()
+    images = polar_cam.grab_all_polarized_image(raw_image)
+    h, w = images[0].shape
+    panel = np.empty((2*h, 3*w), dtype=np.uint8)
+    PolarCamBase.append_images_to_panel(*images, out=panel)
+    #the deglared half of the right column, what is sent to OCR
+    right_image = panel[:, 2*w:].copy()
+    filtered_image = right_image[h:, :].copy()
+
+    def grab():
+        with polar_cam.grab_image_lease() as frame:
+            np.copyto(raw_image, frame.array)
+
+    stage_functions = {
+        'grab': (grab, iterations),
+        'grab_all_polarized_image': (lambda: polar_cam.grab_all_polarized_image(raw_image), iterations),
+        'append_images_to_panel': (lambda: PolarCamBase.append_images_to_panel(*images, out=panel), iterations),
+        'display_convert': (lambda: display_convert(panel), iterations),
+        'clahe': (lambda: clahe(filtered_image, 3, (20, 20)), iterations),
+    }
+
+    if 'exposure_fusion' in stages:
+        bracket_exposures_us = (2500, 5000, 10000, 20000, 40000)
+        polar_cam.configure_image_sequence([(w*2, h*2, exposure_us, 0.0) for exposure_us in bracket_exposures_us])
+        bracket = [polar_cam.grab_all_polarized_image(record)[5].copy() for record in polar_cam.grab_sequence(len(bracket_exposures_us))]
+        polar_cam.reset_sequencer()
+        stage_functions['exposure_fusion'] = (lambda: exposureFusion(bracket), max(1, iterations // 4))
+
+    def craft():
+        #torch and the model are loaded by the untimed warmup call, and count towards this stage's RSS
+        import enhancement.textLossDisplay as textLossDisplay
+        if craft_weights is not None:
+            textLossDisplay.pretrained_model_path = craft_weights
+        textLossDisplay.craft_text_characters(right_image)
+
+    stage_functions['craft_text_characters'] = (craft, craft_iterations)
+
+    #the save paths write to output/ below the working folder
+    out_dir = tempfile.mkdtemp()
+    previous_dir = os.getcwd()
+    os.chdir(out_dir)
+    writer = AsyncImageWriter(max_pending=iterations + 1)
+    stage_functions['save_png_sync'] = (lambda: save_image_to_folder(panel), max(1, iterations // 4))
+    #includes the copy of the panel the writer queues, like the GUI capture
+    stage_functions['save_async_submit'] = (lambda: save_image_to_folder(panel, writer), iterations)
+
+    try:
+        for stage in stages:
+            if stage not in stage_functions:
+                skipped[stage] = 'unknown stage'
+                continue
+
+            fn, stage_iterations = stage_functions[stage]
+            print('Running {} ({} iterations)'.format(stage, stage_iterations))
+            try:
+                results[stage] = time_stage(fn, stage_iterations)
+            except Exception as ex:
+                #e.g. no CRAFT weights on this machine
+                print('Error: {} running {}'.format(ex, stage))
+                skipped[stage] = str(ex)
+
+        writer.flush()
+        if 'save_async_submit' in results:
+            results['save_async_submit']['writer'] = writer.metrics()
+    finally:
+        writer.close()
+        os.chdir(previous_dir)
+        shutil.rmtree(out_dir)
+        polar_cam.stop_acquisition()
+        polar_cam.release()
+
+    return {'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     'machine': platform.machine(),
+                     'processor': platform.processor(),
+                     'cpu_count': os.cpu_count(),
+                     'python': platform.python_version(),
+                     'numpy': np.__version__,
+                     'opencv': cv2.__version__,
+                     'frame_shape': list(raw_image.shape)},
+            'stages': results,
+            'skipped': skipped,
+            'peak_rss_mb': peak_rss_mb()}
+
+
+def compare_with_baseline(result, baseline, tolerance=0.2, min_delta_ms=0.5) -> list:
+    """Stages whose p50 latency exceeds the baseline by more than tolerance
+
+    Slowdowns below min_delta_ms are ignored, sub millisecond stages are mostly timer noise.
+
+    Returns:
+        list: (stage, baseline p50 ms, p50 ms, ratio) of every regressed stage
+    """
+    regressions = []
+    for stage, stats in result['stages'].items():
+        baseline_stats = baseline.get('stages', {}).get(stage)
+        if baseline_stats is None:
+            continue
+
+        ratio = stats['p50_ms'] / max(baseline_stats['p50_ms'], 1e-9)
+        if ratio > 1.0 + tolerance and stats['p50_ms'] - baseline_stats['p50_ms'] > min_delta_ms:
+            regressions.append((stage, baseline_stats['p50_ms'], stats['p50_ms'], ratio))
+
+    return regressions
+
+
+def missing_stages(result, baseline) -> list:
+    """Stages of the baseline without a result in this run, e.g. because they raised
+
+    Returns:
+        list: (stage, reason) of every missing stage
+    """
+    return [(stage, result['skipped'].get(stage, 'not run')) for stage in baseline.get('stages', {}) if stage not in result['stages']]
+
+
+def print_result(result, baseline=None):
+    print('{:<28s} {:>10s} {:>10s} {:>10s} {:>10s} {:>10s} {:>10s}'.format('stage', 'p50 ms', 'p99 ms', 'per s', '+peak MB', 'peak MB', 'vs base'))
+    for stage, stats in result['stages'].items():
+        baseline_stats = None if baseline is None else baseline.get('stages', {}).get(stage)
+        versus = '' if baseline_stats is None else '{:.2f}x'.format(stats['p50_ms'] / max(baseline_stats['p50_ms'], 1e-9))
+        print('{:<28s} {:10.3f} {:10.3f} {:10.1f} {:10.1f} {:10.1f} {:>10s}'.format(stage, stats['p50_ms'], stats['p99_ms'], stats['throughput_per_s'],
+                                                                                  stats['peak_rss_delta_mb'], stats['peak_rss_cumulative_mb'], versus))
+    for stage, reason in result['skipped'].items():
+        print('{:<28s} skipped: {}'.format(stage, reason))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End to end capture pipeline benchmark')
+    parser.add_argument('--iterations', type=int, default=20, help='iterations of the fast stages')
+    parser.add_argument('--craft-iterations', type=int, default=3, help='iterations of craft_text_characters')
+    parser.add_argument('--stages', nargs='+', default=list(STAGES), choices=STAGES, help='stages to run')
+    parser.add_argument('--craft-weights', default=None, help='CRAFT state dict, the GUI default when not given')
+    parser.add_argument('--output', default=None, help='write the result JSON here')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON to compare with, every stage it holds must run')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='accepted p50 slowdown against the baseline')
+    parser.add_argument('--min-delta-ms', type=float, default=0.5, help='smallest p50 slowdown reported as a regression')
+    args = parser.parse_args()
+
+    result = run_pipeline(args.iterations, args.craft_iterations, args.stages, args.craft_weights)
+
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    print_result(result, baseline)
+
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(result, file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(result, file, indent=2)
+        print('Baseline saved to {}'.format(args.baseline))
+        return 0
+
+    if baseline is None:
+        print('No baseline at {}, store one with --save-baseline'.format(args.baseline))
+        return 0
+
+    regressions = compare_with_baseline(result, baseline, args.tolerance, args.min_delta_ms)
+    for stage, baseline_ms, p50_ms, ratio in regressions:
+        print('Regression: {} p50 {:.3f} ms vs baseline {:.3f} ms ({:.2f}x)'.format(stage, p50_ms, baseline_ms, ratio))
+
+    missing = missing_stages(result, baseline)
+    for stage, reason in missing:
+        print('Regression: {} is in the baseline but did not run: {}'.format(stage, reason))
+
+    return 1 if len(regressions) > 0 or len(missing) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,5 @@
 import PySpin
+from nodeCache import NodeCache
 
 def print_retrieve_node_failure(node, name):
     """"
@@ -16,6 +17,50 @@ def print_retrieve_node_failure(node, name):
     print('Please try a Blackfly S camera.')
     
 
+#The following helpers resolve nodes through a NodeCache when one is passed in place of the nodemap
+def get_node(nodemap, name, ptr_type):
+    """
+    Returns the node called name wrapped in ptr_type, resolved once when nodemap is a NodeCache.
+
+    :param nodemap: Device nodemap or NodeCache.
+    :param name: Node name.
+    :param ptr_type: Pointer type, e.g. PySpin.CFloatPtr.
+    :type nodemap: INodeMap or NodeCache
+    :type name: String
+    :rtype: ptr_type
+    """
+    if isinstance(nodemap, NodeCache):
+        return nodemap.get(name, ptr_type)
+
+    return ptr_type(nodemap.GetNode(name))
+
+def get_entry(nodemap, node, entry_name):
+    if isinstance(nodemap, NodeCache):
+        return nodemap.get_entry(node, entry_name)
+
+    return node.GetEntryByName(entry_name)
+
+def is_readable(nodemap, node) -> bool:
+    if isinstance(nodemap, NodeCache):
+        return nodemap.is_readable(node)
+
+    return PySpin.IsReadable(node)
+
+def is_writable(nodemap, node) -> bool:
+    if isinstance(nodemap, NodeCache):
+        return nodemap.is_writable(node)
+
+    return PySpin.IsWritable(node)
+
+def invalidate_access_modes(nodemap):
+    """
+    Mode changes (sequencer mode, auto exposure, ...) lock and unlock other nodes,
+    cached access modes are dropped after them.
+    """
+    if isinstance(nodemap, NodeCache):
+        nodemap.invalidate_access_modes()
+
+
 #The following functions below are helpers for configuring image sequence captures 
 def configure_sequencer_part_one(nodemap) -> bool:
     """"
@@ -35,6 +80,9 @@ def configure_sequencer_part_one(nodemap) -> bool:
     print('*** CONFIGURING SEQUENCER ***\n')
     result = True
     try:
+        # Modes may have been changed outside of these helpers since the last call
+        invalidate_access_modes(nodemap)
+
         
         # Ensure sequencer is off for configuration
         #
@@ -55,30 +103,31 @@ def configure_sequencer_part_one(nodemap) -> bool:
         #
         #  Validate sequencer configuration
         
-        node_sequencer_configuration_valid = PySpin.CEnumerationPtr(nodemap.GetNode('SequencerConfigurationValid'))
-        if not PySpin.IsReadable(node_sequencer_configuration_valid):
+        node_sequencer_configuration_valid = get_node(nodemap, 'SequencerConfigurationValid', PySpin.CEnumerationPtr)
+        if not is_readable(nodemap, node_sequencer_configuration_valid):
             print_retrieve_node_failure('node', 'SequencerConfigurationValid')
             return False
 
-        sequencer_configuration_valid_yes = node_sequencer_configuration_valid.GetEntryByName('Yes')
-        if not PySpin.IsReadable(sequencer_configuration_valid_yes):
+        sequencer_configuration_valid_yes = get_entry(nodemap, node_sequencer_configuration_valid, 'Yes')
+        if not is_readable(nodemap, sequencer_configuration_valid_yes):
             print_retrieve_node_failure('entry', 'SequencerConfigurationValid Yes')
             return False
 
         # If valid, disable sequencer mode; otherwise, do nothing
-        node_sequencer_mode = PySpin.CEnumerationPtr(nodemap.GetNode('SequencerMode'))
+        node_sequencer_mode = get_node(nodemap, 'SequencerMode', PySpin.CEnumerationPtr)
         if node_sequencer_configuration_valid.GetCurrentEntry().GetValue() == \
                 sequencer_configuration_valid_yes.GetValue():
-            if not PySpin.IsReadable(node_sequencer_mode) or not PySpin.IsWritable(node_sequencer_mode):
+            if not is_readable(nodemap, node_sequencer_mode) or not is_writable(nodemap, node_sequencer_mode):
                 print_retrieve_node_failure('node', 'SequencerMode')
                 return False
 
-            sequencer_mode_off = node_sequencer_mode.GetEntryByName('Off')
-            if not PySpin.IsReadable(sequencer_mode_off):
+            sequencer_mode_off = get_entry(nodemap, node_sequencer_mode, 'Off')
+            if not is_readable(nodemap, sequencer_mode_off):
                 print_retrieve_node_failure('entry', 'SequencerMode Off')
                 return False
 
             node_sequencer_mode.SetIntValue(sequencer_mode_off.GetValue())
+            invalidate_access_modes(nodemap)
 
             print('Sequencer mode disabled...')
 
@@ -91,17 +140,18 @@ def configure_sequencer_part_one(nodemap) -> bool:
         #  *** LATER ***
         #  Automatic exposure is turned back on at the end of the example in
         #  order to restore the camera to its default state.
-        node_exposure_auto = PySpin.CEnumerationPtr(nodemap.GetNode('ExposureAuto'))
-        if not PySpin.IsReadable(node_exposure_auto) or not PySpin.IsWritable(node_exposure_auto):
+        node_exposure_auto = get_node(nodemap, 'ExposureAuto', PySpin.CEnumerationPtr)
+        if not is_readable(nodemap, node_exposure_auto) or not is_writable(nodemap, node_exposure_auto):
             print_retrieve_node_failure('node', 'ExposureAuto')
             return False
 
-        exposure_auto_off = node_exposure_auto.GetEntryByName('Off')
-        if not PySpin.IsReadable(exposure_auto_off):
+        exposure_auto_off = get_entry(nodemap, node_exposure_auto, 'Off')
+        if not is_readable(nodemap, exposure_auto_off):
             print_retrieve_node_failure('entry', 'ExposureAuto Off')
             return False
 
         node_exposure_auto.SetIntValue(exposure_auto_off.GetValue())
+        invalidate_access_modes(nodemap)
 
         print('Automatic exposure disabled...')
 
@@ -114,17 +164,18 @@ def configure_sequencer_part_one(nodemap) -> bool:
         #  *** LATER ***
         #  Automatic gain is turned back on at the end of the example in
         #  order to restore the camera to its default state.
-        node_gain_auto = PySpin.CEnumerationPtr(nodemap.GetNode('GainAuto'))
-        if not PySpin.IsReadable(node_gain_auto) or not PySpin.IsWritable(node_gain_auto):
+        node_gain_auto = get_node(nodemap, 'GainAuto', PySpin.CEnumerationPtr)
+        if not is_readable(nodemap, node_gain_auto) or not is_writable(nodemap, node_gain_auto):
             print_retrieve_node_failure('node', 'GainAuto')
             return False
 
-        gain_auto_off = node_gain_auto.GetEntryByName('Off')
-        if not PySpin.IsReadable(gain_auto_off):
+        gain_auto_off = get_entry(nodemap, node_gain_auto, 'Off')
+        if not is_readable(nodemap, gain_auto_off):
             print_retrieve_node_failure('entry', 'GainAuto Off')
             return False
 
         node_gain_auto.SetIntValue(gain_auto_off.GetValue())
+        invalidate_access_modes(nodemap)
 
         print('Automatic gain disabled...')
 
@@ -137,17 +188,18 @@ def configure_sequencer_part_one(nodemap) -> bool:
         # *** LATER ***
         # Before sequencer mode is turned back on, sequencer configuration
         # mode must be turned back off.
-        node_sequencer_configuration_mode = PySpin.CEnumerationPtr(nodemap.GetNode('SequencerConfigurationMode'))
-        if not PySpin.IsReadable(node_sequencer_configuration_mode) or not PySpin.IsWritable(node_sequencer_configuration_mode):
+        node_sequencer_configuration_mode = get_node(nodemap, 'SequencerConfigurationMode', PySpin.CEnumerationPtr)
+        if not is_readable(nodemap, node_sequencer_configuration_mode) or not is_writable(nodemap, node_sequencer_configuration_mode):
             print_retrieve_node_failure('node', 'SequencerConfigurationMode')
             return False
 
-        sequencer_configuration_mode_on = node_sequencer_configuration_mode.GetEntryByName('On')
-        if not PySpin.IsReadable(sequencer_configuration_mode_on):
+        sequencer_configuration_mode_on = get_entry(nodemap, node_sequencer_configuration_mode, 'On')
+        if not is_readable(nodemap, sequencer_configuration_mode_on):
             print_retrieve_node_failure('entry', 'SequencerConfigurationMode On')
             return False
 
         node_sequencer_configuration_mode.SetIntValue(sequencer_configuration_mode_on.GetValue())
+        invalidate_access_modes(nodemap)
 
         print('Sequencer configuration mode enabled...\n')
 
@@ -176,17 +228,18 @@ def configure_sequencer_part_two(nodemap)-> bool:
         # *** NOTES ***
         # Once all desired states have been set, turn sequencer
         # configuration mode off in order to turn sequencer mode on.
-        node_sequencer_configuration_mode = PySpin.CEnumerationPtr(nodemap.GetNode('SequencerConfigurationMode'))
-        if not PySpin.IsReadable(node_sequencer_configuration_mode) or not PySpin.IsWritable(node_sequencer_configuration_mode):
+        node_sequencer_configuration_mode = get_node(nodemap, 'SequencerConfigurationMode', PySpin.CEnumerationPtr)
+        if not is_readable(nodemap, node_sequencer_configuration_mode) or not is_writable(nodemap, node_sequencer_configuration_mode):
             print_retrieve_node_failure('node', 'SequencerConfigurationMode')
             return False
 
-        sequencer_configuration_mode_off = node_sequencer_configuration_mode.GetEntryByName('Off')
-        if not PySpin.IsReadable(sequencer_configuration_mode_off):
+        sequencer_configuration_mode_off = get_entry(nodemap, node_sequencer_configuration_mode, 'Off')
+        if not is_readable(nodemap, sequencer_configuration_mode_off):
             print_retrieve_node_failure('entry', 'SequencerConfigurationMode Off')
             return False
 
         node_sequencer_configuration_mode.SetIntValue(sequencer_configuration_mode_off.GetValue())
+        invalidate_access_modes(nodemap)
 
         print('Sequencer configuration mode disabled...')
 
@@ -199,17 +252,18 @@ def configure_sequencer_part_two(nodemap)-> bool:
         # *** LATER ***
         # Once all images have been captured, disable the sequencer in order
         # to restore the camera to its initial state.
-        node_sequencer_mode = PySpin.CEnumerationPtr(nodemap.GetNode('SequencerMode'))
-        if not PySpin.IsReadable(node_sequencer_mode) or not PySpin.IsWritable(node_sequencer_mode):
+        node_sequencer_mode = get_node(nodemap, 'SequencerMode', PySpin.CEnumerationPtr)
+        if not is_readable(nodemap, node_sequencer_mode) or not is_writable(nodemap, node_sequencer_mode):
             print_retrieve_node_failure('node', 'SequencerMode')
             return False
 
-        sequencer_mode_on = node_sequencer_mode.GetEntryByName('On')
-        if not PySpin.IsReadable(sequencer_mode_on):
+        sequencer_mode_on = get_entry(nodemap, node_sequencer_mode, 'On')
+        if not is_readable(nodemap, sequencer_mode_on):
             print_retrieve_node_failure('entry', 'SequencerMode On')
             return False
 
         node_sequencer_mode.SetIntValue(sequencer_mode_on.GetValue())
+        invalidate_access_modes(nodemap)
 
         print('Sequencer mode enabled...')
 
@@ -220,13 +274,13 @@ def configure_sequencer_part_two(nodemap)-> bool:
         # validate them. Although this node cannot ensure that the states
         # have been set up correctly, it does ensure that the states have
         # been set up in such a way that the camera can function.
-        node_sequencer_configuration_valid = PySpin.CEnumerationPtr(nodemap.GetNode('SequencerConfigurationValid'))
-        if not PySpin.IsReadable(node_sequencer_configuration_valid):
+        node_sequencer_configuration_valid = get_node(nodemap, 'SequencerConfigurationValid', PySpin.CEnumerationPtr)
+        if not is_readable(nodemap, node_sequencer_configuration_valid):
             print_retrieve_node_failure('node', 'SequencerConfigurationValid')
             return False
 
-        sequencer_configuration_valid_yes = node_sequencer_configuration_valid.GetEntryByName('Yes')
-        if not PySpin.IsReadable(sequencer_configuration_valid_yes):
+        sequencer_configuration_valid_yes = get_entry(nodemap, node_sequencer_configuration_valid, 'Yes')
+        if not is_readable(nodemap, sequencer_configuration_valid_yes):
             print_retrieve_node_failure('entry', 'SequencerConfigurationValid Yes')
             return False
 
@@ -261,17 +315,18 @@ def reset_sequencer(nodemap):
         #
         # *** NOTES ***
         # The sequencer is turned off in order to return the camera to its default state.
-        node_sequencer_mode = PySpin.CEnumerationPtr(nodemap.GetNode('SequencerMode'))
-        if not PySpin.IsReadable(node_sequencer_mode) or not PySpin.IsWritable(node_sequencer_mode):
+        node_sequencer_mode = get_node(nodemap, 'SequencerMode', PySpin.CEnumerationPtr)
+        if not is_readable(nodemap, node_sequencer_mode) or not is_writable(nodemap, node_sequencer_mode):
             print_retrieve_node_failure('node', 'SequencerMode')
             return False
 
-        sequencer_mode_off = node_sequencer_mode.GetEntryByName('Off')
-        if not PySpin.IsReadable(sequencer_mode_off):
+        sequencer_mode_off = get_entry(nodemap, node_sequencer_mode, 'Off')
+        if not is_readable(nodemap, sequencer_mode_off):
             print_retrieve_node_failure('entry', 'SequencerMode Off')
             return False
 
         node_sequencer_mode.SetIntValue(sequencer_mode_off.GetValue())
+        invalidate_access_modes(nodemap)
 
         print('Turning off sequencer mode...')
 
@@ -279,22 +334,24 @@ def reset_sequencer(nodemap):
         #
         # *** NOTES ***
         # Automatic exposure is turned on in order to return the camera to its default state.
-        node_exposure_auto = PySpin.CEnumerationPtr(nodemap.GetNode('ExposureAuto'))
-        if PySpin.IsReadable(node_exposure_auto) and PySpin.IsWritable(node_exposure_auto):
-            exposure_auto_continuous = node_exposure_auto.GetEntryByName('Continuous')
-            if PySpin.IsReadable(exposure_auto_continuous):
+        node_exposure_auto = get_node(nodemap, 'ExposureAuto', PySpin.CEnumerationPtr)
+        if is_readable(nodemap, node_exposure_auto) and is_writable(nodemap, node_exposure_auto):
+            exposure_auto_continuous = get_entry(nodemap, node_exposure_auto, 'Continuous')
+            if is_readable(nodemap, exposure_auto_continuous):
                 node_exposure_auto.SetIntValue(exposure_auto_continuous.GetValue())
+                invalidate_access_modes(nodemap)
                 print('Turning automatic exposure back on...')
 
         # Turn automatic gain back on
         #
         # *** NOTES ***
         # Automatic gain is turned on in order to return the camera to its default state.
-        node_gain_auto = PySpin.CEnumerationPtr(nodemap.GetNode('GainAuto'))
-        if PySpin.IsReadable(node_gain_auto) and PySpin.IsWritable(node_gain_auto):
-            gain_auto_continuous = node_gain_auto.GetEntryByName('Continuous')
-            if PySpin.IsReadable(gain_auto_continuous):
+        node_gain_auto = get_node(nodemap, 'GainAuto', PySpin.CEnumerationPtr)
+        if is_readable(nodemap, node_gain_auto) and is_writable(nodemap, node_gain_auto):
+            gain_auto_continuous = get_entry(nodemap, node_gain_auto, 'Continuous')
+            if is_readable(nodemap, gain_auto_continuous):
                 node_gain_auto.SetIntValue(gain_auto_continuous.GetValue())
+                invalidate_access_modes(nodemap)
                 print('Turning automatic gain mode back on...\n')
 
     except PySpin.SpinnakerException as ex:
@@ -345,8 +402,8 @@ def set_single_state(nodemap, sequence_number, width_to_set, height_to_set, expo
         # *** LATER ***
         # The next state - i.e. the state to be linked to -
         # also needs to be set before saving the current state.
-        node_sequencer_set_selector = PySpin.CIntegerPtr(nodemap.GetNode('SequencerSetSelector'))
-        if not PySpin.IsWritable(node_sequencer_set_selector):
+        node_sequencer_set_selector = get_node(nodemap, 'SequencerSetSelector', PySpin.CIntegerPtr)
+        if not is_writable(nodemap, node_sequencer_set_selector):
             print_retrieve_node_failure('node', 'SequencerSetSelector')
             return False
 
@@ -366,8 +423,8 @@ def set_single_state(nodemap, sequence_number, width_to_set, height_to_set, expo
         # for all camera models.
         #
         # Set width; width recorded in pixels
-        node_width = PySpin.CIntegerPtr(nodemap.GetNode('Width'))
-        if PySpin.IsReadable(node_width) and PySpin.IsWritable(node_width):
+        node_width = get_node(nodemap, 'Width', PySpin.CIntegerPtr)
+        if is_readable(nodemap, node_width) and is_writable(nodemap, node_width):
             width_inc = node_width.GetInc()
 
             if width_to_set % width_inc != 0:
@@ -381,8 +438,8 @@ def set_single_state(nodemap, sequence_number, width_to_set, height_to_set, expo
             print('\tUnable to set width; width for sequencer not available on all camera models...')
 
         # Set height; height recorded in pixels
-        node_height = PySpin.CIntegerPtr(nodemap.GetNode('Height'))
-        if PySpin.IsReadable(node_height) and PySpin.IsWritable(node_height):
+        node_height = get_node(nodemap, 'Height', PySpin.CIntegerPtr)
+        if is_readable(nodemap, node_height) and is_writable(nodemap, node_height):
             height_inc = node_height.GetInc()
 
             if height_to_set % height_inc != 0:
@@ -396,8 +453,8 @@ def set_single_state(nodemap, sequence_number, width_to_set, height_to_set, expo
             print('\tUnable to set height; height for sequencer not available on all camera models...')
 
         # Set exposure time; exposure time recorded in microseconds
-        node_exposure_time = PySpin.CFloatPtr(nodemap.GetNode('ExposureTime'))
-        if not PySpin.IsReadable(node_exposure_time) or not PySpin.IsWritable(node_exposure_time):
+        node_exposure_time = get_node(nodemap, 'ExposureTime', PySpin.CFloatPtr)
+        if not is_readable(nodemap, node_exposure_time) or not is_writable(nodemap, node_exposure_time):
             print_retrieve_node_failure('node', 'ExposureTime')
             return False
 
@@ -411,8 +468,8 @@ def set_single_state(nodemap, sequence_number, width_to_set, height_to_set, expo
         print('\tExposure set to {0:.0f}...'.format(node_exposure_time.GetValue()))
 
         # Set gain; gain recorded in decibels
-        node_gain = PySpin.CFloatPtr(nodemap.GetNode('Gain'))
-        if not PySpin.IsReadable(node_gain) or not PySpin.IsWritable(node_gain):
+        node_gain = get_node(nodemap, 'Gain', PySpin.CFloatPtr)
+        if not is_readable(nodemap, node_gain) or not is_writable(nodemap, node_gain):
             print_retrieve_node_failure('node', 'Gain')
             return False
 
@@ -431,13 +488,13 @@ def set_single_state(nodemap, sequence_number, width_to_set, height_to_set, expo
         # It is a requirement of every state to have its trigger source set.
         # The trigger source refers to the moment when the sequencer changes
         # from one state to the next.
-        node_sequencer_trigger_source = PySpin.CEnumerationPtr(nodemap.GetNode('SequencerTriggerSource'))
-        if not PySpin.IsReadable(node_sequencer_trigger_source) or not PySpin.IsWritable(node_sequencer_trigger_source):
+        node_sequencer_trigger_source = get_node(nodemap, 'SequencerTriggerSource', PySpin.CEnumerationPtr)
+        if not is_readable(nodemap, node_sequencer_trigger_source) or not is_writable(nodemap, node_sequencer_trigger_source):
             print_retrieve_node_failure('node', 'SequencerTriggerSource')
             return False
 
-        sequencer_trigger_source_frame_start = node_sequencer_trigger_source.GetEntryByName('FrameStart')
-        if not PySpin.IsReadable(sequencer_trigger_source_frame_start):
+        sequencer_trigger_source_frame_start = get_entry(nodemap, node_sequencer_trigger_source, 'FrameStart')
+        if not is_readable(nodemap, sequencer_trigger_source_frame_start):
             print_retrieve_node_failure('entry', 'SequencerTriggerSource FrameStart')
             return False
 
@@ -452,8 +509,8 @@ def set_single_state(nodemap, sequence_number, width_to_set, height_to_set, expo
         # exceed the maximum and that the states loop appropriately.
         final_sequence_index = max_sequence_index
 
-        node_sequencer_set_next = PySpin.CIntegerPtr(nodemap.GetNode('SequencerSetNext'))
-        if not PySpin.IsWritable(node_sequencer_set_next):
+        node_sequencer_set_next = get_node(nodemap, 'SequencerSetNext', PySpin.CIntegerPtr)
+        if not is_writable(nodemap, node_sequencer_set_next):
             print('Unable to select next state. Aborting...\n')
             return False
 
@@ -470,8 +527,8 @@ def set_single_state(nodemap, sequence_number, width_to_set, height_to_set, expo
         # Once all appropriate settings have been configured, make sure to
         # save the state to the sequence. Notice that these settings will be
         # lost when the camera is power-cycled.
-        node_sequencer_set_save = PySpin.CCommandPtr(nodemap.GetNode('SequencerSetSave'))
-        if not PySpin.IsWritable(node_sequencer_set_save):
+        node_sequencer_set_save = get_node(nodemap, 'SequencerSetSave', PySpin.CCommandPtr)
+        if not is_writable(nodemap, node_sequencer_set_save):
             print('Unable to save state. Aborting...\n')
             return False
 
@@ -494,18 +551,20 @@ def set_cam_exposure_auto(nodemap, onOrOff: bool):
         #
         # *** NOTES ***
         # Automatic exposure is turned on in order to return the camera to its default state.
-        node_exposure_auto = PySpin.CEnumerationPtr(nodemap.GetNode('ExposureAuto'))
-        if PySpin.IsReadable(node_exposure_auto) and PySpin.IsWritable(node_exposure_auto):
+        node_exposure_auto = get_node(nodemap, 'ExposureAuto', PySpin.CEnumerationPtr)
+        if is_readable(nodemap, node_exposure_auto) and is_writable(nodemap, node_exposure_auto):
 
             if onOrOff:
-                exposure_auto_continuous = node_exposure_auto.GetEntryByName('Continuous')
-                if PySpin.IsReadable(exposure_auto_continuous):
+                exposure_auto_continuous = get_entry(nodemap, node_exposure_auto, 'Continuous')
+                if is_readable(nodemap, exposure_auto_continuous):
                     node_exposure_auto.SetIntValue(exposure_auto_continuous.GetValue())
+                    invalidate_access_modes(nodemap)
                     print('Turning automatic exposure back on...')
             else:
-                exposure_auto_off = node_exposure_auto.GetEntryByName('Off')
-                if PySpin.IsReadable(exposure_auto_off):
+                exposure_auto_off = get_entry(nodemap, node_exposure_auto, 'Off')
+                if is_readable(nodemap, exposure_auto_off):
                     node_exposure_auto.SetIntValue(exposure_auto_off.GetValue())
+                    invalidate_access_modes(nodemap)
                     print('Turning automatic exposure back off...')
 
     except PySpin.SpinnakerException as ex:
@@ -523,19 +582,21 @@ def set_cam_gain_auto(nodemap, onOrOff: bool):
         #
         # *** NOTES ***
         # Automatic gain is turned on in order to return the camera to its default state.
-        node_gain_auto = PySpin.CEnumerationPtr(nodemap.GetNode('GainAuto'))
-        if PySpin.IsReadable(node_gain_auto) and PySpin.IsWritable(node_gain_auto):
+        node_gain_auto = get_node(nodemap, 'GainAuto', PySpin.CEnumerationPtr)
+        if is_readable(nodemap, node_gain_auto) and is_writable(nodemap, node_gain_auto):
             if onOrOff:
-                gain_auto_continuous = node_gain_auto.GetEntryByName('Continuous')
-                if PySpin.IsReadable(gain_auto_continuous):
+                gain_auto_continuous = get_entry(nodemap, node_gain_auto, 'Continuous')
+                if is_readable(nodemap, gain_auto_continuous):
                     node_gain_auto.SetIntValue(gain_auto_continuous.GetValue())
+                    invalidate_access_modes(nodemap)
                     print('Turning automatic gain mode back on...\n')
                 else:
                     return False
             else:
-                gain_auto_off = node_gain_auto.GetEntryByName('Off')
-                if PySpin.IsReadable(gain_auto_off):
+                gain_auto_off = get_entry(nodemap, node_gain_auto, 'Off')
+                if is_readable(nodemap, gain_auto_off):
                     node_gain_auto.SetIntValue(gain_auto_off.GetValue())
+                    invalidate_access_modes(nodemap)
                     print('Turning automatic gain mode back Off...\n')
                 else:
                     return False
@@ -554,19 +615,21 @@ def set_cam_fps_auto(nodemap, onOrOff: bool):
         #
         # *** NOTES ***
         # Automatic gain is turned on in order to return the camera to its default state.
-        node_fps_auto = PySpin.CEnumerationPtr(nodemap.GetNode('AcquisitionFrameRateEnable'))
-        if PySpin.IsReadable(node_fps_auto) and PySpin.IsWritable(node_fps_auto):
+        node_fps_auto = get_node(nodemap, 'AcquisitionFrameRateEnable', PySpin.CEnumerationPtr)
+        if is_readable(nodemap, node_fps_auto) and is_writable(nodemap, node_fps_auto):
             if onOrOff:
-                fps_auto_on = node_fps_auto.GetEntryByName('On')
-                if PySpin.IsReadable(fps_auto_on):
+                fps_auto_on = get_entry(nodemap, node_fps_auto, 'On')
+                if is_readable(nodemap, fps_auto_on):
                     node_fps_auto.SetIntValue(fps_auto_on.GetValue())
+                    invalidate_access_modes(nodemap)
                     print('Turning automatic FPS mode back on...\n')
                 else:
                     return False
             else:
-                fps_auto_off = node_fps_auto.GetEntryByName('Off')
-                if PySpin.IsReadable(fps_auto_off):
+                fps_auto_off = get_entry(nodemap, node_fps_auto, 'Off')
+                if is_readable(nodemap, fps_auto_off):
                     node_fps_auto.SetIntValue(fps_auto_off.GetValue())
+                    invalidate_access_modes(nodemap)
                     print('Turning automatic FPS mode back Off...\n')
                 else:
                     return False
@@ -576,3 +639,69 @@ def set_cam_fps_auto(nodemap, onOrOff: bool):
         result = False
 
     return result
+
+def configure_chunk_data(nodemap, chunk_names=('FrameID', 'Timestamp', 'ExposureTime', 'Gain', 'SequencerSetActive')) -> bool:
+    """
+    This function activates chunk mode and enables the chunks that are sent along
+    with every image, so that the frame ID, timestamp, exposure, gain and active
+    sequencer set can be read from the image chunk data.
+
+    :param nodemap: Device nodemap.
+    :param chunk_names: ChunkSelector entries to enable.
+    :type nodemap: INodeMap
+    :type chunk_names: tuple
+    :return: True if successful, False otherwise.
+    :rtype: bool
+    """
+    try:
+        result = True
+
+        # Activate chunk mode
+        #
+        # *** NOTES ***
+        # Once enabled, chunk data will be available at the end of the payload
+        # of every image captured until it is disabled.
+        chunk_mode_active = get_node(nodemap, 'ChunkModeActive', PySpin.CBooleanPtr)
+        if not is_writable(nodemap, chunk_mode_active):
+            print_retrieve_node_failure('node', 'ChunkModeActive')
+            return False
+
+        chunk_mode_active.SetValue(True)
+        invalidate_access_modes(nodemap)
+
+        print('Chunk mode activated...')
+
+        # Enable the selected chunks
+        #
+        # *** NOTES ***
+        # Each chunk is selected with the ChunkSelector and then enabled. Not
+        # every camera model supports every chunk, missing ones are skipped.
+        chunk_selector = get_node(nodemap, 'ChunkSelector', PySpin.CEnumerationPtr)
+        if not is_readable(nodemap, chunk_selector) or not is_writable(nodemap, chunk_selector):
+            print_retrieve_node_failure('node', 'ChunkSelector')
+            return False
+
+        for chunk_name in chunk_names:
+            chunk_selector_entry = get_entry(nodemap, chunk_selector, chunk_name)
+            if not is_readable(nodemap, chunk_selector_entry):
+                print('\t{} chunk not available...'.format(chunk_name))
+                continue
+
+            chunk_selector.SetIntValue(chunk_selector_entry.GetValue())
+
+            #the access mode of ChunkEnable depends on the selected chunk, it is read from the node rather than the cache
+            chunk_enable = get_node(nodemap, 'ChunkEnable', PySpin.CBooleanPtr)
+            if chunk_enable.GetValue() is True:
+                print('\t{} chunk enabled...'.format(chunk_name))
+            elif PySpin.IsWritable(chunk_enable):
+                chunk_enable.SetValue(True)
+                print('\t{} chunk enabled...'.format(chunk_name))
+            else:
+                print('\t{} chunk not writable...'.format(chunk_name))
+                result = False
+
+    except PySpin.SpinnakerException as ex:
+        print('Error: {} configure_chunk_data'.format(ex))
+        result = False
+
+    return result
@@ -1,16 +1,40 @@
 import PySpin
 import sys
+import time
 import numpy as np
 import matplotlib.pyplot as plt
 
 
 
-from FLIRCamHelper import reset_sequencer, configure_sequencer_part_one, configure_sequencer_part_two, set_single_state_from_list_of_tuple, set_cam_exposure_auto, set_cam_gain_auto, set_cam_fps_auto
+from FLIRCamHelper import reset_sequencer, set_cam_exposure_auto, set_cam_gain_auto, set_cam_fps_auto, configure_chunk_data, get_node, get_entry, is_readable, is_writable
+from nodeCache import NodeCache
+from sequencerManager import SequencerManager
+from frames import FrameLease
+from acquisitionEngine import AcquisitionEngine, DROP_OLDEST
+from polarCamBase import PolarCamBase
+from polarDemosaic import verify_against_sdk
                         
+#longest exposure assumed while automatic exposure is on, in µs. GetNextImage, AcquisitionEngine.stop()
+#and the join wait that long on a stalled stream, the ExposureTime maximum can be tens of seconds
+MAX_AUTO_EXPOSURE_TIMEOUT_US = 1000000
 
-class PolarCam:
+class PolarCam(PolarCamBase):
+    """PolarCamBase backend for FLIR polarization cameras, through PySpin
+
+    Args:
+        verify_demosaic (bool, optional): check the demosaic against ExtractPolarQuadrant on the first Polarized8 frame grabbed. Defaults to True.
+    """
+
+    def __init__(self, verify_demosaic=True):
+        super().__init__()
+
+        #cleared once the first Polarized8 frame was checked, see grab_image_lease_cam
+        self.verify_demosaic = verify_demosaic
+
+        #NodeCache and SequencerManager per camera, keyed by the camera unique ID. See get_node_cache
+        self.node_caches = {}
+        self.sequencer_managers = {}
 
-    def __init__(self):
         self.system = PySpin.System.GetInstance()
         # Get current library version
         version = self.system.GetLibraryVersion()
@@ -21,31 +45,11 @@ class PolarCam:
 
         print('Number of cameras detected: %d' % num_cameras)
 
-        if num_cameras == 0:
-
-            print('Not enough cameras!')
-
-            # Clear camera list before releasing system
-            self.cam_list.Clear()
-
-            # Release system instance
-            self.system.ReleaseInstance()
-
-            return
-
         self.processor = PySpin.ImageProcessor()
-        
-        self.max_shutter_speed_us = 3000000
-        self.min_shutter_speed_us = 200
-        self.curr_shutter_speed_us = 200
 
-        self.max_gain = 40.0
-        self.min_gain = 0.1
-        self.curr_gain = 10.0
-        
-        self.min_fps = 1.0
-        self.max_fps = 24.0
-        self.curr_fps = 8
+        #the object stays usable without cameras, num_cameras is 0 and the system is freed by release()
+        if num_cameras == 0:
+            print('Not enough cameras!')
 
         #set the default settings. 
         for i, cam in enumerate(self.cam_list):
@@ -57,6 +61,12 @@ class PolarCam:
 
     def release(self):
 
+        super().release()
+
+        #released already, release() is also called from __del__
+        if getattr(self, 'system', None) is None:
+            return
+
         try:
             for i, cam in enumerate(self.cam_list):
                 cam.DeInit()
@@ -67,6 +77,7 @@ class PolarCam:
 
             # Release system instance
             self.system.ReleaseInstance()
+            self.system = None
 
         except PySpin.SpinnakerException as ex:
             print('Error: %s' % ex)
@@ -75,6 +86,10 @@ class PolarCam:
     def configure_default_settings(self, cam):
         
         cam.Init()
+        #nodes resolved and sequencer states programmed before a reconnect are stale
+        self.get_node_cache(cam).invalidate()
+        self.get_sequencer_manager(cam).invalidate()
+
         #configure stream
         self.configure_stream_settings(cam)
         self.configure_exposure_control(cam) #extract minimum and maximum exposure settings
@@ -83,9 +98,51 @@ class PolarCam:
         self.configure_gain_control(cam)
         self.configure_fps_control(cam)
 
+        #send frame ID, timestamp, exposure, gain and sequencer set along with every image
+        configure_chunk_data(self.get_node_cache(cam))
 
-    def get_curr_exposure_value(self) -> float:
-        for i, cam in enumerate(self.cam_list):
+
+    @property
+    def num_cameras(self) -> int:
+        return self.cam_list.GetSize()
+
+    def get_camera(self, cam_index=0):
+        """Returns the camera handle at cam_index, None if there is no such camera
+        """
+        if cam_index < 0 or cam_index >= self.num_cameras:
+            return None
+
+        return self.cam_list.GetByIndex(cam_index)
+
+    def get_node_cache(self, cam) -> NodeCache:
+        """Returns the NodeCache of a camera, created on first use. Pass it to the FLIRCamHelper 
+        functions in place of the nodemap so that nodes are only resolved once.
+        """
+        unique_id = cam.GetUniqueID()
+        node_cache = self.node_caches.get(unique_id)
+        if node_cache is None:
+            node_cache = NodeCache(cam.GetNodeMap())
+            self.node_caches[unique_id] = node_cache
+
+        return node_cache
+
+    def get_frame_shape_cam(self, cam) -> tuple:
+        return (cam.Height.GetValue(), cam.Width.GetValue())
+
+    def get_sequencer_manager(self, cam) -> SequencerManager:
+        """Returns the SequencerManager of a camera, created on first use
+        """
+        unique_id = cam.GetUniqueID()
+        sequencer_manager = self.sequencer_managers.get(unique_id)
+        if sequencer_manager is None:
+            sequencer_manager = SequencerManager(self.get_node_cache(cam))
+            self.sequencer_managers[unique_id] = sequencer_manager
+
+        return sequencer_manager
+
+    def get_curr_exposure_value(self, cam_index=0) -> float:
+        cam = self.get_camera(cam_index)
+        if cam != None:
             if cam.ExposureTime.GetAccessMode() == PySpin.RW or cam.ExposureTime.GetAccessMode() == PySpin.RO:
                 return cam.ExposureTime.GetValue()
 
@@ -95,12 +152,12 @@ class PolarCam:
 
         if on_or_off :
              for i, cam in enumerate(self.cam_list):
-                nodemap = cam.GetNodeMap()
-                set_cam_exposure_auto(nodemap, on_or_off)
+                set_cam_exposure_auto(self.get_node_cache(cam), on_or_off)
 
 
-    def get_curr_gain_value(self):
-        for i, cam in enumerate(self.cam_list):
+    def get_curr_gain_value(self, cam_index=0):
+        cam = self.get_camera(cam_index)
+        if cam != None:
             if cam.Gain.GetAccessMode() == PySpin.RW or cam.Gain.GetAccessMode() == PySpin.RO:
                 return cam.Gain.GetValue()
 
@@ -110,8 +167,7 @@ class PolarCam:
 
         if on_or_off :
              for i, cam in enumerate(self.cam_list):
-                nodemap = cam.GetNodeMap()
-                set_cam_gain_auto(nodemap, on_or_off)
+                set_cam_gain_auto(self.get_node_cache(cam), on_or_off)
 
     def configure_fps_control(self, cam):
         """Get current, min, max fps of camera
@@ -123,13 +179,14 @@ class PolarCam:
             self.max_fps = cam.AcquisitionFrameRate.GetMax()
             print('Updated Min/Max FPS : {0}, {1}, {2}'.format(self.min_fps, self.max_fps, self.curr_fps))
     
-    def get_fps_value(self) -> float:
+    def get_fps_value(self, cam_index=0) -> float:
         """Get FPS value
 
         Returns:
             float: _description_
         """
-        for i, cam in enumerate(self.cam_list):
+        cam = self.get_camera(cam_index)
+        if cam != None:
             if cam.AcquisitionFrameRate.GetAccessMode() == PySpin.RW or cam.AcquisitionFrameRate.GetAccessMode() == PySpin.RO:
                 return cam.AcquisitionFrameRate.GetValue()
 
@@ -137,37 +194,43 @@ class PolarCam:
     
     def set_fps_value_from_step(self, fps_slider_val):
 
+        #applied to every camera, True only if all of them succeed
+        result = len(self.cam_list) > 0
         for i, cam in enumerate(self.cam_list):
-            try:
-                print('*** CONFIGURING FPS ***\n')
+            result &= self.set_fps_value_from_step_cam(cam, fps_slider_val)
 
-                if cam.AcquisitionFrameRate.GetAccessMode() != PySpin.RW:
-                    print('Unable to disable automatic FPS. Aborting...')
-                    return False
-                
-                cam.AcquisitionFrameRate.SetValue(PySpin.GainAuto_Off)
-                print('Automatic FPS disabled...')
+        return result
 
-                if cam.AcquisitionFrameRate.GetAccessMode() != PySpin.RW:
-                    print('Unable to set FPS value. Aborting...')
-                    return False
+    def set_fps_value_from_step_cam(self, cam, fps_slider_val):
+        try:
+            print('*** CONFIGURING FPS ***\n')
 
-                fps_to_set = fps_slider_val * (self.max_fps - self.min_fps)/100
+            if cam.AcquisitionFrameRate.GetAccessMode() != PySpin.RW:
+                print('Unable to disable automatic FPS. Aborting...')
+                return False
+            
+            cam.AcquisitionFrameRate.SetValue(PySpin.GainAuto_Off)
+            print('Automatic FPS disabled...')
 
-                cam.AcquisitionFrameRate.SetValue(fps_to_set)
-                print('FPS set to %s us...\n' % fps_to_set)
+            if cam.AcquisitionFrameRate.GetAccessMode() != PySpin.RW:
+                print('Unable to set FPS value. Aborting...')
+                return False
 
-                return True
-            except PySpin.SpinnakerException as ex:
-                print('Error: %s' % ex)
-                return False      
+            fps_to_set = fps_slider_val * (self.max_fps - self.min_fps)/100
+
+            cam.AcquisitionFrameRate.SetValue(fps_to_set)
+            print('FPS set to %s us...\n' % fps_to_set)
+
+            return True
+        except PySpin.SpinnakerException as ex:
+            print('Error: %s' % ex)
+            return False      
 
 
     def set_fps_auto(self, on_or_off):
         if on_or_off :
              for i, cam in enumerate(self.cam_list):
-                nodemap = cam.GetNodeMap()
-                set_cam_fps_auto(nodemap, on_or_off)
+                set_cam_fps_auto(self.get_node_cache(cam), on_or_off)
 
     def configure_gain_control(self, cam):
         
@@ -182,44 +245,53 @@ class PolarCam:
     
     def set_gain_value_from_step(self, gain_slider_val):
 
+        #applied to every camera, True only if all of them succeed
+        result = len(self.cam_list) > 0
         for i, cam in enumerate(self.cam_list):
-            try:
-                print('*** CONFIGURING GAIN ***\n')
+            result &= self.set_gain_value_from_step_cam(cam, gain_slider_val)
+
+        return result
+
+    def set_gain_value_from_step_cam(self, cam, gain_slider_val):
+        try:
+            print('*** CONFIGURING GAIN ***\n')
 
-                if cam.GainAuto.GetAccessMode() != PySpin.RW:
-                    print('Unable to disable automatic gain. Aborting...')
-                    return False
-                
-                cam.GainAuto.SetValue(PySpin.GainAuto_Off)
-                print('Automatic Gain disabled...')
+            if cam.GainAuto.GetAccessMode() != PySpin.RW:
+                print('Unable to disable automatic gain. Aborting...')
+                return False
+            
+            cam.GainAuto.SetValue(PySpin.GainAuto_Off)
+            print('Automatic Gain disabled...')
 
-                if cam.Gain.GetAccessMode() != PySpin.RW:
-                    print('Unable to set gain value. Aborting...')
-                    return False
+            self.get_node_cache(cam).invalidate_access_modes()
 
-                gain_to_set = gain_slider_val * (self.max_gain - self.min_gain)/100
+            if cam.Gain.GetAccessMode() != PySpin.RW:
+                print('Unable to set gain value. Aborting...')
+                return False
 
-                cam.Gain.SetValue(gain_to_set)
-                print('Gain set to %s us...\n' % gain_to_set)
+            gain_to_set = gain_slider_val * (self.max_gain - self.min_gain)/100
 
-                return True
-            except PySpin.SpinnakerException as ex:
-                print('Error: %s' % ex)
-                return False      
+            cam.Gain.SetValue(gain_to_set)
+            print('Gain set to %s us...\n' % gain_to_set)
+
+            return True
+        except PySpin.SpinnakerException as ex:
+            print('Error: %s' % ex)
+            return False      
 
 
     def configure_exposure_control(self, cam):
 
         # Retrieve GenICam nodemap
-        nodemap = cam.GetNodeMap()
+        nodemap = self.get_node_cache(cam)
 
-        node_exposure_lighting_mode = PySpin.CEnumerationPtr(nodemap.GetNode('AutoExposureLightingMode'))
-        if not PySpin.IsReadable(node_exposure_lighting_mode) or not PySpin.IsWritable(node_exposure_lighting_mode):
+        node_exposure_lighting_mode = get_node(nodemap, 'AutoExposureLightingMode', PySpin.CEnumerationPtr)
+        if not is_readable(nodemap, node_exposure_lighting_mode) or not is_writable(nodemap, node_exposure_lighting_mode):
             print('\nUnable to set Exposure Lighting Mode. Aborting...\n')
             return False
 
-        exposure_mode_front_light = node_exposure_lighting_mode.GetEntryByName('Frontlight')
-        if not PySpin.IsReadable(exposure_mode_front_light):
+        exposure_mode_front_light = get_entry(nodemap, node_exposure_lighting_mode, 'Frontlight')
+        if not is_readable(nodemap, exposure_mode_front_light):
             print('\nUnable to set Exposure Front Light. Aborting...\n')
             return False
 
@@ -238,38 +310,47 @@ class PolarCam:
 
     def set_exposure_time_from_step(self, shutter_slider_val):
         
-        #get first cam
+        #applied to every camera, True only if all of them succeed
+        result = len(self.cam_list) > 0
         for i, cam in enumerate(self.cam_list):
-            try:
-                print('*** CONFIGURING EXPOSURE ***\n')
+            result &= self.set_exposure_time_from_step_cam(cam, shutter_slider_val)
+
+        return result
 
-                if cam.ExposureAuto.GetAccessMode() != PySpin.RW:
-                    print('Unable to disable automatic exposure. Aborting...')
-                    return False
+    def set_exposure_time_from_step_cam(self, cam, shutter_slider_val):
+        try:
+            print('*** CONFIGURING EXPOSURE ***\n')
+
+            if cam.ExposureAuto.GetAccessMode() != PySpin.RW:
+                print('Unable to disable automatic exposure. Aborting...')
+                return False
+
+            cam.ExposureAuto.SetValue(PySpin.ExposureAuto_Off)
+            print('Automatic exposure disabled...')
 
-                cam.ExposureAuto.SetValue(PySpin.ExposureAuto_Off)
-                print('Automatic exposure disabled...')
+            #exposure is unlocked and the grab timeout changes
+            self.get_node_cache(cam).invalidate_access_modes()
 
-                if cam.ExposureTime.GetAccessMode() != PySpin.RW:
-                    print('Unable to set exposure time. Aborting...')
-                    return False
+            if cam.ExposureTime.GetAccessMode() != PySpin.RW:
+                print('Unable to set exposure time. Aborting...')
+                return False
 
-                # Ensure desired exposure time does not exceed the maximum
-                exposure_time_max = min(self.max_shutter_speed_us, 500000)  
+            # Ensure desired exposure time does not exceed the maximum
+            exposure_time_max = min(self.max_shutter_speed_us, 500000)  
 
-                if (exposure_time_max < self.min_shutter_speed_us):
-                    exposure_time_max = self.min_shutter_speed_us
+            if (exposure_time_max < self.min_shutter_speed_us):
+                exposure_time_max = self.min_shutter_speed_us
 
-                exposure_time_to_set = shutter_slider_val * (exposure_time_max - self.min_shutter_speed_us)/100 + self.min_shutter_speed_us
+            exposure_time_to_set = shutter_slider_val * (exposure_time_max - self.min_shutter_speed_us)/100 + self.min_shutter_speed_us
 
-                cam.ExposureTime.SetValue(exposure_time_to_set)
-                print('Shutter time set to %s us...\n' % exposure_time_to_set)
+            cam.ExposureTime.SetValue(exposure_time_to_set)
+            print('Shutter time set to %s us...\n' % exposure_time_to_set)
 
-                return True
+            return True
 
-            except PySpin.SpinnakerException as ex:
-                print('Error: %s' % ex)
-                return False  
+        except PySpin.SpinnakerException as ex:
+            print('Error: %s' % ex)
+            return False  
 
     def set_exposure_time(self, cam, shutter_us):
         """Sets the exposure time, shutter speed in microseconds. 
@@ -292,6 +373,9 @@ class PolarCam:
             cam.ExposureAuto.SetValue(PySpin.ExposureAuto_Off)
             print('Automatic exposure disabled...')
 
+            #exposure is unlocked and the grab timeout changes
+            self.get_node_cache(cam).invalidate_access_modes()
+
             # Set exposure time manually; exposure time recorded in microseconds
             #
             # *** NOTES ***
@@ -359,14 +443,14 @@ class PolarCam:
                 #
                 # *** NOTES ***
                 # The sequencer is turned off in order to return the camera to its default state.
-                nodemap = cam.GetNodeMap()
-                node_sequencer_mode = PySpin.CEnumerationPtr(nodemap.GetNode('SequencerMode'))
-                if not PySpin.IsReadable(node_sequencer_mode) or not PySpin.IsWritable(node_sequencer_mode):
+                nodemap = self.get_node_cache(cam)
+                node_sequencer_mode = get_node(nodemap, 'SequencerMode', PySpin.CEnumerationPtr)
+                if not is_readable(nodemap, node_sequencer_mode) or not is_writable(nodemap, node_sequencer_mode):
                     print('Unable to access SequencerMode state')
                     continue
 
-                sequencer_mode_off = node_sequencer_mode.GetEntryByName('Off')
-                if not PySpin.IsReadable(sequencer_mode_off):
+                sequencer_mode_off = get_entry(nodemap, node_sequencer_mode, 'Off')
+                if not is_readable(nodemap, sequencer_mode_off):
                     print('Unable to get SequencerMode off')
                     continue
 
@@ -382,6 +466,9 @@ class PolarCam:
                 else:
                     print('Pixel format not available...')
 
+                #a pixel format change invalidates the node cache
+                nodemap.invalidate()
+
             except PySpin.SpinnakerException as ex:
                 print('Error: {} reset_sequencer '.format(ex))
         
@@ -390,7 +477,7 @@ class PolarCam:
         
         #set the width and height. 
         # Retrieve GenICam nodemap
-        nodemap = cam.GetNodeMap()
+        nodemap = self.get_node_cache(cam)
 
         print('*** Setting IMAGE Width, Height, Pixel Format ***\n')
         #Set camera to get image in polarized8 format. 
@@ -401,9 +488,12 @@ class PolarCam:
             print('Pixel format not available...')
             result = False
 
+        #a pixel format change invalidates the node cache
+        nodemap.invalidate()
+
          # Set maximum width
-        node_width = PySpin.CIntegerPtr(nodemap.GetNode('Width'))
-        if PySpin.IsReadable(node_width) and PySpin.IsWritable(node_width):
+        node_width = get_node(nodemap, 'Width', PySpin.CIntegerPtr)
+        if is_readable(nodemap, node_width) and is_writable(nodemap, node_width):
 
             width_to_set = node_width.GetMax()
             node_width.SetValue(width_to_set)
@@ -417,8 +507,8 @@ class PolarCam:
         # *** NOTES ***
         # A maximum is retrieved with the method GetMax(). A node's minimum and
         # maximum should always be a multiple of its increment.
-        node_height = PySpin.CIntegerPtr(nodemap.GetNode('Height'))
-        if  PySpin.IsReadable(node_height) and PySpin.IsWritable(node_height):
+        node_height = get_node(nodemap, 'Height', PySpin.CIntegerPtr)
+        if  is_readable(nodemap, node_height) and is_writable(nodemap, node_height):
 
             height_to_set = node_height.GetMax()
             node_height.SetValue(height_to_set)
@@ -430,14 +520,14 @@ class PolarCam:
         print('*** Setting IMAGE ACQUISITION Mode ***\n')
 
         try:
-            node_acquisition_mode = PySpin.CEnumerationPtr(nodemap.GetNode('AcquisitionMode'))
-            if not PySpin.IsReadable(node_acquisition_mode) or not PySpin.IsWritable(node_acquisition_mode):
+            node_acquisition_mode = get_node(nodemap, 'AcquisitionMode', PySpin.CEnumerationPtr)
+            if not is_readable(nodemap, node_acquisition_mode) or not is_writable(nodemap, node_acquisition_mode):
                 print('Unable to set acquisition mode to continuous (enum retrieval). Aborting...')
                 return False
 
             # Retrieve entry node from enumeration node
-            node_acquisition_mode_continuous = node_acquisition_mode.GetEntryByName('Continuous')
-            if not PySpin.IsReadable(node_acquisition_mode_continuous):
+            node_acquisition_mode_continuous = get_entry(nodemap, node_acquisition_mode, 'Continuous')
+            if not is_readable(nodemap, node_acquisition_mode_continuous):
                 print('Unable to set acquisition mode to continuous (entry retrieval). Aborting...')
                 return False
             
@@ -482,17 +572,9 @@ class PolarCam:
         # Set integer value from entry node as new value of enumeration node
         node_bufferhandling_mode.SetIntValue(node_newestonly_mode)
 
-    def start_acquisition(self):
-        for i, cam in enumerate(self.cam_list):
-            self.start_acquisition_cam(cam)
-
     def start_acquisition_cam(self, cam):
         cam.BeginAcquisition()
 
-    def stop_acquisition(self):
-        for i, cam in enumerate(self.cam_list):
-            self.stop_acquisition_cam(cam)
-
     def stop_acquisition_cam(self, cam):
         try:
             # Initialize camera
@@ -501,128 +583,139 @@ class PolarCam:
         except PySpin.SpinnakerException as ex:
             print('Error: %s stop_acquisition_cam' % ex)
 
-    @staticmethod
-    def append_images_to_panel(image_polarized_i0, image_polarized_i45, image_polarized_i90, image_polarized_i135, image_dolp, image_deglared):
-        np_top_pair = np.concatenate((image_polarized_i0, image_polarized_i45), axis=1)
-        np_bottom_pair = np.concatenate((image_polarized_i90, image_polarized_i135), axis=1)
-        
-        np_top_row = np.concatenate((np_top_pair, image_dolp), axis=1)
-        np_bot_row = np.concatenate((np_bottom_pair, image_deglared), axis=1)
-        image_data = np.concatenate((np_top_row, np_bot_row), axis=0)
-
-        return image_data
-        
-    def grab_all_polarized_image(self, image_result):
-        """Extract the polarization images from the raw polarized 8 image. 
+    def get_grab_timeout_ms(self, cam, node_cache=None):
+        """GetNextImage timeout derived from the exposure. Returns None if exposure is not readable
 
-        Args:
-            image_result (_type_): returns 6 images of numpy array i0, i45, i90, i135. dolp, deglared
+        While the sequencer runs, the timeout of its longest exposure set by configure_image_sequence is used.
+        Otherwise the timeout is computed once and kept in the camera's NodeCache until the exposure changes.
+        While automatic exposure is on, the camera may raise the exposure at any time, up to its auto exposure
+        upper limit (AutoExposureExposureTimeUpperLimit, the ExposureTime maximum when not readable), capped
+        to MAX_AUTO_EXPOSURE_TIMEOUT_US.
         """
-        image_polarized_i0 = PySpin.ImageUtilityPolarization.ExtractPolarQuadrant(image_result, PySpin.SPINNAKER_POLARIZATION_QUADRANT_I0).GetNDArray()
-        image_polarized_i45 = PySpin.ImageUtilityPolarization.ExtractPolarQuadrant(image_result, PySpin.SPINNAKER_POLARIZATION_QUADRANT_I45).GetNDArray()
-        image_polarized_i90= PySpin.ImageUtilityPolarization.ExtractPolarQuadrant(image_result, PySpin.SPINNAKER_POLARIZATION_QUADRANT_I90).GetNDArray()
-        image_polarized_i135 = PySpin.ImageUtilityPolarization.ExtractPolarQuadrant(image_result, PySpin.SPINNAKER_POLARIZATION_QUADRANT_I135).GetNDArray()
-
-        imageS0 = PySpin.ImageUtilityPolarization.CreateStokesS0(image_result)
-        imageS0_norm = PySpin.ImageUtility.CreateNormalized(imageS0, PySpin.PixelFormat_Mono8, PySpin.SPINNAKER_SOURCE_DATA_RANGE_ABSOLUTE_DATA_RANGE).GetNDArray()
-        #imageS0_norm_np = imageS0_norm.GetNDArray()
-        #print('width & height', imageS0.GetWidth(), imageS0.GetHeight())
-        #print('min max: ', imageS0.GetDataAbsoluteMin(), imageS0.GetDataAbsoluteMax())
-        #.GetData()
-        
-        #reshape numpy imageS0 
-        #print(imageS0.shape)
-        
-
-        #image_dolp = PySpin.ImageUtilityPolarization.CreateDolp(image_result)
-        #dolpNormalizedImage = PySpin.ImageUtility.CreateNormalized(image_dolp, PySpin.PixelFormat_Mono8, PySpin.SPINNAKER_SOURCE_DATA_RANGE_ABSOLUTE_DATA_RANGE)
-        #image_dolp = dolpNormalizedImage.GetNDArray()
-        image_deglared = PySpin.ImageUtilityPolarization.CreateGlareReduced(image_result).GetNDArray()
-
-        return image_polarized_i0, image_polarized_i45, image_polarized_i90, image_polarized_i135, imageS0_norm, image_deglared
+        if node_cache is None:
+            node_cache = self.get_node_cache(cam)
 
+        if node_cache.sequence_timeout_ms is not None:
+            return node_cache.sequence_timeout_ms
 
-        return image_polarized_i0, image_polarized_i45, image_polarized_i90, image_polarized_i135, image_dolp, image_deglared
+        if node_cache.grab_timeout_ms is not None:
+            return node_cache.grab_timeout_ms
 
-    def grab_image(self):
-        for i, cam in enumerate(self.cam_list):
-            return self.grab_image_cam(cam)
-        
-        return None
-        
-    def grab_image_cam(self, cam):
-        
-        timeout = 0
-        if cam.ExposureTime.GetAccessMode() == PySpin.RW or cam.ExposureTime.GetAccessMode() == PySpin.RO:
-            # The exposure time is retrieved in µs so it needs to be converted to ms to keep consistency with the unit being used in GetNextImage
-            timeout = (int)(cam.ExposureTime.GetValue() / 1000 + 1000)
-        else:
+        node_exposure_time = get_node(node_cache, 'ExposureTime', PySpin.CFloatPtr)
+        if not is_readable(node_cache, node_exposure_time):
             print ('Unable to get exposure time. Aborting...')
             return None
-        
+
+        exposure_time_us = node_exposure_time.GetValue()
+
+        node_exposure_auto = get_node(node_cache, 'ExposureAuto', PySpin.CEnumerationPtr)
+        if is_readable(node_cache, node_exposure_auto) and node_exposure_auto.GetCurrentEntry().GetSymbolic() != 'Off':
+            node_upper_limit = get_node(node_cache, 'AutoExposureExposureTimeUpperLimit', PySpin.CFloatPtr)
+            if is_readable(node_cache, node_upper_limit):
+                auto_exposure_max_us = node_upper_limit.GetValue()
+            else:
+                auto_exposure_max_us = node_exposure_time.GetMax()
+
+            exposure_time_us = max(exposure_time_us, min(auto_exposure_max_us, MAX_AUTO_EXPOSURE_TIMEOUT_US))
+
+        # The exposure time is retrieved in µs so it needs to be converted to ms to keep consistency with the unit being used in GetNextImage
+        node_cache.grab_timeout_ms = (int)(exposure_time_us / 1000 + 1000)
+        return node_cache.grab_timeout_ms
+
+    def grab_image_lease_cam(self, cam, node_cache=None):
+        """Grab the next frame as a FrameLease over the driver buffer. 
+
+        No copy is made, the caller must close the lease (or use it in a with block) to 
+        return the buffer to the stream, or call keep() for a copy.
+
+        Args:
+            cam (CameraPtr): camera to grab from
+            node_cache (NodeCache, optional): the camera's node cache, looked up when None. Defaults to None.
+
+        Returns:
+            FrameLease: the frame, None on failure
+        """
         #timeout is calculated based on current exposure
-        image_result = cam.GetNextImage(timeout)
+        timeout = self.get_grab_timeout_ms(cam, node_cache)
+        if timeout is None:
+            return None
+
+        try:
+            image_result = cam.GetNextImage(timeout)
+            host_timestamp_ns = time.perf_counter_ns()
+        except PySpin.SpinnakerException as ex:
+            print('Error: %s grab_image_lease_cam' % ex)
+            return None
+
         if image_result.IsIncomplete():
             print('Image incomplete with image status %d ...' % image_result.GetImageStatus())
+            image_result.Release()
             return None
-        
-        image_copy = PySpin.Image.Create()
-        image_copy.DeepCopy(image_result)
-        return image_copy
+
+        if self.verify_demosaic and image_result.GetPixelFormat() == PySpin.PixelFormat_Polarized8:
+            self.verify_demosaic = False
+            if verify_against_sdk(image_result):
+                print('Demosaic matches ExtractPolarQuadrant')
+
+        return FrameLease(image_result, host_timestamp_ns)
+
+    def create_acquisition_engine_cam(self, cam, capacity=8, policy=DROP_OLDEST):
+
+        node_cache = self.get_node_cache(cam)
+
+        def frame_source(out):
+            frame = self.grab_image_lease_cam(cam, node_cache)
+            if frame == None:
+                return False
+
+            with frame:
+                np.copyto(out, frame.array)
+                #the pixels live in the ring slot, keep only the metadata
+                return frame.record.metadata()
+
+        shape = (cam.Height.GetValue(), cam.Width.GetValue())
+        return AcquisitionEngine(frame_source, shape, capacity, policy, name='acquisition_{}'.format(cam.TLDevice.DeviceSerialNumber.GetValue()))
 
     def configure_image_sequence(self, settings_list):
-        
+        """Program the sequencer of every camera with settings_list and turn it on. 
+
+        Calling it again with an unchanged table while the sequencer is running returns right away.
+
+        Args:
+            settings_list (list): (width, height, exposure_us, gain_db) per sequencer state
+        """
         result = True
         for i, cam in enumerate(self.cam_list):
             # Retrieve GenICam nodemap
-            nodemap = cam.GetNodeMap()
+            nodemap = self.get_node_cache(cam)
 
             #Set camera to get image in polarized8 format. 
-            if cam.PixelFormat.GetAccessMode() == PySpin.RW:
+            if cam.PixelFormat.GetValue() == PySpin.PixelFormat_Polarized8:
+                pass
+            elif cam.PixelFormat.GetAccessMode() == PySpin.RW:
                 cam.PixelFormat.SetValue(PySpin.PixelFormat_Polarized8)
                 print('Pixel format set to %s...' % cam.PixelFormat.GetCurrentEntry().GetSymbolic())
+                nodemap.invalidate()
             else:
                 print('Pixel format not available...')
             
-            # Configure sequencer to be ready to set sequences
-            result &= configure_sequencer_part_one(nodemap)
+            # Only the states that differ from the table already in the camera are written
+            result &= self.get_sequencer_manager(cam).program(settings_list)
             if not result:
                 return result
 
-            #configure the sequence settings
-            set_single_state_from_list_of_tuple(nodemap, settings_list)
-
-            # Configure sequencer to acquire images
-            result &= configure_sequencer_part_two(nodemap)
-            if not result:
-                return result
+            #frames of the sequence can take as long as its longest exposure
+            nodemap.sequence_timeout_ms = (int)(max((exposure_time for _, _, exposure_time, _ in settings_list), default=0) / 1000 + 1000)
 
         return True
 
-    def grab_sequence(self, num_images):
-        
-        for i, cam in enumerate(self.cam_list):
-            img_array = self.grab_image_sequence(cam, num_images)
-            return img_array
-
-        
-    def grab_image_sequence(self, cam, num_images):
-        
-        img_out = []
-        for i in range(num_images):
-            img_copy = self.grab_image_cam(cam)
-            if img_copy != None:
-                print('Grabbed image sequence: ', i)
-                img_out.append(img_copy.GetNDArray())
-
-        return img_out
-
     def reset_sequencer(self):
         for i, cam in enumerate(self.cam_list):
             # Retrieve GenICam nodemap
-            nodemap = cam.GetNodeMap()
+            nodemap = self.get_node_cache(cam)
 
             reset_sequencer(nodemap)
+            nodemap.sequence_timeout_ms = None
             self.configure_acquisition_control(cam)
 
 
@@ -0,0 +1,410 @@
+import sys
+import time
+import threading
+import numpy as np
+
+#Background acquisition into a fixed size, preallocated ring buffer of frames.
+#
+#A single producer thread pulls frames from a frame source (GetNextImage on a camera,
+#or a synthetic source) and writes them into the ring. Any number of consumers
+#(preview, recorder, OCR) read from it independently through their own RingReader,
+#so a slow consumer never lowers the capture rate of the others.
+
+DROP_OLDEST = 'drop_oldest'
+BLOCK = 'block'
+
+POLICIES = (DROP_OLDEST, BLOCK)
+
+
+class LatencyStats:
+    """Fixed size window of latency samples in nanoseconds
+    """
+
+    def __init__(self, window: int = 1024):
+        self._samples = np.zeros(window, dtype=np.int64)
+        self._count = 0
+
+    def add(self, latency_ns: int):
+        self._samples[self._count % len(self._samples)] = latency_ns
+        self._count += 1
+
+    def summary(self) -> dict:
+        """Returns count, mean, p50, p99 and max of the window in milliseconds
+        """
+        n = min(self._count, len(self._samples))
+        if n == 0:
+            return {'count': 0, 'mean_ms': 0.0, 'p50_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+
+        window_ms = self._samples[:n] / 1e6
+        return {
+            'count': self._count,
+            'mean_ms': float(window_ms.mean()),
+            'p50_ms': float(np.percentile(window_ms, 50)),
+            'p99_ms': float(np.percentile(window_ms, 99)),
+            'max_ms': float(window_ms.max()),
+        }
+
+
+class FrameRingBuffer:
+    """Preallocated ring of capacity frames shared by one producer and many RingReaders.
+
+    Frames are identified by a monotonically increasing sequence number. With the drop_oldest
+    policy the producer always overwrites the oldest slot and readers that fall behind skip
+    ahead, counting the frames they missed. With the block policy the producer waits until
+    every reader has consumed the slot it is about to overwrite.
+    """
+
+    def __init__(self, capacity: int, shape: tuple, dtype=np.uint8, policy: str = DROP_OLDEST):
+        if policy not in POLICIES:
+            raise ValueError('Unknown ring buffer policy {}, expected one of {}'.format(policy, POLICIES))
+        if capacity < 2:
+            raise ValueError('Ring buffer capacity must be at least 2, got {}'.format(capacity))
+
+        self.capacity = capacity
+        self.policy = policy
+        self.frames = np.empty((capacity,) + tuple(shape), dtype=dtype)
+        self.capture_time_ns = np.zeros(capacity, dtype=np.int64)
+        self.metadata = [None] * capacity
+
+        self._cond = threading.Condition()
+        self._readers = []
+        #sequence number of the next frame to be committed
+        self._committed = 0
+        #highest sequence number handed to the producer, the slot it occupies is being overwritten
+        self._claimed = -1
+        self._closed = False
+
+    def _is_valid(self, sequence: int) -> bool:
+        return self._claimed - self.capacity < sequence < self._committed
+
+    def _min_reader_cursor(self):
+        return min(reader._cursor for reader in self._readers) if self._readers else None
+
+    def claim(self, timeout: float = None):
+        """Claim the slot for the next frame. Blocks under the block policy while the ring is full.
+
+        Returns:
+            int: slot index to write into, None on timeout or when the ring is closed
+        """
+        with self._cond:
+            sequence = self._committed
+
+            if self.policy == BLOCK:
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while not self._closed:
+                    min_cursor = self._min_reader_cursor()
+                    if min_cursor is None or sequence < min_cursor + self.capacity:
+                        break
+
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return None
+                    self._cond.wait(remaining)
+
+            if self._closed:
+                return None
+
+            self._claimed = sequence
+            return sequence % self.capacity
+
+    def commit(self, slot: int, capture_time_ns: int, metadata=None):
+        """Publish the frame written into a slot returned by claim
+        """
+        with self._cond:
+            self.capture_time_ns[slot] = capture_time_ns
+            self.metadata[slot] = metadata
+            self._committed += 1
+            self._cond.notify_all()
+
+    def abort(self):
+        """Give back a claimed slot without publishing a frame
+        """
+        with self._cond:
+            #the slot stays claimed, its previous frame may already be partly overwritten
+            self._cond.notify_all()
+
+    def add_reader(self, name: str = '', from_latest: bool = True):
+        """Register an independent consumer.
+
+        Args:
+            name (str, optional): name used in the statistics. Defaults to ''.
+            from_latest (bool, optional): start at the next frame instead of the oldest one in the ring. Defaults to True.
+        """
+        with self._cond:
+            reader = RingReader(self, name)
+            reader._cursor = self._committed if from_latest else max(0, self._committed - self.capacity)
+            self._readers.append(reader)
+            return reader
+
+    def remove_reader(self, reader):
+        with self._cond:
+            if reader in self._readers:
+                self._readers.remove(reader)
+            self._cond.notify_all()
+
+    def close(self):
+        """Wake up every waiting producer and reader, nothing is read or written afterwards
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def frames_committed(self) -> int:
+        return self._committed
+
+
+class RingReader:
+    """Independent read cursor into a FrameRingBuffer. Create it with FrameRingBuffer.add_reader
+    """
+
+    def __init__(self, ring: FrameRingBuffer, name: str = ''):
+        self.ring = ring
+        self.name = name
+        self._cursor = 0
+
+        self.frames_read = 0
+        #frames overwritten before this reader got to them
+        self.frames_dropped = 0
+        #frames deliberately skipped by read(latest=True)
+        self.frames_skipped = 0
+        self.latency = LatencyStats()
+
+    def read(self, out: np.ndarray = None, timeout: float = None, latest: bool = False):
+        """Copy the next frame into out.
+
+        Args:
+            out (np.ndarray, optional): preallocated frame sized array, allocated when None. Defaults to None.
+            timeout (float, optional): seconds to wait for a frame. Defaults to None (forever).
+            latest (bool, optional): skip straight to the newest frame, as a preview wants. Defaults to False.
+
+        Returns:
+            tuple: (sequence, capture_time_ns, metadata, frame) or None on timeout or when the ring is closed
+        """
+        ring = self.ring
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            with ring._cond:
+                while self._cursor >= ring._committed and not ring._closed:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return None
+                    ring._cond.wait(remaining)
+
+                if ring._closed:
+                    return None
+
+                if latest and ring._committed - 1 > self._cursor:
+                    self.frames_skipped += ring._committed - 1 - self._cursor
+                    self._cursor = ring._committed - 1
+
+                oldest_valid = ring._claimed - ring.capacity + 1
+                if self._cursor < oldest_valid:
+                    self.frames_dropped += oldest_valid - self._cursor
+                    self._cursor = oldest_valid
+                    if self._cursor >= ring._committed:
+                        continue
+
+                sequence = self._cursor
+                slot = sequence % ring.capacity
+                capture_time_ns = int(ring.capture_time_ns[slot])
+                metadata = ring.metadata[slot]
+
+            #copy outside the lock so the producer is never held up by a consumer
+            if out is None:
+                out = np.empty(ring.frames.shape[1:], dtype=ring.frames.dtype)
+            np.copyto(out, ring.frames[slot])
+
+            with ring._cond:
+                #the producer may have claimed the slot while we were copying it
+                if not ring._is_valid(sequence):
+                    self.frames_dropped += 1
+                    self._cursor = sequence + 1
+                    continue
+
+                self._cursor = sequence + 1
+                self.frames_read += 1
+                #let a blocked producer move on
+                ring._cond.notify_all()
+
+            self.latency.add(time.perf_counter_ns() - capture_time_ns)
+
+            return sequence, capture_time_ns, metadata, out
+
+    def close(self):
+        self.ring.remove_reader(self)
+
+    def stats(self) -> dict:
+        return {
+            'name': self.name,
+            'frames_read': self.frames_read,
+            'frames_dropped': self.frames_dropped,
+            'frames_skipped': self.frames_skipped,
+            'latency': self.latency.summary(),
+        }
+
+
+class AcquisitionEngine:
+    """Runs a frame source on its own thread into a FrameRingBuffer.
+
+    frame_source is a callable taking the slot array to fill. It returns a falsy value when no
+    frame could be grabbed, True, or a metadata object that is stored alongside the frame and
+    handed to the readers.
+
+        engine = AcquisitionEngine(frame_source, (2048, 2448), capacity=8)
+        preview = engine.add_consumer('preview')
+        engine.start()
+        sequence, capture_time_ns, metadata, frame = preview.read(latest=True)
+        engine.stop()
+    """
+
+    def __init__(self, frame_source, shape: tuple, capacity: int = 8, policy: str = DROP_OLDEST, dtype=np.uint8, name: str = 'acquisition'):
+        self.frame_source = frame_source
+        self.ring = FrameRingBuffer(capacity, shape, dtype, policy)
+        self.name = name
+
+        self.frames_captured = 0
+        self.frames_failed = 0
+        #time the producer spent waiting for consumers under the block policy
+        self.producer_blocked_ns = 0
+        self.grab_latency = LatencyStats()
+
+        self._thread = None
+        self._run_flag = False
+
+    def add_consumer(self, name: str = '', from_latest: bool = True) -> RingReader:
+        return self.ring.add_reader(name, from_latest)
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self.ring._closed = False
+        self._run_flag = True
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the producer thread and wake up every waiting consumer
+        """
+        self._run_flag = False
+        self.ring.close()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        ring = self.ring
+
+        while self._run_flag:
+            wait_start = time.perf_counter_ns()
+            slot = ring.claim(timeout=0.1)
+            self.producer_blocked_ns += time.perf_counter_ns() - wait_start
+
+            if slot is None:
+                continue
+
+            grab_start = time.perf_counter_ns()
+            try:
+                result = self.frame_source(ring.frames[slot])
+            except Exception as ex:
+                print('Error: {} AcquisitionEngine frame source'.format(ex))
+                result = None
+
+            if not result:
+                self.frames_failed += 1
+                ring.abort()
+                continue
+
+            capture_time_ns = time.perf_counter_ns()
+            self.grab_latency.add(capture_time_ns - grab_start)
+
+            ring.commit(slot, capture_time_ns, None if result is True else result)
+            self.frames_captured += 1
+
+    def stats(self) -> dict:
+        """Counters of the producer and of every consumer
+        """
+        return {
+            'name': self.name,
+            'policy': self.ring.policy,
+            'capacity': self.ring.capacity,
+            'frames_captured': self.frames_captured,
+            'frames_failed': self.frames_failed,
+            'producer_blocked_ms': self.producer_blocked_ns / 1e6,
+            'grab_latency': self.grab_latency.summary(),
+            'consumers': [reader.stats() for reader in list(self.ring._readers)],
+        }
+
+
+def synthetic_frame_source(shape: tuple = (2048, 2448), fps: float = None, num_variants: int = 8):
+    """Frame source producing synthetic Polarized8 mosaics, for testing without a camera
+
+    Args:
+        shape (tuple, optional): mosaic (height, width). Defaults to (2048, 2448).
+        fps (float, optional): frame rate to emulate, as fast as possible when None. Defaults to None.
+        num_variants (int, optional): number of distinct precomputed frames to cycle through. Defaults to 8.
+    """
+    from polarDemosaic import make_synthetic_mosaic
+
+    variants = [make_synthetic_mosaic(shape[0], shape[1], seed=seed) for seed in range(num_variants)]
+    period = None if not fps else 1.0 / fps
+    state = {'index': 0, 'next_time': time.perf_counter()}
+
+    def frame_source(out):
+        if period is not None:
+            delay = state['next_time'] - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            state['next_time'] = max(state['next_time'] + period, time.perf_counter())
+
+        np.copyto(out, variants[state['index'] % num_variants])
+        state['index'] += 1
+        return True
+
+    return frame_source
+
+
+def demo(duration_s: float = 3.0, fps: float = 24.0, policy: str = DROP_OLDEST):
+    """Run the engine on a synthetic source with a fast and a slow consumer and print the counters
+    """
+    shape = (2048, 2448)
+    engine = AcquisitionEngine(synthetic_frame_source(shape, fps), shape, capacity=8, policy=policy)
+
+    fast = engine.add_consumer('preview')
+    slow = engine.add_consumer('slow_consumer')
+
+    def consume(reader, work_s):
+        out = np.empty(shape, dtype=np.uint8)
+        while reader.read(out, timeout=0.5) is not None:
+            time.sleep(work_s)
+
+    threads = [threading.Thread(target=consume, args=(fast, 0.0)), threading.Thread(target=consume, args=(slow, 0.25))]
+
+    engine.start()
+    for thread in threads:
+        thread.start()
+
+    time.sleep(duration_s)
+    engine.stop()
+
+    for thread in threads:
+        thread.join()
+
+    stats = engine.stats()
+    print('policy: {policy}, captured: {frames_captured}, failed: {frames_failed}, producer blocked: {producer_blocked_ms:.1f} ms'.format(**stats))
+    for consumer in stats['consumers']:
+        print('  {name:<14s} read: {frames_read:4d} dropped: {frames_dropped:4d} latency p50: {p50:.2f} ms p99: {p99:.2f} ms'.format(
+            p50=consumer['latency']['p50_ms'], p99=consumer['latency']['p99_ms'], **consumer))
+
+
+if __name__ == '__main__':
+    demo(policy=DROP_OLDEST)
+    demo(policy=BLOCK)
+    sys.exit(0)
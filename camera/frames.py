@@ -0,0 +1,182 @@
+import time
+import numpy as np
+
+#Frame types handed out by the PolarCam grab paths.
+
+
+class FrameLease:
+    """A grabbed frame whose pixels still live in the driver's stream buffer.
+
+    array is a numpy view of the buffer, no copy is made. The buffer is handed back to
+    the stream when the lease is closed, after which array must not be used anymore.
+    Call keep() to get a copy that outlives the lease. record holds the frame ID, timestamps
+    and chunk data of the frame.
+
+    Use it as a context manager:
+
+        with polar_cam.grab_image_lease() as frame:
+            process(frame.array)
+    """
+
+    def __init__(self, image_result, host_timestamp_ns=None):
+        self._image_result = image_result
+        self.array = image_result.GetNDArray()
+        self.record = None
+
+        #metadata of the frame, its image is the same view as array
+        self.record = FrameRecord.from_image_result(image_result, self.array, host_timestamp_ns)
+
+    @property
+    def image_result(self):
+        """The underlying PySpin image, for SDK calls that need it. Valid until close()
+        """
+        return self._image_result
+
+    @property
+    def closed(self) -> bool:
+        return self._image_result is None
+
+    def keep(self):
+        """Copy the frame out of the stream buffer and release the lease
+
+        Returns:
+            FrameRecord: the metadata and an owned copy of the frame
+        """
+        if self.closed:
+            raise ValueError('Frame lease already released')
+
+        record = self.record.copy()
+        self.close()
+
+        return record
+
+    def close(self):
+        """Release the stream buffer back to the camera. Safe to call more than once
+        """
+        if self._image_result is None:
+            return
+
+        self.array = None
+        if self.record is not None:
+            self.record.image = None
+        image_result = self._image_result
+        self._image_result = None
+
+        try:
+            image_result.Release()
+        except Exception as ex:
+            print('Error: {} FrameLease.close'.format(ex))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        #a forgotten lease must not starve the stream of buffers
+        self.close()
+
+
+class FrameRecord:
+    """A captured frame and the metadata the camera sent along with it.
+
+    image is the frame as a numpy array, a view into the stream buffer while the frame is
+    leased and an owned copy otherwise. Chunk data that the camera did not send is None.
+    """
+
+    __slots__ = ('image', 'frame_id', 'device_timestamp_ns', 'host_timestamp_ns', 'exposure_us', 'gain_db', 'sequencer_set')
+
+    def __init__(self, image, frame_id=None, device_timestamp_ns=None, host_timestamp_ns=None, exposure_us=None, gain_db=None, sequencer_set=None):
+        self.image = image
+        self.frame_id = frame_id
+        #camera clock
+        self.device_timestamp_ns = device_timestamp_ns
+        #time.perf_counter_ns() when the frame was handed to us by the driver
+        self.host_timestamp_ns = host_timestamp_ns
+        self.exposure_us = exposure_us
+        self.gain_db = gain_db
+        self.sequencer_set = sequencer_set
+
+    @classmethod
+    def from_image_result(cls, image_result, image=None, host_timestamp_ns=None):
+        """Build a record from a PySpin image, reading the chunk data when chunk mode is active
+
+        Args:
+            image_result (PySpin.Image): the grabbed image
+            image (np.ndarray, optional): pixels to store, image_result.GetNDArray() when None. Defaults to None.
+            host_timestamp_ns (int, optional): receive time, now when None. Defaults to None.
+        """
+        if host_timestamp_ns is None:
+            host_timestamp_ns = time.perf_counter_ns()
+
+        record = cls(image_result.GetNDArray() if image is None else image,
+                     frame_id=image_result.GetFrameID(),
+                     device_timestamp_ns=image_result.GetTimeStamp(),
+                     host_timestamp_ns=host_timestamp_ns)
+
+        try:
+            chunk_data = image_result.GetChunkData()
+        except Exception:
+            return record
+
+        #chunk readers raise when the chunk was not enabled on the camera
+        for name, getter in (('frame_id', 'GetFrameID'), ('device_timestamp_ns', 'GetTimestamp'), ('exposure_us', 'GetExposureTime'),
+                             ('gain_db', 'GetGain'), ('sequencer_set', 'GetSequencerSetActive')):
+            try:
+                setattr(record, name, getattr(chunk_data, getter)())
+            except Exception:
+                pass
+
+        return record
+
+    def copy(self):
+        """Returns a record owning a copy of the image
+        """
+        return FrameRecord(None if self.image is None else self.image.copy(), self.frame_id, self.device_timestamp_ns,
+                           self.host_timestamp_ns, self.exposure_us, self.gain_db, self.sequencer_set)
+
+    def metadata(self):
+        """Returns the record without its image, e.g. to store next to a frame held elsewhere
+        """
+        return FrameRecord(None, self.frame_id, self.device_timestamp_ns, self.host_timestamp_ns,
+                           self.exposure_us, self.gain_db, self.sequencer_set)
+
+    def __repr__(self):
+        return 'FrameRecord(frame_id={}, device_timestamp_ns={}, host_timestamp_ns={}, exposure_us={}, gain_db={}, sequencer_set={})'.format(
+            self.frame_id, self.device_timestamp_ns, self.host_timestamp_ns, self.exposure_us, self.gain_db, self.sequencer_set)
+
+
+def as_mosaic_array(image) -> np.ndarray:
+    """Returns the pixels of a numpy array, FrameRecord, FrameLease or PySpin image
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, FrameRecord):
+        return image.image
+    if isinstance(image, FrameLease):
+        return image.array
+
+    return image.GetNDArray()
+
+
+def find_dropped_frames(records: list) -> list:
+    """Detect dropped frames from gaps in consecutive frame IDs
+
+    Args:
+        records (list): FrameRecords in capture order
+
+    Returns:
+        list: (frame_id before the gap, number of missing frames) for every gap
+    """
+    gaps = []
+    previous_id = None
+    for record in records:
+        if record.frame_id is None:
+            continue
+
+        if previous_id is not None and record.frame_id > previous_id + 1:
+            gaps.append((previous_id, record.frame_id - previous_id - 1))
+        previous_id = record.frame_id
+
+    return gaps
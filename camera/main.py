@@ -23,13 +23,14 @@ def main():
     polar_cam.start_acquisition()
 
     #perform sequence capture. 
-    image_result_array = polar_cam.grab_sequence(5)
+    frame_records = polar_cam.grab_sequence(5)
+    image_result_array = [record.image for record in frame_records]
     
     #display and resize images
     #concat image to a column. 
     np_top_pair = image_result_array[0]
 
-    for i in range(1, 5):
+    for i in range(1, len(image_result_array)):
         np_top_pair = np.concatenate((np_top_pair, image_result_array[i]), axis=1)
 
     polar_cam.stop_acquisition()
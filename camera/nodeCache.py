@@ -0,0 +1,81 @@
+import PySpin
+
+#Per camera cache of resolved GenICam nodes.
+#
+#nodemap.GetNode() walks the nodemap by name and every typed pointer (CIntegerPtr,
+#CFloatPtr, ...) wrapped around it is a new object. NodeCache resolves each node,
+#enumeration entry and readable / writable state once and hands out the same pointers afterwards.
+#
+#A NodeCache can be passed to every FLIRCamHelper function in place of the nodemap.
+
+
+class NodeCache:
+
+    def __init__(self, nodemap):
+        self.nodemap = nodemap
+
+        self._nodes = {}
+        self._entries = {}
+        self._access_modes = {}
+
+        #GetNextImage timeout derived from the exposure, see PolarCam.get_grab_timeout_ms
+        self.grab_timeout_ms = None
+        #timeout covering the longest exposure of the running sequencer table, set by PolarCam.configure_image_sequence.
+        #Kept apart from the access modes, it only changes with the table
+        self.sequence_timeout_ms = None
+
+    def GetNode(self, name):
+        """Drop in replacement for INodeMap.GetNode, returning the cached raw node
+        """
+        return self.get(name, None)
+
+    def get(self, name: str, ptr_type=None):
+        """Returns the node called name wrapped in ptr_type, e.g. PySpin.CFloatPtr
+
+        Args:
+            name (str): node name
+            ptr_type (optional): pointer type to wrap the node in, the raw node when None. Defaults to None.
+        """
+        key = (name, ptr_type)
+        if key not in self._nodes:
+            raw_node = self.nodemap.GetNode(name)
+            self._nodes[key] = raw_node if ptr_type is None else ptr_type(raw_node)
+
+        return self._nodes[key]
+
+    def get_entry(self, node, entry_name: str):
+        """Returns the cached enumeration entry entry_name of the enumeration node
+        """
+        key = (id(node), entry_name)
+        if key not in self._entries:
+            #keep the node alive so that its id is not reused
+            self._entries[key] = (node, node.GetEntryByName(entry_name))
+
+        return self._entries[key][1]
+
+    def _access(self, node):
+        key = id(node)
+        if key not in self._access_modes:
+            self._access_modes[key] = (node, PySpin.IsReadable(node), PySpin.IsWritable(node))
+
+        return self._access_modes[key]
+
+    def is_readable(self, node) -> bool:
+        return self._access(node)[1]
+
+    def is_writable(self, node) -> bool:
+        return self._access(node)[2]
+
+    def invalidate_access_modes(self):
+        """Forget the access modes, e.g. after a mode change that locks or unlocks nodes
+        """
+        self._access_modes.clear()
+        self.grab_timeout_ms = None
+
+    def invalidate(self):
+        """Forget everything, after a reconnect or a pixel format change
+        """
+        self._nodes.clear()
+        self._entries.clear()
+        self.invalidate_access_modes()
+        self.sequence_timeout_ms = None
@@ -0,0 +1,388 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from polarDemosaic import split_polarized8
+from polarStokes import StokesBuffers, compute_stokes
+from frames import as_mosaic_array
+from acquisitionEngine import AcquisitionEngine, DROP_OLDEST
+
+#Hardware agnostic part of the polarization camera API.
+#
+#PolarCamBase holds everything that only needs frames: grabbing sequences and synchronized sets,
+#acquisition engines, demosaic and Stokes processing. A backend implements the abstract camera
+#specific methods below, on the camera handles it keeps in cam_list:
+#
+#   FLIRPolarCam.PolarCam       FLIR cameras through PySpin
+#   replayPolarCam.ReplayPolarCam   recorded or synthetic frames, no hardware needed
+
+
+class PolarCamBase(ABC):
+
+    def __init__(self):
+        #created on first use by get_camera_executor
+        self.camera_executor = None
+
+        #camera handles of the backend, in camera index order
+        self.cam_list = []
+
+        self.max_shutter_speed_us = 3000000
+        self.min_shutter_speed_us = 200
+        self.curr_shutter_speed_us = 200
+
+        self.max_gain = 40.0
+        self.min_gain = 0.1
+        self.curr_gain = 10.0
+        
+        self.min_fps = 1.0
+        self.max_fps = 24.0
+        self.curr_fps = 8
+
+        #stokes kernel backend and its reusable output buffers. See polarStokes.BACKENDS
+        self.stokes_backend = 'numpy'
+        self.stokes_buffers = None
+
+    def release(self):
+        if getattr(self, 'camera_executor', None) is not None:
+            self.camera_executor.shutdown(wait=True)
+            self.camera_executor = None
+
+    @property
+    def num_cameras(self) -> int:
+        return len(self.cam_list)
+
+    def get_camera(self, cam_index=0):
+        """Returns the camera handle at cam_index, None if there is no such camera
+        """
+        if cam_index < 0 or cam_index >= self.num_cameras:
+            return None
+
+        return self.cam_list[cam_index]
+
+    #camera specific methods, implemented by every backend. A backend missing one of them cannot be instantiated
+
+    @abstractmethod
+    def start_acquisition_cam(self, cam):
+        """Start streaming frames from cam, grab_image_lease_cam returns them afterwards
+        """
+
+    @abstractmethod
+    def stop_acquisition_cam(self, cam):
+        """Stop streaming frames from cam
+        """
+
+    @abstractmethod
+    def grab_image_lease_cam(self, cam):
+        """Grab the next frame of cam as a FrameLease, None on failure
+        """
+
+    @abstractmethod
+    def get_frame_shape_cam(self, cam) -> tuple:
+        """(height, width) of the raw mosaic of cam
+        """
+
+    @abstractmethod
+    def configure_image_sequence(self, settings_list):
+        """Cycle every camera through settings_list, (width, height, exposure_us, gain_db) per sequencer state
+
+        Returns:
+            bool: False if a camera could not be configured
+        """
+
+    @abstractmethod
+    def reset_sequencer(self):
+        """Turn the sequencer of every camera off, back to a single exposure and gain
+        """
+
+    @abstractmethod
+    def configure_camera_to_polarized8_format(self):
+        """Set every camera to the raw Polarized8 mosaic format, the sequencer off
+        """
+
+    @abstractmethod
+    def get_curr_exposure_value(self, cam_index=0) -> float:
+        """Current exposure time of the camera at cam_index in µs
+        """
+
+    @abstractmethod
+    def set_exposure_auto(self, on_or_off):
+        """Turn automatic exposure of every camera on (True) or off (False)
+        """
+
+    @abstractmethod
+    def set_exposure_time_from_step(self, shutter_slider_val):
+        """Set the exposure of every camera from a 0-100 slider position, between min_shutter_speed_us and the camera maximum
+
+        Returns:
+            bool: False if the exposure could not be set
+        """
+
+    @abstractmethod
+    def get_curr_gain_value(self, cam_index=0):
+        """Current gain of the camera at cam_index in dB
+        """
+
+    @abstractmethod
+    def set_gain_auto(self, on_or_off):
+        """Turn automatic gain of every camera on (True) or off (False)
+        """
+
+    @abstractmethod
+    def set_gain_value_from_step(self, gain_slider_val):
+        """Set the gain of every camera from a 0-100 slider position, between min_gain and max_gain
+
+        Returns:
+            bool: False if the gain could not be set
+        """
+
+    @abstractmethod
+    def get_fps_value(self, cam_index=0) -> float:
+        """Current acquisition frame rate of the camera at cam_index
+        """
+
+    @abstractmethod
+    def set_fps_auto(self, on_or_off):
+        """Turn the automatic frame rate of every camera on (True) or off (False)
+        """
+
+    @abstractmethod
+    def set_fps_value_from_step(self, fps_slider_val):
+        """Set the frame rate of every camera from a 0-100 slider position, between min_fps and max_fps
+
+        Returns:
+            bool: False if the frame rate could not be set
+        """
+
+    #shared implementation
+
+    def get_camera_executor(self):
+        """Thread pool with one worker per camera, used to grab from all cameras in parallel
+        """
+        if self.camera_executor is None:
+            self.camera_executor = ThreadPoolExecutor(max_workers=max(1, self.num_cameras), thread_name_prefix='polarcam')
+
+        return self.camera_executor
+
+    def start_acquisition(self):
+        for i, cam in enumerate(self.cam_list):
+            self.start_acquisition_cam(cam)
+
+    def stop_acquisition(self):
+        for i, cam in enumerate(self.cam_list):
+            self.stop_acquisition_cam(cam)
+
+    @staticmethod
+    def append_images_to_panel(image_polarized_i0, image_polarized_i45, image_polarized_i90, image_polarized_i135, image_dolp, image_deglared, out=None):
+        """Tile the six images into a 2x3 panel. 
+
+        Args:
+            out (np.ndarray, optional): preallocated 2H x 3W panel to write into. Defaults to None.
+        """
+        if out is None:
+            np_top_pair = np.concatenate((image_polarized_i0, image_polarized_i45), axis=1)
+            np_bottom_pair = np.concatenate((image_polarized_i90, image_polarized_i135), axis=1)
+            
+            np_top_row = np.concatenate((np_top_pair, image_dolp), axis=1)
+            np_bot_row = np.concatenate((np_bottom_pair, image_deglared), axis=1)
+            image_data = np.concatenate((np_top_row, np_bot_row), axis=0)
+
+            return image_data
+
+        h, w = image_polarized_i0.shape[:2]
+        for index, image in enumerate((image_polarized_i0, image_polarized_i45, image_dolp, image_polarized_i90, image_polarized_i135, image_deglared)):
+            row, col = divmod(index, 3)
+            out[row*h:(row+1)*h, col*w:(col+1)*w] = image
+
+        return out
+
+    def grab_all_polarized_image(self, image_result, stokes_buffers=None):
+        """Extract the polarization images from the raw polarized 8 image. 
+
+        The S0 and deglared images are written into buffers owned by this PolarCam and reused on the
+        next call, copy them if they need to outlive the next frame. DoLP and AoLP of the last frame 
+        are available in self.stokes_buffers. When processing frames of several cameras concurrently,
+        pass a StokesBuffers per camera instead.
+
+        Args:
+            image_result (_type_): FrameRecord, FrameLease, PySpin Polarized8 image or raw mosaic numpy array. 
+                returns 6 images of numpy array i0, i45, i90, i135. dolp, deglared
+        """
+        #accept a PySpin image, FrameRecord, FrameLease or numpy array
+        raw_image = as_mosaic_array(image_result)
+
+        #quadrants are strided views into the raw mosaic, no per quadrant SDK images are created
+        image_polarized_i0, image_polarized_i45, image_polarized_i90, image_polarized_i135 = split_polarized8(raw_image)
+
+        if stokes_buffers is None:
+            if self.stokes_buffers is None or not self.stokes_buffers.matches(image_polarized_i0.shape):
+                self.stokes_buffers = StokesBuffers(*image_polarized_i0.shape)
+            stokes_buffers = self.stokes_buffers
+
+        #S0, DoLP, AoLP and deglared in a single pass
+        compute_stokes(image_polarized_i0, image_polarized_i45, image_polarized_i90, image_polarized_i135, stokes_buffers, self.stokes_backend)
+
+        return image_polarized_i0, image_polarized_i45, image_polarized_i90, image_polarized_i135, stokes_buffers.s0_mono8, stokes_buffers.deglared_mono8
+
+    def grab_image(self, cam_index=0):
+        cam = self.get_camera(cam_index)
+        if cam != None:
+            return self.grab_image_cam(cam)
+        
+        return None
+
+    def grab_image_lease(self, cam_index=0):
+        """Grab a frame from one camera without copying it. See grab_image_lease_cam
+        """
+        cam = self.get_camera(cam_index)
+        if cam != None:
+            return self.grab_image_lease_cam(cam)
+
+        return None
+
+    def grab_image_leases_all(self):
+        """Grab the next frame of every camera in parallel
+
+        Returns:
+            list: one FrameLease (or None on failure) per camera, in camera index order
+        """
+        executor = self.get_camera_executor()
+        futures = [executor.submit(self.grab_image_lease_cam, cam) for cam in self.cam_list]
+
+        return [future.result() for future in futures]
+
+    def grab_synchronized(self, max_skew_ns=1000000, max_attempts=10):
+        """Grab one frame per camera such that all frames were exposed at the same time.
+
+        Frames are matched by their hardware timestamp. Cameras whose frame is older than the newest
+        one by more than max_skew_ns are grabbed again, in parallel, until all frames line up. This 
+        requires the camera clocks to share a time base, e.g. PTP (IEEE 1588) or a common hardware trigger.
+
+        Args:
+            max_skew_ns (int, optional): largest allowed timestamp difference. Defaults to 1 ms.
+            max_attempts (int, optional): number of regrab rounds before giving up. Defaults to 10.
+
+        Returns:
+            list: one FrameLease per camera in camera index order, None if no matching set was found.
+                The caller must close every lease.
+        """
+        leases = self.grab_image_leases_all()
+        executor = self.get_camera_executor()
+
+        #one more pass than regrab rounds, the set of the last round is checked too
+        for attempt in range(max_attempts + 1):
+            if any(lease == None for lease in leases):
+                break
+
+            timestamps = [lease.record.device_timestamp_ns for lease in leases]
+            newest = max(timestamps)
+
+            lagging = [index for index, timestamp in enumerate(timestamps) if newest - timestamp > max_skew_ns]
+            if len(lagging) == 0:
+                return leases
+            if attempt == max_attempts:
+                break
+
+            #release the stale frames first so the stream can reuse their buffers
+            for index in lagging:
+                leases[index].close()
+
+            futures = {index: executor.submit(self.grab_image_lease_cam, self.get_camera(index)) for index in lagging}
+            for index, future in futures.items():
+                leases[index] = future.result()
+
+        print('Unable to grab a synchronized frame set')
+        for lease in leases:
+            if lease != None:
+                lease.close()
+
+        return None
+
+    def create_acquisition_engines(self, capacity=8, policy=DROP_OLDEST):
+        """Create one AcquisitionEngine per camera, each grabbing on its own thread
+
+        Returns:
+            list: engines in camera index order
+        """
+        return [self.create_acquisition_engine_cam(cam, capacity, policy) for cam in self.cam_list]
+
+    def create_acquisition_engine(self, capacity=8, policy=DROP_OLDEST, cam_index=0):
+        """Create an AcquisitionEngine that runs GetNextImage on one camera on its own thread.
+
+        Acquisition must be started with start_acquisition before the engine is started. Consumers 
+        register with engine.add_consumer and read frames independently of each other.
+
+        Args:
+            capacity (int, optional): number of frames in the ring buffer. Defaults to 8.
+            policy (str, optional): DROP_OLDEST or BLOCK. Defaults to DROP_OLDEST.
+            cam_index (int, optional): camera to grab from. Defaults to 0.
+
+        Returns:
+            AcquisitionEngine: the engine, None if no camera is available
+        """
+        cam = self.get_camera(cam_index)
+        if cam != None:
+            return self.create_acquisition_engine_cam(cam, capacity, policy)
+
+        return None
+
+    def create_acquisition_engine_cam(self, cam, capacity=8, policy=DROP_OLDEST):
+
+        def frame_source(out):
+            frame = self.grab_image_lease_cam(cam)
+            if frame == None:
+                return False
+
+            with frame:
+                np.copyto(out, frame.array)
+                #the pixels live in the ring slot, keep only the metadata
+                return frame.record.metadata()
+
+        return AcquisitionEngine(frame_source, self.get_frame_shape_cam(cam), capacity, policy)
+
+    def grab_image_cam(self, cam):
+        """Grab the next frame as a FrameRecord owning a copy of the image
+
+        Returns:
+            FrameRecord: the frame and its metadata, None on failure
+        """
+        frame = self.grab_image_lease_cam(cam)
+        if frame == None:
+            return None
+
+        #single copy out of the stream buffer, which is released right away
+        return frame.keep()
+
+    def grab_sequence(self, num_images, cam_index=0):
+        
+        cam = self.get_camera(cam_index)
+        if cam != None:
+            img_array = self.grab_image_sequence(cam, num_images)
+            return img_array
+
+        return []
+
+    def grab_sequence_all(self, num_images):
+        """Grab an image sequence from every camera in parallel
+
+        Returns:
+            list: one list of images per camera, in camera index order
+        """
+        executor = self.get_camera_executor()
+        futures = [executor.submit(self.grab_image_sequence, cam, num_images) for cam in self.cam_list]
+
+        return [future.result() for future in futures]
+
+    def grab_image_sequence(self, cam, num_images):
+        """Grab num_images frames, e.g. one sequencer bracket
+
+        Returns:
+            list: FrameRecords owning their images. Incomplete frames are skipped.
+        """
+        img_out = []
+        for i in range(num_images):
+            record = self.grab_image_cam(cam)
+            if record != None:
+                print('Grabbed image sequence: ', i, record.frame_id, record.sequencer_set)
+                img_out.append(record)
+
+        return img_out
@@ -0,0 +1,341 @@
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+
+from frames import FrameRecord
+from polarDemosaic import split_polarized8, make_synthetic_mosaic
+from polarStokes import compute_stokes
+
+#Raw Polarized8 recording in a single preallocated, memory-mapped container file.
+#
+#   [header, 4 KiB] [index, capacity entries] [frames, capacity x H x W uint8, page aligned]
+#
+#Frames are appended into their slot of the mapped file, so recording costs one copy from
+#the driver buffer (or ring slot) and no encoding. The index holds the frame ID, timestamps,
+#exposure, gain and sequencer set of every frame, -1 / NaN where the camera did not send them.
+#frame_count in the header is only advanced once a frame and its index entry are written, a
+#recording cut short by a crash still reads back up to the last complete frame.
+#
+#PolarRecordingReader maps the file read only and hands frames out as numpy views, e.g. to
+#reprocess a recording into quadrants, DoLP or deglared output offline.
+
+MAGIC = b'POLREC01'
+VERSION = 1
+
+HEADER_SIZE = 4096
+PAGE_SIZE = 4096
+
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('version', '<u4'), ('height', '<u4'), ('width', '<u4'), ('_pad', '<u4'),
+                         ('capacity', '<u8'), ('frame_count', '<u8'), ('index_offset', '<u8'), ('data_offset', '<u8')])
+
+INDEX_DTYPE = np.dtype([('frame_id', '<i8'), ('device_timestamp_ns', '<i8'), ('host_timestamp_ns', '<i8'),
+                        ('exposure_us', '<f8'), ('gain_db', '<f8'), ('sequencer_set', '<i4'), ('_pad', '<u4')])
+
+
+def _layout(height, width, capacity):
+    index_offset = HEADER_SIZE
+    data_offset = index_offset + capacity * INDEX_DTYPE.itemsize
+    data_offset = (data_offset + PAGE_SIZE - 1) // PAGE_SIZE * PAGE_SIZE
+
+    return index_offset, data_offset, data_offset + capacity * height * width
+
+
+def _map_regions(mm):
+    header = mm[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)
+    if header['magic'][0] != MAGIC:
+        raise ValueError('Not a Polarized8 recording')
+    if header['version'][0] != VERSION:
+        raise ValueError('Unsupported recording version {}'.format(header['version'][0]))
+
+    height, width = int(header['height'][0]), int(header['width'][0])
+    capacity = int(header['capacity'][0])
+    index_offset, data_offset = int(header['index_offset'][0]), int(header['data_offset'][0])
+
+    index = mm[index_offset:index_offset + capacity * INDEX_DTYPE.itemsize].view(INDEX_DTYPE)
+    #close() truncates the slots left unused
+    num_slots = min(capacity, max(0, mm.shape[0] - data_offset) // (height * width))
+    frames = mm[data_offset:data_offset + num_slots * height * width].reshape(num_slots, height, width)
+
+    return header, index, frames
+
+
+def _optional(value, missing):
+    return missing if value is None else value
+
+
+class PolarRecordingWriter:
+    """Appends raw Polarized8 frames and their metadata to a new container file
+
+    Args:
+        path (str): file to create, overwritten when it exists
+        height (int): mosaic height
+        width (int): mosaic width
+        capacity (int): number of frames the file is preallocated for
+    """
+
+    def __init__(self, path: str, height: int, width: int, capacity: int):
+        self.path = path
+        index_offset, data_offset, file_size = _layout(height, width, capacity)
+
+        #reserve the whole file up front, appending then never waits on the file system to grow it
+        with open(path, 'wb') as file:
+            file.truncate(file_size)
+            if hasattr(os, 'posix_fallocate'):
+                try:
+                    os.posix_fallocate(file.fileno(), 0, file_size)
+                except OSError as ex:
+                    print('Warning: {} preallocating {}, the file stays sparse'.format(ex, path))
+
+        self._mm = np.memmap(path, dtype=np.uint8, mode='r+', shape=(file_size,))
+
+        header = self._mm[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)
+        header['magic'] = MAGIC
+        header['version'] = VERSION
+        header['height'] = height
+        header['width'] = width
+        header['capacity'] = capacity
+        header['frame_count'] = 0
+        header['index_offset'] = index_offset
+        header['data_offset'] = data_offset
+
+        self._header, self.index, self.frames = _map_regions(self._mm)
+        self.capacity = capacity
+        self.frame_count = 0
+        self.num_dropped = 0
+
+    @property
+    def full(self) -> bool:
+        return self.frame_count >= self.capacity
+
+    def claim(self):
+        """The next free frame slot, to copy a frame straight into the file
+
+        Returns:
+            tuple: (slot index, HxW view of the slot) or None when the file is full
+        """
+        if self.full:
+            return None
+
+        return self.frame_count, self.frames[self.frame_count]
+
+    def commit(self, slot: int, record: FrameRecord = None):
+        """Write the index entry of the claimed slot and make the frame visible to readers
+        """
+        if slot != self.frame_count:
+            raise ValueError('Slot {} is not the claimed slot {}'.format(slot, self.frame_count))
+
+        entry = self.index[slot]
+        if record is None:
+            record = FrameRecord(None, host_timestamp_ns=time.perf_counter_ns())
+        entry['frame_id'] = _optional(record.frame_id, -1)
+        entry['device_timestamp_ns'] = _optional(record.device_timestamp_ns, -1)
+        entry['host_timestamp_ns'] = _optional(record.host_timestamp_ns, -1)
+        entry['exposure_us'] = _optional(record.exposure_us, np.nan)
+        entry['gain_db'] = _optional(record.gain_db, np.nan)
+        entry['sequencer_set'] = _optional(record.sequencer_set, -1)
+
+        self.frame_count += 1
+        self._header['frame_count'] = self.frame_count
+
+    def append(self, image, record: FrameRecord = None):
+        """Copy a frame and its metadata into the file
+
+        Args:
+            image (np.ndarray): HxW uint8 Polarized8 mosaic, or a FrameRecord holding one
+            record (FrameRecord, optional): metadata of the frame, taken from image when it is a FrameRecord. Defaults to None.
+
+        Returns:
+            int: index of the frame, None when the file is full
+        """
+        if isinstance(image, FrameRecord):
+            record = image if record is None else record
+            image = image.image
+
+        claimed = self.claim()
+        if claimed is None:
+            self.num_dropped += 1
+            return None
+
+        slot, view = claimed
+        np.copyto(view, image)
+        self.commit(slot, record)
+
+        return slot
+
+    def record_from_reader(self, reader, num_frames: int = None, timeout: float = 1.0) -> int:
+        """Record frames of an AcquisitionEngine RingReader, copying each ring slot straight into the file
+
+        Stops after num_frames, when the file is full or when no frame arrives within timeout.
+
+        Returns:
+            int: number of frames recorded
+        """
+        recorded = 0
+        while (num_frames is None or recorded < num_frames):
+            claimed = self.claim()
+            if claimed is None:
+                break
+
+            slot, view = claimed
+            result = reader.read(out=view, timeout=timeout)
+            if result is None:
+                break
+
+            _, capture_time_ns, metadata, _ = result
+            record = metadata if isinstance(metadata, FrameRecord) else FrameRecord(None)
+            if record.host_timestamp_ns is None:
+                record.host_timestamp_ns = capture_time_ns
+            self.commit(slot, record)
+            recorded += 1
+
+        return recorded
+
+    def flush(self):
+        """Write the mapped pages to disk
+        """
+        self._mm.flush()
+
+    def close(self, truncate: bool = True):
+        """Flush and unmap the file
+
+        Args:
+            truncate (bool, optional): give back the space of the slots left unused. Defaults to True.
+        """
+        if self._mm is None:
+            return
+
+        self.flush()
+        data_offset = int(self._header['data_offset'][0])
+        frame_bytes = self.frames.shape[1] * self.frames.shape[2]
+        self._header = self.index = self.frames = None
+        self._mm = None
+
+        if truncate:
+            with open(self.path, 'r+b') as file:
+                file.truncate(data_offset + self.frame_count * frame_bytes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PolarRecordingReader:
+    """Random access to the frames of a recording, as read only views into the mapped file
+
+    The views are valid while the reader is open. index is the structured INDEX_DTYPE array
+    of the recorded frames.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mm = np.memmap(path, dtype=np.uint8, mode='r')
+
+        header, index, frames = _map_regions(self._mm)
+        self.frame_count = int(header['frame_count'][0])
+
+        self.frames = frames[:self.frame_count]
+        self.index = index[:self.frame_count]
+
+    @property
+    def shape(self) -> tuple:
+        return self.frames.shape[1:]
+
+    def __len__(self) -> int:
+        return self.frame_count
+
+    def __getitem__(self, i) -> FrameRecord:
+        """FrameRecord of frame i, its image a view into the file
+        """
+        entry = self.index[i]
+
+        def value(name, missing):
+            item = entry[name].item()
+            return None if item == missing or (missing is np.nan and np.isnan(item)) else item
+
+        return FrameRecord(self.frames[i], frame_id=value('frame_id', -1), device_timestamp_ns=value('device_timestamp_ns', -1),
+                           host_timestamp_ns=value('host_timestamp_ns', -1), exposure_us=value('exposure_us', np.nan),
+                           gain_db=value('gain_db', np.nan), sequencer_set=value('sequencer_set', -1))
+
+    def __iter__(self):
+        for i in range(self.frame_count):
+            yield self[i]
+
+    def quadrants(self, i):
+        """(i0, i45, i90, i135) strided views of frame i
+        """
+        return split_polarized8(self.frames[i])
+
+    def stokes(self, i, buffers=None, backend='numpy'):
+        """Stokes, DoLP and deglared images of frame i, see polarStokes.compute_stokes
+        """
+        return compute_stokes(*self.quadrants(i), buffers=buffers, backend=backend)
+
+    def close(self):
+        self.frames = self.index = None
+        self._mm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def benchmark(num_frames: int = 64, height: int = 2048, width: int = 2448, path: str = None):
+    """Time recording and reading back synthetic mosaics and print the results
+    """
+    mosaics = [make_synthetic_mosaic(height, width, seed) for seed in range(4)]
+    if path is None:
+        path = os.path.join(tempfile.gettempdir(), 'polar_recording_benchmark.polrec')
+
+    print('Polarized8 recording benchmark, {} frames of {}x{}, {}'.format(num_frames, width, height, path))
+    try:
+        start = time.perf_counter()
+        with PolarRecordingWriter(path, height, width, num_frames) as writer:
+            prealloc_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for i in range(num_frames):
+                writer.append(mosaics[i % len(mosaics)], FrameRecord(None, frame_id=i, host_timestamp_ns=time.perf_counter_ns()))
+            append_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            writer.flush()
+            flush_s = time.perf_counter() - start
+
+        frame_mb = height * width / 1e6
+        print('{:<28s} {:8.1f} ms'.format('preallocate', prealloc_s * 1000.0))
+        print('{:<28s} {:8.3f} ms/frame  {:8.1f} frames/s  {:8.1f} MB/s'.format('append (page cache)', append_s * 1000.0 / num_frames,
+                                                                                num_frames / append_s, num_frames * frame_mb / append_s))
+        print('{:<28s} {:8.3f} ms/frame  {:8.1f} frames/s  {:8.1f} MB/s'.format('append + flush to disk', (append_s + flush_s) * 1000.0 / num_frames,
+                                                                                num_frames / (append_s + flush_s), num_frames * frame_mb / (append_s + flush_s)))
+
+        with PolarRecordingReader(path) as reader:
+            order = np.random.default_rng(0).permutation(len(reader))
+            start = time.perf_counter()
+            for i in order:
+                reader[int(i)]
+            view_ms = (time.perf_counter() - start) * 1000.0 / len(reader)
+
+            start = time.perf_counter()
+            for i in order:
+                reader.stokes(int(i))
+            stokes_ms = (time.perf_counter() - start) * 1000.0 / len(reader)
+
+            assert np.array_equal(reader.frames[1], mosaics[1 % len(mosaics)])
+            assert reader[num_frames - 1].frame_id == num_frames - 1
+
+        print('{:<28s} {:8.3f} ms/frame'.format('random access view', view_ms))
+        print('{:<28s} {:8.3f} ms/frame'.format('random access + Stokes', stokes_ms))
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    benchmark()
+    sys.exit(0)
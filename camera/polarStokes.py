@@ -0,0 +1,229 @@
+import sys
+import time
+import numpy as np
+
+#Fused Stokes / DoLP / AoLP kernel computed from the four polarization quadrants.
+#
+#   S0   = (I0 + I45 + I90 + I135) / 2
+#   S1   = I0 - I90
+#   S2   = I45 - I135
+#   DoLP = sqrt(S1^2 + S2^2) / S0
+#   AoLP = atan2(S2, S1) / 2
+#
+#The deglared image is the minimum intensity transmitted through an ideal linear
+#polarizer over all analyzer angles, (S0 - sqrt(S1^2 + S2^2)) / 2, i.e. the light
+#left once the polarized (specular glare) component is filtered out.
+#
+#All results are written into caller owned StokesBuffers so that a preview loop can
+#reuse the same memory every frame.
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKENDS = ('numpy', 'numexpr', 'numba')
+
+#S0 spans 0..510 for 8 bit quadrants, CreateNormalized with the absolute data range maps it to 0..255
+S0_TO_MONO8 = 255.0 / 510.0
+
+
+class StokesBuffers:
+    """Reusable output and scratch buffers for compute_stokes, sized for one quadrant image
+    """
+
+    def __init__(self, height: int, width: int):
+        self.shape = (height, width)
+
+        self.s0 = np.empty(self.shape, dtype=np.float32)
+        self.s1 = np.empty(self.shape, dtype=np.float32)
+        self.s2 = np.empty(self.shape, dtype=np.float32)
+        self.dolp = np.empty(self.shape, dtype=np.float32)
+        self.aolp = np.empty(self.shape, dtype=np.float32)
+
+        #8 bit images ready for display
+        self.s0_mono8 = np.empty(self.shape, dtype=np.uint8)
+        self.dolp_mono8 = np.empty(self.shape, dtype=np.uint8)
+        self.deglared_mono8 = np.empty(self.shape, dtype=np.uint8)
+
+        #scratch used by the numpy backend
+        self._linear = np.empty(self.shape, dtype=np.float32)
+        self._scratch = np.empty(self.shape, dtype=np.float32)
+
+    def matches(self, shape) -> bool:
+        return tuple(shape) == self.shape
+
+
+def available_backends() -> list:
+    """Returns the backends that can be used on this machine
+    """
+    backends = ['numpy']
+    if numexpr is not None:
+        backends.append('numexpr')
+    if numba is not None:
+        backends.append('numba')
+
+    return backends
+
+
+def _stokes_numpy(i0, i45, i90, i135, buffers: StokesBuffers):
+    s0, s1, s2 = buffers.s0, buffers.s1, buffers.s2
+    linear, scratch = buffers._linear, buffers._scratch
+
+    np.add(i0, i45, out=s0, dtype=np.float32)
+    np.add(s0, i90, out=s0, dtype=np.float32)
+    np.add(s0, i135, out=s0, dtype=np.float32)
+    np.multiply(s0, 0.5, out=s0)
+
+    np.subtract(i0, i90, out=s1, dtype=np.float32)
+    np.subtract(i45, i135, out=s2, dtype=np.float32)
+
+    np.hypot(s1, s2, out=linear)
+
+    np.maximum(s0, 1e-6, out=scratch)
+    np.divide(linear, scratch, out=buffers.dolp)
+    np.minimum(buffers.dolp, 1.0, out=buffers.dolp)
+
+    np.arctan2(s2, s1, out=buffers.aolp)
+    np.multiply(buffers.aolp, 0.5, out=buffers.aolp)
+
+    np.multiply(s0, S0_TO_MONO8, out=scratch)
+    np.copyto(buffers.s0_mono8, scratch, casting='unsafe')
+
+    np.multiply(buffers.dolp, 255.0, out=scratch)
+    np.copyto(buffers.dolp_mono8, scratch, casting='unsafe')
+
+    np.subtract(s0, linear, out=scratch)
+    np.multiply(scratch, 0.5, out=scratch)
+    np.clip(scratch, 0.0, 255.0, out=scratch)
+    np.copyto(buffers.deglared_mono8, scratch, casting='unsafe')
+
+
+def _stokes_numexpr(i0, i45, i90, i135, buffers: StokesBuffers):
+    evaluate = numexpr.evaluate
+    s0, s1, s2 = buffers.s0, buffers.s1, buffers.s2
+
+    evaluate('(i0 + i45 + i90 + i135) * 0.5', out=s0, casting='same_kind')
+    evaluate('i0 - i90', out=s1, casting='same_kind')
+    evaluate('i45 - i135', out=s2, casting='same_kind')
+    evaluate('sqrt(s1 * s1 + s2 * s2)', out=buffers._linear, casting='same_kind')
+
+    linear = buffers._linear
+    evaluate('where(s0 > 1e-6, linear / s0, 0)', out=buffers.dolp, casting='same_kind')
+    evaluate('where(dolp > 1, 1, dolp)', local_dict={'dolp': buffers.dolp}, out=buffers.dolp, casting='same_kind')
+    evaluate('arctan2(s2, s1) * 0.5', out=buffers.aolp, casting='same_kind')
+
+    evaluate('s0 * {}'.format(S0_TO_MONO8), out=buffers.s0_mono8, casting='unsafe')
+    evaluate('dolp * 255', local_dict={'dolp': buffers.dolp}, out=buffers.dolp_mono8, casting='unsafe')
+    evaluate('where(s0 > linear, (s0 - linear) * 0.5, 0)', out=buffers.deglared_mono8, casting='unsafe')
+
+
+_numba_kernel = None
+
+def _get_numba_kernel():
+    global _numba_kernel
+
+    if _numba_kernel is None:
+        @numba.njit(parallel=True, fastmath=True, cache=True)
+        def kernel(i0, i45, i90, i135, s0, s1, s2, dolp, aolp, s0_mono8, dolp_mono8, deglared_mono8):
+            h, w = s0.shape
+            for y in numba.prange(h):
+                for x in range(w):
+                    a0 = np.float32(i0[y, x])
+                    a45 = np.float32(i45[y, x])
+                    a90 = np.float32(i90[y, x])
+                    a135 = np.float32(i135[y, x])
+
+                    stokes0 = (a0 + a45 + a90 + a135) * np.float32(0.5)
+                    stokes1 = a0 - a90
+                    stokes2 = a45 - a135
+                    linear = np.sqrt(stokes1 * stokes1 + stokes2 * stokes2)
+
+                    p = linear / stokes0 if stokes0 > 1e-6 else np.float32(0.0)
+                    if p > 1.0:
+                        p = np.float32(1.0)
+
+                    s0[y, x] = stokes0
+                    s1[y, x] = stokes1
+                    s2[y, x] = stokes2
+                    dolp[y, x] = p
+                    aolp[y, x] = np.arctan2(stokes2, stokes1) * np.float32(0.5)
+
+                    s0_mono8[y, x] = np.uint8(stokes0 * np.float32(S0_TO_MONO8))
+                    dolp_mono8[y, x] = np.uint8(p * np.float32(255.0))
+                    unpolarized = (stokes0 - linear) * np.float32(0.5)
+                    deglared_mono8[y, x] = np.uint8(unpolarized) if unpolarized > 0 else np.uint8(0)
+
+        _numba_kernel = kernel
+
+    return _numba_kernel
+
+
+def _stokes_numba(i0, i45, i90, i135, buffers: StokesBuffers):
+    _get_numba_kernel()(i0, i45, i90, i135, buffers.s0, buffers.s1, buffers.s2, buffers.dolp, buffers.aolp,
+                        buffers.s0_mono8, buffers.dolp_mono8, buffers.deglared_mono8)
+
+
+_BACKEND_FUNCTIONS = {
+    'numpy': _stokes_numpy,
+    'numexpr': _stokes_numexpr,
+    'numba': _stokes_numba,
+}
+
+
+def compute_stokes(i0, i45, i90, i135, buffers: StokesBuffers = None, backend: str = 'numpy') -> StokesBuffers:
+    """Compute S0, S1, S2, DoLP, AoLP and the 8 bit display images in a single pass.
+
+    Args:
+        i0, i45, i90, i135 (np.ndarray): uint8 quadrant images, may be strided views
+        buffers (StokesBuffers, optional): output buffers, allocated when None. Defaults to None.
+        backend (str, optional): one of BACKENDS. Defaults to 'numpy'.
+
+    Returns:
+        StokesBuffers: the buffers holding the results
+    """
+    if backend not in _BACKEND_FUNCTIONS:
+        raise ValueError('Unknown Stokes backend {}, expected one of {}'.format(backend, BACKENDS))
+
+    if backend not in available_backends():
+        raise ImportError('Stokes backend {} requested but {} is not installed'.format(backend, backend))
+
+    if buffers is None:
+        buffers = StokesBuffers(*i0.shape)
+    elif not buffers.matches(i0.shape):
+        raise ValueError('StokesBuffers shape {} does not match quadrant shape {}'.format(buffers.shape, i0.shape))
+
+    _BACKEND_FUNCTIONS[backend](i0, i45, i90, i135, buffers)
+
+    return buffers
+
+
+def benchmark(height: int = 2048, width: int = 2448, iterations: int = 50):
+    """Time every available backend on a synthetic full sensor mosaic and print the results
+    """
+    from polarDemosaic import make_synthetic_mosaic, split_polarized8
+
+    quadrants = split_polarized8(make_synthetic_mosaic(height, width))
+    buffers = StokesBuffers(*quadrants[0].shape)
+
+    print('Stokes kernel benchmark, {}x{} mosaic, {} iterations'.format(width, height, iterations))
+    for backend in available_backends():
+        #warm up, also triggers the numba compilation
+        compute_stokes(*quadrants, buffers=buffers, backend=backend)
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            compute_stokes(*quadrants, buffers=buffers, backend=backend)
+        elapsed_ms = (time.perf_counter() - start) * 1000.0 / iterations
+
+        print('{:<10s} {:8.3f} ms/frame'.format(backend, elapsed_ms))
+
+
+if __name__ == '__main__':
+    benchmark()
+    sys.exit(0)
@@ -0,0 +1,357 @@
+import sys
+import time
+import numpy as np
+import cv2
+
+from frames import FrameLease
+from polarCamBase import PolarCamBase
+from polarDemosaic import make_synthetic_mosaic
+
+#Camera backend without hardware, for benchmarks, regression runs and GUI work away from the camera.
+#
+#ReplayPolarCam serves Polarized8 frames from a recording (see polarRecording.py), from a list
+#of mosaics or, by default, a synthetic scene, through the same API as FLIRPolarCam.PolarCam.
+#Frames are paced to the frame rate like a free running camera. Exposure and gain are simulated
+#by scaling the source frames relative to the exposure they were captured with, and
+#configure_image_sequence cycles the frames through the sequencer table like the camera does.
+#The width and height of the sequencer states are ignored, frames keep the source size.
+
+
+class _ReplayChunkData:
+    """Chunk data of a replayed frame, with the PySpin ChunkData getters
+    """
+
+    def __init__(self, frame_id, timestamp_ns, exposure_us, gain_db, sequencer_set):
+        self._frame_id = frame_id
+        self._timestamp_ns = timestamp_ns
+        self._exposure_us = exposure_us
+        self._gain_db = gain_db
+        self._sequencer_set = sequencer_set
+
+    def GetFrameID(self):
+        return self._frame_id
+
+    def GetTimestamp(self):
+        return self._timestamp_ns
+
+    def GetExposureTime(self):
+        return self._exposure_us
+
+    def GetGain(self):
+        return self._gain_db
+
+    def GetSequencerSetActive(self):
+        #the chunk reader raises when the sequencer is off, like the camera
+        if self._sequencer_set is None:
+            raise ValueError('Sequencer is off')
+        return self._sequencer_set
+
+
+class _ReplayImage:
+    """A replayed frame with the subset of the PySpin image API FrameLease and FrameRecord use
+    """
+
+    def __init__(self, array, chunk_data):
+        self._array = array
+        self._chunk_data = chunk_data
+
+    def GetNDArray(self):
+        return self._array
+
+    def GetFrameID(self):
+        return self._chunk_data.GetFrameID()
+
+    def GetTimeStamp(self):
+        return self._chunk_data.GetTimestamp()
+
+    def GetChunkData(self):
+        return self._chunk_data
+
+    def IsIncomplete(self):
+        return False
+
+    def Release(self):
+        self._array = None
+
+
+class ReplayCamera:
+    """State of one replayed camera: its frame source, settings and sequencer table
+
+    Args:
+        frames (list): HxW uint8 mosaics, a list or the frames array of a PolarRecordingReader
+        exposures_us (list): exposure each frame was captured with, None where unknown
+        reference_exposure_us (float): exposure assumed where the capture exposure is unknown
+        fps (float): frame rate, None to serve frames as fast as they are grabbed
+        loop (bool): start over at the end of the source instead of failing the grab
+        serial (str): name of the camera
+    """
+
+    def __init__(self, frames, exposures_us, reference_exposure_us, fps, loop, serial):
+        self.frames = frames
+        self.exposures_us = exposures_us
+        self.reference_exposure_us = reference_exposure_us
+        self.fps = fps
+        self.loop = loop
+        self.serial = serial
+
+        self.exposure_us = reference_exposure_us
+        self.gain_db = 0.0
+        self.sequencer_table = None
+        self.sequence_start_id = 0
+
+        self.acquiring = False
+        self.frame_index = 0
+        self.frame_id = 0
+        self.next_frame_ns = 0
+
+        #scaling the source to the simulated exposure and gain goes through a lookup table, cached per factor
+        self._lut_scale = None
+        self._lut = None
+        self._scaled = None
+
+    @property
+    def shape(self) -> tuple:
+        return tuple(self.frames[0].shape[:2])
+
+    def current_settings(self):
+        """(exposure_us, gain_db, sequencer set) of the next frame
+        """
+        if self.sequencer_table is None:
+            return self.exposure_us, self.gain_db, None
+
+        sequencer_set = (self.frame_id - self.sequence_start_id) % len(self.sequencer_table)
+        _, _, exposure_us, gain_db = self.sequencer_table[sequencer_set]
+
+        return exposure_us, gain_db, sequencer_set
+
+    def render(self, source, source_exposure_us, exposure_us, gain_db):
+        """source scaled from its capture exposure to exposure_us and gain_db, a view of source when unchanged
+        """
+        if source_exposure_us is None or not np.isfinite(source_exposure_us) or source_exposure_us <= 0:
+            source_exposure_us = self.reference_exposure_us
+
+        scale = exposure_us / source_exposure_us * 10.0 ** (gain_db / 20.0)
+        if abs(scale - 1.0) < 1e-6:
+            return source
+
+        if scale != self._lut_scale:
+            self._lut = np.clip(np.arange(256) * scale, 0, 255).astype(np.uint8)
+            self._lut_scale = scale
+
+        #frames are handed out one at a time and released before the next grab, the buffer is reused
+        if self._scaled is None or self._scaled.shape != source.shape:
+            self._scaled = np.empty(source.shape, dtype=np.uint8)
+
+        return cv2.LUT(source, self._lut, dst=self._scaled)
+
+
+class ReplayPolarCam(PolarCamBase):
+    """Replays recorded or synthetic Polarized8 frames through the PolarCam API
+
+    Args:
+        source (optional): path of a polarRecording file, a list of HxW uint8 mosaics, or None for
+            a synthetic scene. Defaults to None.
+        fps (float, optional): frame rate, None to serve frames as fast as they are grabbed. Defaults to 8.0.
+        num_cameras (int, optional): number of cameras, each replaying the same source. Defaults to 1.
+        loop (bool, optional): start over at the end of the source. Defaults to True.
+        reference_exposure_us (float, optional): exposure of source frames that do not carry one. Defaults to 10000.
+        shape (tuple, optional): (height, width) of the synthetic scene. Defaults to (2048, 2448).
+    """
+
+    def __init__(self, source=None, fps=8.0, num_cameras=1, loop=True, reference_exposure_us=10000.0, shape=(2048, 2448)):
+        super().__init__()
+
+        self.recording = None
+        if source is None:
+            frames = [make_synthetic_mosaic(shape[0], shape[1], seed) for seed in range(4)]
+            exposures_us = [None] * len(frames)
+        elif isinstance(source, str):
+            from polarRecording import PolarRecordingReader
+            self.recording = PolarRecordingReader(source)
+            frames = self.recording.frames
+            exposures_us = [None if np.isnan(exposure_us) else float(exposure_us) for exposure_us in self.recording.index['exposure_us']]
+        else:
+            frames = list(source)
+            exposures_us = [None] * len(frames)
+
+        if len(frames) == 0:
+            raise ValueError('Replay source holds no frames')
+
+        self.min_shutter_speed_us = 20.0
+        self.max_shutter_speed_us = 3000000.0
+        self.curr_shutter_speed_us = reference_exposure_us
+
+        self.min_gain = 0.0
+        self.max_gain = 40.0
+        self.curr_gain = 0.0
+
+        self.min_fps = 1.0
+        self.max_fps = 24.0 if fps is None else max(24.0, fps)
+        self.curr_fps = fps
+
+        self.cam_list = [ReplayCamera(frames, exposures_us, reference_exposure_us, fps, loop, 'replay_{}'.format(index)) for index in range(num_cameras)]
+
+        print('Replay camera: {} frames of {}x{}, {} cameras'.format(len(frames), frames[0].shape[1], frames[0].shape[0], num_cameras))
+
+    def release(self):
+        super().release()
+
+        if self.recording is not None:
+            for cam in self.cam_list:
+                cam.frames = None
+            self.recording.close()
+            self.recording = None
+
+    def get_frame_shape_cam(self, cam) -> tuple:
+        return cam.shape
+
+    def start_acquisition_cam(self, cam):
+        cam.acquiring = True
+        cam.next_frame_ns = time.perf_counter_ns()
+
+    def stop_acquisition_cam(self, cam):
+        cam.acquiring = False
+
+    def grab_image_lease_cam(self, cam):
+        """Serve the next frame of cam as a FrameLease, waiting for its frame time
+
+        Returns:
+            FrameLease: the frame, None when acquisition is stopped or a non looping source is exhausted
+        """
+        if not cam.acquiring:
+            print('Error: grab_image_lease_cam, acquisition not started')
+            return None
+
+        if cam.frame_index >= len(cam.frames):
+            if not cam.loop:
+                return None
+            cam.frame_index = 0
+
+        exposure_us, gain_db, sequencer_set = cam.current_settings()
+
+        #a free running camera delivers a frame every 1/fps, or every exposure when that is longer
+        if cam.fps is not None:
+            period_ns = max(1e9 / cam.fps, exposure_us * 1000.0)
+            wait_s = (cam.next_frame_ns - time.perf_counter_ns()) / 1e9
+            if wait_s > 0:
+                time.sleep(wait_s)
+            cam.next_frame_ns = max(cam.next_frame_ns + period_ns, time.perf_counter_ns() - period_ns)
+
+        image = cam.render(cam.frames[cam.frame_index], cam.exposures_us[cam.frame_index], exposure_us, gain_db)
+        host_timestamp_ns = time.perf_counter_ns()
+
+        chunk_data = _ReplayChunkData(cam.frame_id, host_timestamp_ns, exposure_us, gain_db, sequencer_set)
+        cam.frame_index += 1
+        cam.frame_id += 1
+
+        return FrameLease(_ReplayImage(image, chunk_data), host_timestamp_ns)
+
+    def configure_image_sequence(self, settings_list):
+        """Cycle the frames of every camera through settings_list, (width, height, exposure_us, gain_db) per state
+        """
+        if len(settings_list) == 0:
+            return False
+
+        for cam in self.cam_list:
+            cam.sequencer_table = list(settings_list)
+            #the sequence starts at state 0 with the next frame, like the camera after programming
+            cam.sequence_start_id = cam.frame_id
+
+        return True
+
+    def reset_sequencer(self):
+        for cam in self.cam_list:
+            cam.sequencer_table = None
+
+    def configure_camera_to_polarized8_format(self):
+        self.reset_sequencer()
+
+    def get_curr_exposure_value(self, cam_index=0) -> float:
+        cam = self.get_camera(cam_index)
+        return cam.exposure_us if cam != None else 0.0
+
+    def set_exposure_auto(self, on_or_off):
+        if on_or_off:
+            for cam in self.cam_list:
+                cam.exposure_us = cam.reference_exposure_us
+
+    def set_exposure_time_from_step(self, shutter_slider_val):
+        #same mapping as the FLIR camera
+        exposure_time_max = max(min(self.max_shutter_speed_us, 500000), self.min_shutter_speed_us)
+        exposure_time_to_set = shutter_slider_val * (exposure_time_max - self.min_shutter_speed_us)/100 + self.min_shutter_speed_us
+
+        for cam in self.cam_list:
+            cam.exposure_us = exposure_time_to_set
+
+        return len(self.cam_list) > 0
+
+    def get_curr_gain_value(self, cam_index=0):
+        cam = self.get_camera(cam_index)
+        return cam.gain_db if cam != None else 0
+
+    def set_gain_auto(self, on_or_off):
+        if on_or_off:
+            for cam in self.cam_list:
+                cam.gain_db = 0.0
+
+    def set_gain_value_from_step(self, gain_slider_val):
+        gain_to_set = gain_slider_val * (self.max_gain - self.min_gain)/100
+
+        for cam in self.cam_list:
+            cam.gain_db = gain_to_set
+
+        return len(self.cam_list) > 0
+
+    def get_fps_value(self, cam_index=0) -> float:
+        cam = self.get_camera(cam_index)
+        if cam == None or cam.fps is None:
+            return 0.0
+
+        return cam.fps
+
+    def set_fps_auto(self, on_or_off):
+        if on_or_off:
+            for cam in self.cam_list:
+                cam.fps = self.curr_fps
+
+    def set_fps_value_from_step(self, fps_slider_val):
+        fps_to_set = max(self.min_fps, fps_slider_val * (self.max_fps - self.min_fps)/100)
+
+        for cam in self.cam_list:
+            cam.fps = fps_to_set
+
+        return len(self.cam_list) > 0
+
+
+def benchmark(num_frames=32, fps=None):
+    """Run the preview path (grab, demosaic, Stokes, panel) on the replay camera and print the frame rate
+    """
+    polar_cam = ReplayPolarCam(fps=fps)
+    polar_cam.start_acquisition()
+
+    height, width = polar_cam.get_frame_shape_cam(polar_cam.get_camera())
+    panel = np.empty((height, width // 2 * 3), dtype=np.uint8)
+
+    start = time.perf_counter()
+    for _ in range(num_frames):
+        with polar_cam.grab_image_lease() as frame:
+            images = polar_cam.grab_all_polarized_image(frame)
+            polar_cam.append_images_to_panel(*images, out=panel)
+    elapsed_s = time.perf_counter() - start
+
+    settings_list = [(width, height, exposure_us, 0.0) for exposure_us in (2500, 5000, 10000, 20000, 40000)]
+    polar_cam.configure_image_sequence(settings_list)
+    records = polar_cam.grab_sequence(len(settings_list))
+    means = ['{:.0f}'.format(record.image.mean()) for record in records]
+
+    polar_cam.stop_acquisition()
+    polar_cam.release()
+
+    print('Replay preview: {:.1f} frames/s, {:.1f} ms/frame'.format(num_frames / elapsed_s, elapsed_s * 1000.0 / num_frames))
+    print('Sequence sets {}, exposures {}, mean levels {}'.format([record.sequencer_set for record in records],
+                                                                  [record.exposure_us for record in records], means))
+
+
+if __name__ == '__main__':
+    benchmark()
+    sys.exit(0)
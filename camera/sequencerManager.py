@@ -0,0 +1,96 @@
+import PySpin
+
+from FLIRCamHelper import configure_sequencer_part_one, configure_sequencer_part_two, set_single_state, get_node, get_entry, is_readable
+
+
+class SequencerManager:
+    """Programs the sequencer of one camera, writing only the states that changed.
+
+    The state table last written to the camera is kept. Programming an identical table while
+    the sequencer is running is skipped entirely, otherwise only the states whose width, height,
+    exposure or gain changed (plus the states whose next state link moves) are written.
+
+    Sequencer states are lost when the camera is power-cycled, call invalidate() after a reconnect.
+    """
+
+    def __init__(self, nodemap):
+        """
+        Args:
+            nodemap (INodeMap or NodeCache): the camera's nodemap, ideally its NodeCache
+        """
+        self.nodemap = nodemap
+        self.loaded_states = None
+
+    def invalidate(self):
+        """Forget the loaded table, the next program() writes every state
+        """
+        self.loaded_states = None
+
+    def is_sequencer_on(self) -> bool:
+        node_sequencer_mode = get_node(self.nodemap, 'SequencerMode', PySpin.CEnumerationPtr)
+        if not is_readable(self.nodemap, node_sequencer_mode):
+            return False
+
+        sequencer_mode_on = get_entry(self.nodemap, node_sequencer_mode, 'On')
+        return node_sequencer_mode.GetIntValue() == sequencer_mode_on.GetValue()
+
+    def diff(self, states: list) -> list:
+        """Indices of the states that have to be written to turn the loaded table into states
+
+        Args:
+            states (list): (width, height, exposure_us, gain_db) tuples
+
+        Returns:
+            list: sorted state indices
+        """
+        if self.loaded_states is None:
+            return list(range(len(states)))
+
+        changed = set(index for index, state in enumerate(states)
+                      if index >= len(self.loaded_states) or self.loaded_states[index] != state)
+
+        #the last state links back to state 0, the links move when the table length changes
+        if len(states) != len(self.loaded_states):
+            changed.add(len(states) - 1)
+            if len(self.loaded_states) - 1 < len(states):
+                changed.add(len(self.loaded_states) - 1)
+
+        return sorted(index for index in changed if 0 <= index < len(states))
+
+    def program(self, settings_list: list) -> bool:
+        """Load settings_list into the sequencer and turn it on
+
+        Args:
+            settings_list (list): (width, height, exposure_us, gain_db) per sequencer state
+
+        Returns:
+            bool: True if successful
+        """
+        states = [tuple(state) for state in settings_list]
+        if len(states) == 0:
+            print('Empty sequence, nothing to program...')
+            return False
+
+        if states == self.loaded_states and self.is_sequencer_on():
+            print('Sequencer states unchanged, skipping configuration...')
+            return True
+
+        changed = self.diff(states)
+
+        if not configure_sequencer_part_one(self.nodemap):
+            self.invalidate()
+            return False
+
+        print('Writing {} of {} sequencer states...'.format(len(changed), len(states)))
+        result = True
+        max_sequence_index = len(states) - 1
+        for index in changed:
+            width, height, exposure_time, gain = states[index]
+            result &= set_single_state(self.nodemap, index, width, height, exposure_time, gain, max_sequence_index)
+
+        result &= configure_sequencer_part_two(self.nodemap)
+
+        #on failure the camera holds a partially written table
+        self.loaded_states = states if result else None
+
+        return result
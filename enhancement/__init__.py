@@ -1,2 +1,14 @@
-from .textLossDisplay import *
-from .imageEnhancements import *
\ No newline at end of file
+import importlib
+
+from .imageEnhancements import *
+
+#textLossDisplay pulls in torch, it is only imported when one of its names is used
+_textLossDisplay_names = ('craft_text_characters', 'get_craft_model', 'create_heatmap_blended_image', 'cvt2HeatmapImg',
+                          'normalize_mean_variance_tensor', 'normalize_mean_variance_tensor_single_channel', 'device',
+                          'craft_score_maps_batch', 'craft_score_maps_tiled', 'count_characters', 'extract_text_boxes', 'detect_text_boxes')
+
+def __getattr__(name):
+    if name == 'textLossDisplay' or name in _textLossDisplay_names:
+        textLossDisplay = importlib.import_module('.textLossDisplay', __name__)
+        return textLossDisplay if name == 'textLossDisplay' else getattr(textLossDisplay, name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -0,0 +1,254 @@
+import argparse
+import copy
+import os, sys
+import time
+from pathlib import Path
+import numpy as np
+import cv2 as cv
+import torch
+import torch.nn as nn
+
+#add root folder to path, for running this file directly
+sys.path.append(str(Path(os.path.dirname(os.path.abspath(__file__))).parents[0]))
+
+from enhancement.textLossDisplay import get_craft_model, craft_score_maps_batch, count_characters
+
+#Reduced precision CRAFT inference backends for CPU deployments.
+#
+#   fp32            the eager float32 model
+#   channels_last   float32 with NHWC activations, faster convolutions on recent x86 CPUs
+#   bf16            bfloat16 autocast, worthwhile on CPUs with AVX512-BF16 / AMX
+#   int8            static int8 quantization of the VGG16-BN backbone, calibrated on sample frames
+#
+#Dynamic quantization is not offered: torch only quantizes nn.Linear / RNN layers dynamically
+#and CRAFT is all convolutions, so it would leave the model unchanged.
+#
+#Select a backend per deployment with the CRAFT_BACKEND environment variable, or pass backend
+#to get_craft_model(). check_backend_accuracy() compares a backend with the fp32 reference, from
+#the root folder with e.g.:
+#
+#   python -m enhancement.craftBackends --check int8
+
+BACKENDS = ('fp32', 'channels_last', 'bf16', 'int8')
+
+
+class _ChannelsLastCRAFT(nn.Module):
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model.to(memory_format=torch.channels_last)
+
+    def forward(self, x):
+        return self.model(x.contiguous(memory_format=torch.channels_last))
+
+
+class _AutocastCRAFT(nn.Module):
+
+    def __init__(self, model, dtype=torch.bfloat16):
+        super().__init__()
+        self.model = model
+        self.dtype = dtype
+
+    def forward(self, x):
+        with torch.autocast(device_type=x.device.type, dtype=self.dtype):
+            y, feature = self.model(x)
+
+        #score maps leave in float32 like the reference
+        return y.float(), feature.float()
+
+
+def make_calibration_frames(num_frames=8, height=512, width=512, seed=0) -> list:
+    """Returns uint8 grayscale frames of random printed text, for calibration when no captures are at hand
+    """
+    rng = np.random.default_rng(seed)
+    alphabet = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+    frames = []
+    for _ in range(num_frames):
+        background = int(rng.integers(120, 256))
+        frame = np.full((height, width), background, dtype=np.uint8)
+        for _ in range(int(rng.integers(4, 12))):
+            text = ''.join(rng.choice(list(alphabet), int(rng.integers(3, 12))))
+            origin = (int(rng.integers(0, width // 2)), int(rng.integers(24, height)))
+            cv.putText(frame, text, origin, cv.FONT_HERSHEY_SIMPLEX, float(rng.uniform(0.5, 2.0)),
+                       int(rng.integers(0, background // 2)), int(rng.integers(1, 4)), cv.LINE_AA)
+
+        #sensor noise
+        noise = rng.normal(0, 4, frame.shape)
+        frames.append(np.clip(frame + noise, 0, 255).astype(np.uint8))
+
+    return frames
+
+
+def quantize_int8(model, calibration_frames=None):
+    """Static int8 quantization of the backbone of a float32 CRAFT model
+
+    The VGG16-BN backbone carries most of the compute and traces cleanly with torch.fx. The
+    U network stays in float32. Observers are calibrated by running calibration_frames through it.
+
+    Args:
+        model (CRAFT): float32 CPU model, left untouched
+        calibration_frames (list, optional): representative uint8 frames, make_calibration_frames() when None. Defaults to None.
+
+    Returns:
+        CRAFT: quantized copy
+    """
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    if calibration_frames is None:
+        calibration_frames = make_calibration_frames()
+
+    quantized = copy.deepcopy(model).cpu().eval()
+    try:
+        from torch.ao.quantization import get_default_qconfig_mapping
+    except ImportError:
+        get_default_qconfig_mapping = None
+
+    if get_default_qconfig_mapping is not None:
+        engine = 'x86' if 'x86' in torch.backends.quantized.supported_engines else 'fbgemm'
+        torch.backends.quantized.engine = engine
+        example_input = torch.zeros((1, quantized.in_channels, 64, 64))
+        quantized.basenet = prepare_fx(quantized.basenet, get_default_qconfig_mapping(engine), example_inputs=(example_input,))
+    else:
+        #torch 1.12 (requirements.txt): a qconfig dict and no example inputs, its third parameter is
+        #prepare_custom_config_dict. It has no x86 engine either
+        from torch.ao.quantization import get_default_qconfig
+        torch.backends.quantized.engine = 'fbgemm'
+        quantized.basenet = prepare_fx(quantized.basenet, {'': get_default_qconfig('fbgemm')})
+
+    #calibration
+    craft_score_maps_batch(calibration_frames, batch_size=1, target_device=torch.device('cpu'), craft_model=quantized)
+
+    quantized.basenet = convert_fx(quantized.basenet)
+
+    return quantized
+
+
+def build_backend(backend, model, calibration_frames=None):
+    """Wrap or convert a float32 CRAFT model for backend
+
+    Args:
+        backend (str): one of BACKENDS
+        model (CRAFT): float32 model, left untouched
+        calibration_frames (list, optional): frames to calibrate the int8 backend with. Defaults to None.
+    """
+    if backend == 'fp32':
+        return model
+    if backend == 'channels_last':
+        return _ChannelsLastCRAFT(copy.deepcopy(model)).eval()
+    if backend == 'bf16':
+        return _AutocastCRAFT(model, torch.bfloat16).eval()
+    if backend == 'int8':
+        if next(model.parameters()).device.type != 'cpu':
+            raise ValueError('The int8 backend runs on CPU only')
+        return quantize_int8(model, calibration_frames)
+
+    raise ValueError('Unknown CRAFT backend {}, expected one of {}'.format(backend, BACKENDS))
+
+
+def compare_score_maps(reference_maps, candidate_maps, text_threshold=0.4) -> dict:
+    """Accuracy of candidate region score maps against reference maps
+
+    Returns:
+        dict: max_abs_error, mean_abs_error, mask_iou of the thresholded text masks and
+              char_count_error, the largest per frame difference in character count
+    """
+    max_abs_error = 0.0
+    abs_error_sum = 0.0
+    num_pixels = 0
+    intersection = 0
+    union = 0
+    char_count_error = 0
+
+    for reference, candidate in zip(reference_maps, candidate_maps):
+        difference = np.abs(reference - candidate)
+        max_abs_error = max(max_abs_error, float(difference.max()))
+        abs_error_sum += float(difference.sum())
+        num_pixels += difference.size
+
+        reference_mask = reference > text_threshold
+        candidate_mask = candidate > text_threshold
+        intersection += int(np.count_nonzero(reference_mask & candidate_mask))
+        union += int(np.count_nonzero(reference_mask | candidate_mask))
+
+        char_count_error = max(char_count_error, abs(count_characters(reference, text_threshold) - count_characters(candidate, text_threshold)))
+
+    return {'max_abs_error': max_abs_error,
+            'mean_abs_error': abs_error_sum / max(num_pixels, 1),
+            'mask_iou': intersection / union if union > 0 else 1.0,
+            'char_count_error': char_count_error}
+
+
+def check_backend_accuracy(backend, frames=None, mean_abs_tolerance=0.01, min_mask_iou=0.9):
+    """Regression check of a backend against the fp32 reference on frames
+
+    Args:
+        backend (str): one of BACKENDS
+        frames (list, optional): uint8 frames, make_calibration_frames() with another seed when None. Defaults to None.
+        mean_abs_tolerance (float, optional): largest accepted mean absolute score error. Defaults to 0.01.
+        min_mask_iou (float, optional): smallest accepted IoU of the text masks. Defaults to 0.9.
+
+    Returns:
+        tuple: (passed, metrics) with metrics from compare_score_maps
+    """
+    if frames is None:
+        #not the calibration frames
+        frames = make_calibration_frames(seed=1)
+
+    reference_maps, _, _ = craft_score_maps_batch(frames, batch_size=1, craft_model=get_craft_model(backend='fp32'))
+    candidate_maps, _, _ = craft_score_maps_batch(frames, batch_size=1, craft_model=get_craft_model(backend=backend))
+
+    metrics = compare_score_maps(reference_maps, candidate_maps)
+    passed = metrics['mean_abs_error'] <= mean_abs_tolerance and metrics['mask_iou'] >= min_mask_iou
+
+    return passed, metrics
+
+
+def benchmark(num_frames=4, height=512, width=512, iterations=2):
+    """Time and check every backend on synthetic text frames and print the results
+    """
+    frames = make_calibration_frames(num_frames, height, width, seed=1)
+
+    print('CRAFT backend benchmark, {} frames of {}x{}'.format(num_frames, width, height))
+    for backend in BACKENDS:
+        try:
+            start = time.perf_counter()
+            craft_model = get_craft_model(backend=backend)
+            build_s = time.perf_counter() - start
+        except Exception as ex:
+            print('{:<14s} unavailable: {}'.format(backend, ex))
+            continue
+
+        #warm up
+        craft_score_maps_batch(frames[:1], batch_size=1, craft_model=craft_model)
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            craft_score_maps_batch(frames, batch_size=1, craft_model=craft_model)
+        elapsed_ms = (time.perf_counter() - start) * 1000.0 / (iterations * num_frames)
+
+        passed, metrics = check_backend_accuracy(backend, frames)
+        print('{:<14s} {:8.1f} ms/frame  build {:5.1f} s  mean abs {:.4f}  iou {:.3f}  {}'.format(
+            backend, elapsed_ms, build_s, metrics['mean_abs_error'], metrics['mask_iou'], 'ok' if passed else 'FAILED'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the CRAFT backends, or check their accuracy')
+    parser.add_argument('--check', nargs='+', default=None, choices=BACKENDS, help='only check these backends against fp32, exit 1 on failure')
+    args = parser.parse_args()
+
+    if args.check is None:
+        benchmark()
+        return 0
+
+    num_failed = 0
+    for backend in args.check:
+        passed, metrics = check_backend_accuracy(backend)
+        print('{:<14s} mean abs {:.4f}  iou {:.3f}  {}'.format(backend, metrics['mean_abs_error'], metrics['mask_iou'], 'ok' if passed else 'FAILED'))
+        num_failed += 0 if passed else 1
+
+    return 1 if num_failed > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
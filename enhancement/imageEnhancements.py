@@ -1,9 +1,13 @@
+import sys
 import cv2
+import numpy as np
 
 #helper file containing some useful image enhancement techniques
 
 
-def exposureFusion( images: list):
+def exposureFusionOpenCV( images: list):
+    """Reference fusion through cv2.MergeMertens on 3 channel copies of the exposures, kept for benchmarking
+    """
 
     # Align input images
     alignMTB = cv2.createAlignMTB()
@@ -23,6 +27,357 @@ def exposureFusion( images: list):
 
     return gray_img
 
+#engine reused by exposureFusion, its pyramid buffers survive between calls
+_default_fusion = None
+
+def exposureFusion( images: list, align=True):
+    """Fuse a bracket of uint8 grayscale exposures into one uint8 image, exact Mertens fusion
+
+    Args:
+        images (list): uint8 exposures of the same scene
+        align (bool, optional): MTB align every exposure to the first. Defaults to True.
+    """
+    global _default_fusion
+    if _default_fusion is None:
+        _default_fusion = ExposureFusionAccumulator()
+
+    _default_fusion.align = align
+    #the cached shifts belong to the previous bracket
+    _default_fusion.clear_alignment()
+
+    return _default_fusion.fuse(images)
+
+
+class ExposureFusionAccumulator:
+    """Single channel Mertens exposure fusion, exact over a whole bracket or streaming one exposure at a time.
+
+    fuse() is exact Mertens fusion: a first pass sums the weight maps (contrast * well-exposedness)
+    of the bracket, the second pass adds the Laplacian pyramid of every exposure times the Gaussian
+    pyramid of its normalised weight map W_k / sum(W).
+
+    add() streams, for the live HDR preview: the weight map is computed as soon as the frame
+    arrives, its Gaussian pyramid times the Laplacian pyramid of the exposure is added to a running
+    pyramid and the weight pyramid to a running normalisation pyramid, which result() divides level
+    by level. No exposure is kept, memory stays constant whatever the bracket length. This is an
+    approximation: G{W_k} / G{sum(W)} is not G{W_k / sum(W)}, normalising does not commute with
+    the blur. It is off most where the weights change fastest, on the synthetic bracket of
+    benchmark() by about 9 grey levels on average and up to about 45, see compare_with_reference().
+
+    With align=True every exposure is shifted onto the first exposure of the bracket with MTB.
+    With cache_alignment=True the shift of each bracket position is computed once and reused by
+    the following brackets, for a camera that does not move.
+    """
+
+    def __init__(self, contrast_weight=1.0, exposedness_weight=1.0, sigma=0.2, levels=None, align=False, cache_alignment=False):
+        self.contrast_weight = contrast_weight
+        self.exposedness_weight = exposedness_weight
+        self.sigma = sigma
+        #pyramid depth, derived from the image size when None
+        self.levels = levels
+        self.align = align
+        self.cache_alignment = cache_alignment
+
+        self.count = 0
+        self.shape = None
+
+        self._align_mtb = None
+        self._reference = None
+        self._aligned = None
+        #bracket position -> (dx, dy)
+        self._shifts = {}
+
+    def reset(self):
+        """Start a new bracket, the buffers and cached shifts are kept
+        """
+        self.count = 0
+
+    def clear_alignment(self):
+        """Forget the cached alignment shifts
+        """
+        self._shifts = {}
+
+    def _allocate(self, shape):
+        self.shape = shape
+
+        levels = self.levels
+        if levels is None:
+            levels = int(np.log2(min(shape)))
+
+        sizes = [shape]
+        for _ in range(levels - 1):
+            h, w = sizes[-1]
+            if min(h, w) < 2:
+                break
+            sizes.append(((h + 1) // 2, (w + 1) // 2))
+
+        #pyramids of the current exposure
+        self._image = [np.empty(size, dtype=np.float32) for size in sizes]
+        self._weight = [np.empty(size, dtype=np.float32) for size in sizes]
+        self._scratch = [np.empty(size, dtype=np.float32) for size in sizes]
+        #running sums
+        self._weighted_sum = [np.zeros(size, dtype=np.float32) for size in sizes]
+        self._weight_sum = [np.zeros(size, dtype=np.float32) for size in sizes]
+        #full resolution sum of the weight maps of the bracket, see fuse
+        self._total_weight = np.zeros(shape, dtype=np.float32)
+
+        self._aligned = np.empty(shape, dtype=np.uint8)
+        self._reference = np.empty(shape, dtype=np.uint8)
+        self._shifts = {}
+        self.count = 0
+
+    def _align_to_reference(self, image, position, reuse_shift):
+        if self._align_mtb is None:
+            self._align_mtb = cv2.createAlignMTB()
+
+        if position == 0:
+            np.copyto(self._reference, image)
+            return image
+
+        shift = self._shifts.get(position) if reuse_shift else None
+        if shift is None:
+            shift = tuple(int(value) for value in self._align_mtb.calculateShift(self._reference, image))
+            self._shifts[position] = shift
+
+        if shift == (0, 0):
+            return image
+
+        self._align_mtb.shiftMat(image, shift, self._aligned)
+        return self._aligned
+
+    def _clear_sums(self):
+        for level in range(len(self._weighted_sum)):
+            self._weighted_sum[level].fill(0)
+            self._weight_sum[level].fill(0)
+
+    def add(self, image):
+        """Fold one uint8 grayscale exposure into the streamed result, see the class comment
+
+        Args:
+            image (np.ndarray): uint8 exposure, the array is not kept
+        """
+        if self.shape != image.shape:
+            self._allocate(image.shape)
+
+        if self.count == 0:
+            self._clear_sums()
+
+        if self.align:
+            image = self._align_to_reference(image, self.count, self.cache_alignment)
+
+        self._compute_weights(image)
+        self._accumulate()
+
+    def fuse(self, images, out=None) -> np.ndarray:
+        """Exact Mertens fusion of a whole bracket, the weights are normalised before their pyramids are built
+
+        Replaces whatever was added since the last reset.
+
+        Args:
+            images (list): uint8 exposures of the same scene
+            out (np.ndarray, optional): uint8 array to write into. Defaults to None.
+        """
+        images = list(images)
+        if len(images) == 0:
+            return None
+
+        if self.shape != images[0].shape:
+            self._allocate(images[0].shape)
+        self.reset()
+        self._clear_sums()
+        if not self.cache_alignment:
+            self._shifts = {}
+
+        def aligned(position, image):
+            #the second pass reuses the shifts of the first
+            return self._align_to_reference(image, position, True) if self.align else image
+
+        self._total_weight.fill(0)
+        for position, image in enumerate(images):
+            self._compute_weights(aligned(position, image))
+            self._total_weight += self._weight[0]
+
+        for position, image in enumerate(images):
+            self._compute_weights(aligned(position, image))
+            np.divide(self._weight[0], self._total_weight, out=self._weight[0])
+            self._accumulate()
+
+        #the normalised weight pyramids sum to 1, result() divides by 1
+        return self.result(out)
+
+    def _compute_weights(self, image):
+        #exposure as float in self._image[0], its weight map in self._weight[0]
+        image_f = self._image[0]
+        weight = self._weight[0]
+        scratch = self._scratch[0]
+        np.multiply(image, np.float32(1.0 / 255), out=image_f)
+
+        #contrast: absolute laplacian
+        cv2.Laplacian(image_f, cv2.CV_32F, dst=weight)
+        np.abs(weight, out=weight)
+        if self.contrast_weight != 1.0:
+            np.power(weight, self.contrast_weight, out=weight)
+
+        #well-exposedness: gaussian around mid grey
+        np.subtract(image_f, np.float32(0.5), out=scratch)
+        np.square(scratch, out=scratch)
+        np.multiply(scratch, np.float32(-self.exposedness_weight / (2 * self.sigma * self.sigma)), out=scratch)
+        np.exp(scratch, out=scratch)
+
+        np.multiply(weight, scratch, out=weight)
+        np.add(weight, np.float32(1e-12), out=weight)
+
+    def _accumulate(self):
+        #gaussian pyramids of the exposure and of its weights
+        num_levels = len(self._image)
+        for level in range(1, num_levels):
+            cv2.pyrDown(self._image[level - 1], dst=self._image[level], dstsize=self._image[level].shape[::-1])
+            cv2.pyrDown(self._weight[level - 1], dst=self._weight[level], dstsize=self._weight[level].shape[::-1])
+
+        #laplacian level times gaussian weight, the top level is the gaussian itself
+        for level in range(num_levels):
+            band = self._image[level]
+            if level < num_levels - 1:
+                band = self._scratch[level]
+                cv2.pyrUp(self._image[level + 1], dst=band, dstsize=band.shape[::-1])
+                np.subtract(self._image[level], band, out=band)
+
+            self._weight_sum[level] += self._weight[level]
+            np.multiply(band, self._weight[level], out=band)
+            self._weighted_sum[level] += band
+
+        self.count += 1
+
+    def result(self, out=None) -> np.ndarray:
+        """Returns the fusion of the exposures added since the last reset as uint8
+
+        Args:
+            out (np.ndarray, optional): uint8 array to write into. Defaults to None.
+        """
+        if self.count == 0:
+            return None
+
+        num_levels = len(self._weighted_sum)
+
+        #collapse from the top level down, reusing the image pyramid as scratch
+        collapsed = self._image[num_levels - 1]
+        np.divide(self._weighted_sum[num_levels - 1], self._weight_sum[num_levels - 1], out=collapsed)
+        for level in range(num_levels - 2, -1, -1):
+            upsampled = self._image[level]
+            cv2.pyrUp(collapsed, dst=upsampled, dstsize=upsampled.shape[::-1])
+
+            band = self._scratch[level]
+            np.divide(self._weighted_sum[level], self._weight_sum[level], out=band)
+            np.add(upsampled, band, out=upsampled)
+            collapsed = upsampled
+
+        np.multiply(collapsed, np.float32(255), out=collapsed)
+        np.clip(collapsed, 0, 255, out=collapsed)
+
+        if out is None:
+            out = np.empty(collapsed.shape, dtype=np.uint8)
+        np.copyto(out, collapsed, casting='unsafe')
+
+        return out
+
+
+def make_synthetic_bracket(exposures=(0.25, 0.5, 1.0, 2.0, 4.0, 8.0), height=2048, width=2448, seed=0):
+    """Returns uint8 exposures of a synthetic high dynamic range scene, for benchmarks
+    """
+    rng = np.random.default_rng(seed)
+
+    #patches of random radiance spread over 8 stops
+    stops = rng.uniform(-4, 4, (height // 32, width // 32)).astype(np.float32)
+    radiance = 32 * np.exp2(cv2.resize(stops, (width, height), interpolation=cv2.INTER_NEAREST))
+
+    return [np.clip(radiance * exposure, 0, 255).astype(np.uint8) for exposure in exposures]
+
+
+def mertens_reference(images: list, contrast_weight=1.0, exposedness_weight=1.0, sigma=0.2, levels=None) -> np.ndarray:
+    """Textbook single channel Mertens fusion holding every exposure and weight map, for checking the engine
+
+    Same weights and pyramids as ExposureFusionAccumulator, without alignment. Returns the fusion as float32 in 0-255.
+    """
+    images_f = [image.astype(np.float32) / 255 for image in images]
+
+    weights = []
+    for image_f in images_f:
+        weight = np.abs(cv2.Laplacian(image_f, cv2.CV_32F)) ** contrast_weight
+        weight *= np.exp(-exposedness_weight * (image_f - 0.5) ** 2 / (2 * sigma * sigma))
+        weights.append(weight + 1e-12)
+    total_weight = np.sum(weights, axis=0)
+
+    if levels is None:
+        levels = int(np.log2(min(images[0].shape)))
+
+    fused = None
+    for image_f, weight in zip(images_f, weights):
+        gaussian = [image_f]
+        weight_pyramid = [weight / total_weight]
+        for _ in range(levels - 1):
+            if min(gaussian[-1].shape) < 2:
+                break
+            gaussian.append(cv2.pyrDown(gaussian[-1]))
+            weight_pyramid.append(cv2.pyrDown(weight_pyramid[-1]))
+
+        bands = [gaussian[level] - cv2.pyrUp(gaussian[level + 1], dstsize=gaussian[level].shape[::-1]) for level in range(len(gaussian) - 1)]
+        bands.append(gaussian[-1])
+
+        weighted = [band * weight_level for band, weight_level in zip(bands, weight_pyramid)]
+        fused = weighted if fused is None else [total + band for total, band in zip(fused, weighted)]
+
+    collapsed = fused[-1]
+    for level in range(len(fused) - 2, -1, -1):
+        collapsed = cv2.pyrUp(collapsed, dstsize=fused[level].shape[::-1]) + fused[level]
+
+    return np.clip(collapsed * 255, 0, 255)
+
+
+def compare_with_reference(fused, reference) -> dict:
+    """Mean, p99 and max absolute difference in grey levels of a uint8 fusion against mertens_reference
+    """
+    difference = np.abs(fused.astype(np.float32) - reference)
+
+    return {'mean': float(difference.mean()),
+            'p99': float(np.percentile(difference, 99)),
+            'max': float(difference.max())}
+
+
+def benchmark(height: int = 2048, width: int = 2448, iterations: int = 5):
+    """Time the OpenCV fusion against the single channel pyramid engine on a 6 exposure bracket, check them
+    against mertens_reference and print the results
+    """
+    import time
+
+    images = make_synthetic_bracket(height=height, width=width)
+    print('Exposure fusion benchmark, {}x{}, {} exposures, {} iterations'.format(width, height, len(images), iterations))
+
+    #the synthetic bracket needs no alignment, MTB finds zero shifts
+    reference = mertens_reference(images)
+
+    accumulator = ExposureFusionAccumulator(align=True, cache_alignment=True)
+
+    def fuse_streaming():
+        accumulator.reset()
+        for image in images:
+            accumulator.add(image)
+        return accumulator.result()
+
+    for name, fuse in (('opencv', lambda: np.clip(exposureFusionOpenCV(images), 0, 255).astype(np.uint8)),
+                       ('exact', lambda: exposureFusion(images)),
+                       ('streaming', fuse_streaming)):
+        #warm up, also fills the pyramid buffers and the alignment cache
+        fused = fuse()
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fuse()
+        elapsed_ms = (time.perf_counter() - start) * 1000.0 / iterations
+
+        error = compare_with_reference(fused, reference)
+        print('{:<10s} {:8.1f} ms/bracket  vs reference: mean {:6.2f}  p99 {:6.2f}  max {:6.2f} grey levels'.format(
+            name, elapsed_ms, error['mean'], error['p99'], error['max']))
+
+
 def clahe(image, clip_limit=2, tile_grid_size=(8, 8)):
     
     # Create equaliser using input parameters
@@ -33,6 +388,10 @@ def clahe(image, clip_limit=2, tile_grid_size=(8, 8)):
 
 
 if __name__ == '__main__':
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        benchmark()
+        sys.exit(0)
     
     #read a image
     parcel_label_filepath = '../data/1 ChangiSingPost_01_20230203123108680_2096.jpg'
@@ -1,4 +1,5 @@
 import torch
+import torch.nn.functional as F
 import torch.optim as optim
 import utils
 from torchvision import transforms
@@ -6,6 +7,8 @@ import math
 import numpy as np
 import cv2 as cv
 import os, sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -20,10 +23,116 @@ sys.path.append(topSrcFolder)
 
 import model.Craft.craft as Craft
 
-craft_model = Craft.CRAFT(pretrained=True, freeze=True).to(device)
 pretrained_model_path = os.path.join(topSrcFolder,'pretrained_models/craft/craft_mlt_25k.pth') #should be added into config
 
-craft_model.load_state_dict(Craft.copyStateDict(torch.load(pretrained_model_path)))
+#inference backend used when none is given, see enhancement/craftBackends.py. Chosen per deployment
+craft_backend = os.environ.get('CRAFT_BACKEND', 'fp32')
+
+#process wide registry of the models built so far, keyed by (name, weights path, device, backend)
+_model_registry = {}
+#reentrant, building a backend model fetches the fp32 model first
+_model_registry_lock = threading.RLock()
+
+def get_craft_model(weights_path=None, target_device=None, backend=None, grayscale=False):
+    """Returns the CRAFT model, built and loaded on first use and shared afterwards
+
+    Args:
+        weights_path (str, optional): CRAFT state dict, pretrained_model_path when None. Defaults to None.
+        target_device (torch.device, optional): device to run on, device when None. Defaults to None.
+        backend (str, optional): one of craftBackends.BACKENDS or EXPORTED_BACKENDS, craft_backend when None. Defaults to None.
+        grayscale (bool, optional): the variant taking 1 channel input, see Craft.fold_grayscale_input. Defaults to False.
+    """
+    if weights_path is None:
+        weights_path = pretrained_model_path
+    if target_device is None:
+        target_device = device
+    if backend is None:
+        backend = craft_backend
+
+    #an exported graph has its input channels baked in
+    if backend in EXPORTED_BACKENDS:
+        grayscale = False
+
+    key = ('craft', weights_path, str(target_device), backend, grayscale)
+    with _model_registry_lock:
+        if key not in _model_registry:
+            if backend == 'fp32' and grayscale:
+                #first conv weights summed over the input channels, no 3x repeat of mono input
+                _model_registry[key] = Craft.fold_grayscale_input(get_craft_model(weights_path, target_device, 'fp32'))
+            elif backend == 'fp32':
+                #the state dict holds the whole network, the ImageNet weights of the backbone are not needed
+                model = Craft.CRAFT(pretrained=False, freeze=True)
+                model.load_state_dict(Craft.copyStateDict(torch.load(weights_path, map_location='cpu')))
+                model.eval()
+                _model_registry[key] = model.to(target_device)
+            elif backend in EXPORTED_BACKENDS:
+                #graphs written by model/Craft/exportCraft.py next to the weights
+                stem = os.path.splitext(weights_path)[0]
+                exported_path = stem + ('.onnx' if backend == 'onnx' else '_script.pt')
+                _model_registry[key] = load_exported_craft_model(exported_path, target_device)
+            else:
+                from enhancement.craftBackends import build_backend
+                _model_registry[key] = build_backend(backend, get_craft_model(weights_path, target_device, 'fp32', grayscale))
+
+        return _model_registry[key]
+
+#runtimes of the graphs exported by model/Craft/exportCraft.py
+EXPORTED_BACKENDS = ('torchscript', 'onnx')
+
+class ExportedCraftModel:
+    """An exported CRAFT graph behind the call signature of the eager model, (score maps, None)
+
+    The ONNX graph runs through onnxruntime on CPU, the TorchScript module through torch. A
+    3 channel graph is fed grayscale input repeated over the channels, a folded 1 channel graph
+    only accepts grayscale input.
+    """
+
+    def __init__(self, path, target_device=None):
+        if target_device is None:
+            target_device = device
+
+        self.path = path
+        self.session = None
+        self.module = None
+        self.in_channels = None
+
+        if path.endswith('.onnx'):
+            try:
+                import onnxruntime
+            except ImportError:
+                raise ImportError('onnxruntime is not installed, pip install onnxruntime to run {}'.format(path))
+
+            self.session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+            self.input_name = self.session.get_inputs()[0].name
+            channels = self.session.get_inputs()[0].shape[1]
+            self.in_channels = channels if isinstance(channels, int) else None
+        else:
+            self.module = torch.jit.load(path, map_location=target_device)
+            self.module.eval()
+
+    def __call__(self, x):
+        if self.in_channels == 3 and x.shape[1] == 1:
+            x = x.repeat(1, 3, 1, 1)
+        elif self.in_channels is not None and x.shape[1] != self.in_channels:
+            raise ValueError('{} takes {} channel input, got {}'.format(self.path, self.in_channels, x.shape[1]))
+
+        if self.session is not None:
+            score_maps = self.session.run(None, {self.input_name: x.detach().cpu().numpy().astype(np.float32, copy=False)})[0]
+            return torch.from_numpy(score_maps), None
+
+        with torch.no_grad():
+            return self.module(x), None
+
+def load_exported_craft_model(path, target_device=None):
+    """Load a graph exported by model/Craft/exportCraft.py, .onnx through onnxruntime and .pt through TorchScript
+    """
+    return ExportedCraftModel(path, target_device)
+
+def __getattr__(name):
+    #craft_model used to be built at import time, keep it reachable as a lazy module attribute
+    if name == 'craft_model':
+        return get_craft_model()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 def cvt2HeatmapImg(img):
     img = (np.clip(img, 0, 1) * 255).astype(np.uint8)
@@ -31,7 +140,11 @@ def cvt2HeatmapImg(img):
     return img
 
 def create_heatmap_blended_image(original_image, text_score_image):
-    score_text = text_score_image[0,:,:,0].cpu().data.numpy()
+    #CRAFT output tensor, or an already extracted region score map
+    if torch.is_tensor(text_score_image):
+        score_text = text_score_image[0,:,:,0].cpu().data.numpy()
+    else:
+        score_text = text_score_image
     render_img = score_text.copy()
     ret_score_text = cvt2HeatmapImg(render_img)
 
@@ -51,45 +164,510 @@ def normalize_mean_variance_tensor_single_channel(in_img, mean=(0.485+0.456+0.40
     in_img = transforms.functional.normalize(in_img, mean=mean*255.0, std=math.sqrt(variance) * 255.0) 
     return in_img
 
-def craft_text_characters(img1):
-    """Returns number of characters detected
+class CraftPreprocessor:
+    """uint8 HxW / HxWx3 image to the normalized 1xCxHxW CRAFT input in a single pass over the pixels
+
+    Clamping x / 255 to [0, 1], scaling back by 255 and normalizing reduces to x * scale + bias per
+    channel, computed by one torch.add straight from the uint8 pixels. The buffers are kept per
+    input shape and reused across calls. On CUDA the frame is staged through a pinned host buffer
+    and copied without blocking. The uint8 input stays available as staged_image, on the device,
+    for create_heatmap_blended_image_on_device.
+    """
+
+    def __init__(self, target_device=None):
+        self.device = torch.device(target_device if target_device is not None else device)
+
+        self._shape = None
+        self._pinned = None
+        self._output = None
+        self.staged_image = None
+
+    def _allocate(self, shape):
+        channels = 1 if len(shape) == 2 else shape[2]
+        if channels == 3:
+            mean = (0.485*255.0, 0.456*255.0, 0.406*255.0)
+            std = (0.229*255.0, 0.224*255.0, 0.225*255.0)
+        else:
+            #same statistics as normalize_mean_variance_tensor_single_channel
+            mean = ((0.485+0.456+0.406)*255.0,)
+            std = (math.sqrt(0.229*0.229 + 0.224*0.224 + 0.225*255.0) * 255.0,)
+
+        self._scales = [1.0 / s for s in std]
+        self._biases = [torch.tensor(-m / s, device=self.device) for m, s in zip(mean, std)]
+
+        self._output = torch.empty((1, channels, shape[0], shape[1]), dtype=torch.float32, device=self.device)
+        if self.device.type == 'cuda':
+            self._pinned = torch.empty(shape, dtype=torch.uint8).pin_memory()
+            self.staged_image = torch.empty(shape, dtype=torch.uint8, device=self.device)
+
+        self._shape = shape
+
+    def __call__(self, image) -> torch.Tensor:
+        """Returns the normalized input, valid until the next call
+        """
+        if image.shape != self._shape:
+            self._allocate(image.shape)
+
+        if self.device.type == 'cuda':
+            np.copyto(self._pinned.numpy(), image)
+            self.staged_image.copy_(self._pinned, non_blocking=True)
+        else:
+            self.staged_image = torch.from_numpy(np.ascontiguousarray(image))
+
+        if self._output.shape[1] == 1:
+            torch.add(self._biases[0], self.staged_image, alpha=self._scales[0], out=self._output[0, 0])
+        else:
+            for channel in range(self._output.shape[1]):
+                torch.add(self._biases[channel], self.staged_image[:, :, channel], alpha=self._scales[channel], out=self._output[0, channel])
+
+        return self._output
+
+#one preprocessor per thread and device, their buffers are reused by craft_text_characters
+_preprocessors = threading.local()
+
+def get_preprocessor(target_device=None) -> CraftPreprocessor:
+    if target_device is None:
+        target_device = device
+
+    preprocessors = getattr(_preprocessors, 'by_device', None)
+    if preprocessors is None:
+        preprocessors = _preprocessors.by_device = {}
+
+    key = str(target_device)
+    if key not in preprocessors:
+        preprocessors[key] = CraftPreprocessor(target_device)
+
+    return preprocessors[key]
+
+#JET colormap as a 256x3 BGR lookup table per device
+_jet_luts = {}
+
+def create_heatmap_blended_image_on_device(original_image, text_score_image):
+    """create_heatmap_blended_image computed where the tensors live, with a single copy to the host at the end
 
     Args:
-        craft_model (_type_): _description_
-        img1 (_type_): _description_
-        device (_type_): _description_
+        original_image (torch.Tensor): uint8 HxW or HxWx3 image on the device of text_score_image, e.g. CraftPreprocessor.staged_image
+        text_score_image (torch.Tensor): CRAFT output, (1, H/2, W/2, 2)
 
     Returns:
-        _type_: _description_
+        np.ndarray: BGR image and heatmap blend side by side
     """
-    convert_tensor = transforms.ToTensor()
+    target_device = text_score_image.device
+    key = str(target_device)
+    if key not in _jet_luts:
+        lut = cv.applyColorMap(np.arange(256, dtype=np.uint8).reshape(256, 1), cv.COLORMAP_JET).reshape(256, 3)
+        _jet_luts[key] = torch.from_numpy(lut).to(target_device)
 
-    #convert CxHxW image to BxCxHxW image
-    img1_bchw = convert_tensor(img1).to(device)
-    img1_bchw = img1_bchw.unsqueeze(0)
-    
-    clamped_img1 = torch.clamp(img1_bchw, min=0, max=1)
-    clamped_img1 = clamped_img1 * 255
+    original_image = original_image.to(target_device)
+    height, width = original_image.shape[:2]
 
-    if img1_bchw.shape[1] == 3:
-        out_image1 = normalize_mean_variance_tensor(clamped_img1)
-    else:
-        out_image1 = normalize_mean_variance_tensor_single_channel(clamped_img1)
+    score_text = text_score_image[0, :, :, 0]
+    heatmap = _jet_luts[key][(score_text.clamp(0, 1) * 255).to(torch.uint8).long()]
 
-    with torch.no_grad():
-        craft_model.eval()
-        img1_pred, _ = craft_model(out_image1)
+    heatmap = F.interpolate(heatmap.permute(2, 0, 1).unsqueeze(0).float(), size=(height, width), mode='bilinear', align_corners=False)
+    heatmap = heatmap[0].permute(1, 2, 0)
+
+    original_bgr = original_image.unsqueeze(2).expand(height, width, 3) if original_image.dim() == 2 else original_image
 
-    # out_text = img1_pred[0,:,:,0]
-    # print('converting out_text to cpu ', out_text.shape)
-    # out_text = out_text.cpu().data.numpy()
+    concat_row_image = torch.empty((height, 2 * width, 3), dtype=torch.uint8, device=target_device)
+    concat_row_image[:, :width] = original_bgr
+    concat_row_image[:, width:] = torch.round(original_bgr.float() * 0.6 + heatmap * 0.4).clamp_(0, 255)
 
-    rgb_draw = None
+    return concat_row_image.cpu().numpy()
 
-    if (len(img1.shape) == 3) and (img1.shape[2] == 3):
+def craft_text_characters(img1, max_memory_bytes=None, num_workers=1, device_postprocess=False, return_score_maps=False):
+    """Returns the image next to its CRAFT text heatmap blend
+
+    Args:
+        img1 (np.ndarray): uint8 grayscale or BGR image
+        max_memory_bytes (int, optional): activation memory budget, larger images run tiled, see craft_score_maps_tiled. Defaults to None.
+        num_workers (int, optional): tiles run in parallel when tiled. Defaults to 1.
+        device_postprocess (bool, optional): build the heatmap blend on the inference device, see create_heatmap_blended_image_on_device. Defaults to False.
+        return_score_maps (bool, optional): also return the region and affinity maps, e.g. for extract_text_boxes. Defaults to False.
+
+    Returns:
+        np.ndarray: BGR image and heatmap blend side by side, (blend, score_text, score_link) with return_score_maps
+    """
+    is_color = (len(img1.shape) == 3) and (img1.shape[2] == 3)
+
+    if max_memory_bytes is not None and img1.shape[0] * img1.shape[1] * CRAFT_BYTES_PER_PIXEL > max_memory_bytes:
+        score_text, score_link = craft_score_maps_tiled(img1, max_memory_bytes=max_memory_bytes, num_workers=num_workers)
+        rgb_draw = create_heatmap_blended_image(img1 if is_color else cv.cvtColor(img1, cv.COLOR_GRAY2BGR), score_text)
+
+        return (rgb_draw, score_text, score_link) if return_score_maps else rgb_draw
+
+    #uint8 to normalized BxCxHxW in one pass
+    preprocessor = get_preprocessor()
+    out_image1 = preprocessor(img1)
+
+    craft_model = get_craft_model(grayscale=out_image1.shape[1] == 1)
+
+    with torch.no_grad():
+        img1_pred, _ = craft_model(out_image1)
+
+    if device_postprocess:
+        rgb_draw = create_heatmap_blended_image_on_device(preprocessor.staged_image, img1_pred)
+    elif is_color:
         rgb_draw = create_heatmap_blended_image(img1, img1_pred)
     else:
         gray_rgb = cv.cvtColor(img1 ,cv.COLOR_GRAY2BGR)
         rgb_draw = create_heatmap_blended_image(gray_rgb, img1_pred)
 
-    return rgb_draw
\ No newline at end of file
+    if return_score_maps:
+        score_maps = img1_pred[0].float().cpu().numpy()
+        return rgb_draw, score_maps[:, :, 0], score_maps[:, :, 1]
+
+    return rgb_draw
+
+#peak activation memory of a float32 CRAFT forward pass per input pixel, measured on CPU at 2048x2048
+CRAFT_BYTES_PER_PIXEL = 768
+
+def available_memory_bytes(target_device=None) -> int:
+    """Returns the memory free for inference on target_device, device when None
+    """
+    if target_device is None:
+        target_device = device
+
+    if torch.device(target_device).type == 'cuda':
+        free_bytes, _ = torch.cuda.mem_get_info(torch.device(target_device))
+        return free_bytes
+
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+def auto_batch_size(height, width, target_device=None, memory_fraction=0.5, max_batch_size=None) -> int:
+    """Largest batch of height x width frames whose activations fit in memory_fraction of the free memory
+
+    Args:
+        max_batch_size (int, optional): upper bound, 16 on CUDA and one frame per 4 intra-op threads on CPU when None. Defaults to None.
+    """
+    if target_device is None:
+        target_device = device
+
+    if max_batch_size is None:
+        #on CPU a single frame already keeps a few cores busy, bigger batches only add cache pressure
+        max_batch_size = 16 if torch.device(target_device).type == 'cuda' else max(1, torch.get_num_threads() // 4)
+
+    frame_bytes = height * width * CRAFT_BYTES_PER_PIXEL
+    batch_size = int(available_memory_bytes(target_device) * memory_fraction) // frame_bytes
+
+    return max(1, min(batch_size, max_batch_size))
+
+def count_characters(score_text, text_threshold=0.4, min_area=4) -> int:
+    """Number of characters in a CRAFT region score map, one connected blob per character
+
+    Args:
+        score_text (np.ndarray): region score map
+        text_threshold (float, optional): score above which a pixel belongs to a character. Defaults to 0.4.
+        min_area (int, optional): blobs smaller than this, in score map pixels, are noise. Defaults to 4.
+    """
+    mask = (score_text > text_threshold).astype(np.uint8)
+    num_labels, _, stats, _ = cv.connectedComponentsWithStats(mask, connectivity=4)
+
+    #label 0 is the background
+    return int(np.count_nonzero(stats[1:num_labels, cv.CC_STAT_AREA] >= min_area))
+
+def _component_boxes(mask, strong_mask, min_area):
+    """Bounding boxes (x, y, w, h) of the connected components of mask that reach min_area and hold a strong_mask pixel
+    """
+    num_labels, labels, stats, _ = cv.connectedComponentsWithStats(mask.view(np.uint8), connectivity=4)
+
+    #components with at least one confident pixel, counted in one pass instead of one max per component
+    has_strong = np.bincount(labels[strong_mask], minlength=num_labels) > 0
+
+    keep = has_strong & (stats[:, cv.CC_STAT_AREA] >= min_area)
+    #label 0 is the background
+    keep[0] = False
+
+    return stats[keep, :4]
+
+def extract_text_boxes(score_text, score_link, text_threshold=0.7, link_threshold=0.4, low_text=0.4, min_area=4, downsample=1):
+    """Character and word boxes from CRAFT score maps
+
+    Characters are the connected components of the region map above low_text, words the components
+    of the region or affinity map above their thresholds. A component is kept when it reaches min_area
+    and its peak region score reaches text_threshold. With downsample above 1 the maps are shrunk first,
+    which makes the labelling cheaper at the cost of box precision.
+
+    Args:
+        score_text (np.ndarray): region score map, at half the image resolution
+        score_link (np.ndarray): affinity score map, same size
+        text_threshold (float, optional): peak region score of a kept component. Defaults to 0.7.
+        link_threshold (float, optional): affinity score joining characters into words. Defaults to 0.4.
+        low_text (float, optional): region score of a text pixel. Defaults to 0.4.
+        min_area (int, optional): smallest component, in pixels of the map after downsampling. Defaults to 4.
+        downsample (int, optional): extra reduction of the score maps. Defaults to 1.
+
+    Returns:
+        tuple: (character boxes, word boxes) as int32 arrays of (x, y, w, h) rows in image pixels
+    """
+    if downsample > 1:
+        size = (max(1, score_text.shape[1] // downsample), max(1, score_text.shape[0] // downsample))
+        score_text = cv.resize(score_text, size, interpolation=cv.INTER_AREA)
+        score_link = cv.resize(score_link, size, interpolation=cv.INTER_AREA)
+
+    text_mask = score_text > low_text
+    strong_mask = score_text > text_threshold
+
+    char_boxes = _component_boxes(text_mask, strong_mask, min_area)
+    word_boxes = _component_boxes(text_mask | (score_link > link_threshold), strong_mask, min_area)
+
+    #score maps are at half the image resolution
+    scale = 2 * downsample
+    return (char_boxes * scale).astype(np.int32), (word_boxes * scale).astype(np.int32)
+
+def detect_text_boxes(image, downsample=1, **thresholds):
+    """Run CRAFT on one image and return its (character boxes, word boxes), see extract_text_boxes
+    """
+    score_texts, score_links, _ = craft_score_maps_batch([image], batch_size=1)
+
+    return extract_text_boxes(score_texts[0], score_links[0], downsample=downsample, **thresholds)
+
+def craft_score_maps_batch(frames, batch_size=None, bucket_multiple=32, text_threshold=0.4, target_device=None, craft_model=None):
+    """Run CRAFT on many frames with one forward pass per batch
+
+    Frames are bucketed by channel count and by size rounded up to bucket_multiple, and padded to
+    their bucket size. Every bucket is run in batches of batch_size frames.
+
+    Args:
+        frames (list or np.ndarray): uint8 HxW or HxWx3 frames, or a stacked NxHxW / NxHxWx3 array
+        batch_size (int, optional): frames per forward pass, chosen from the free memory when None. Defaults to None.
+        bucket_multiple (int, optional): frame sizes are rounded up to a multiple of this. Defaults to 32.
+        text_threshold (float, optional): region score threshold used to count characters. Defaults to 0.4.
+        target_device (torch.device, optional): device to run on, device when None. Defaults to None.
+        craft_model (torch.nn.Module, optional): model to run, get_craft_model() when None, its grayscale variant for 1 channel frames. Defaults to None.
+
+    Returns:
+        tuple: (region score maps, affinity score maps, character counts), one entry per frame, maps at half the frame resolution
+    """
+    if target_device is None:
+        target_device = device
+
+    frames = list(frames)
+
+    buckets = {}
+    for index, frame in enumerate(frames):
+        channels = 1 if frame.ndim == 2 else frame.shape[2]
+        height = -(-frame.shape[0] // bucket_multiple) * bucket_multiple
+        width = -(-frame.shape[1] // bucket_multiple) * bucket_multiple
+        buckets.setdefault((channels, height, width), []).append(index)
+
+    score_texts = [None] * len(frames)
+    score_links = [None] * len(frames)
+
+    for (channels, height, width), indices in buckets.items():
+        bucket_batch_size = batch_size if batch_size is not None else auto_batch_size(height, width, target_device)
+        bucket_model = craft_model if craft_model is not None else get_craft_model(target_device=target_device, grayscale=channels == 1)
+
+        if channels == 3:
+            mean = torch.tensor((0.485*255.0, 0.456*255.0, 0.406*255.0), device=target_device).view(1, 3, 1, 1)
+        else:
+            mean = torch.full((1, channels, 1, 1), (0.485+0.456+0.406)*255.0, device=target_device)
+
+        for start in range(0, len(indices), bucket_batch_size):
+            chunk = indices[start:start + bucket_batch_size]
+
+            #the padding is filled with the mean so that it normalizes to zero
+            batch = mean.repeat(len(chunk), 1, height, width)
+            for row, index in enumerate(chunk):
+                frame = torch.from_numpy(np.ascontiguousarray(frames[index])).to(target_device)
+                frame = frame.unsqueeze(0) if channels == 1 else frame.permute(2, 0, 1)
+                batch[row, :, :frame.shape[1], :frame.shape[2]] = frame
+
+            if channels == 3:
+                batch = normalize_mean_variance_tensor(batch)
+            else:
+                batch = normalize_mean_variance_tensor_single_channel(batch)
+
+            with torch.no_grad():
+                pred, _ = bucket_model(batch)
+            pred = pred.float().cpu().numpy()
+
+            for row, index in enumerate(chunk):
+                map_height = (frames[index].shape[0] + 1) // 2
+                map_width = (frames[index].shape[1] + 1) // 2
+                score_texts[index] = pred[row, :map_height, :map_width, 0].copy()
+                score_links[index] = pred[row, :map_height, :map_width, 1].copy()
+
+    char_counts = [count_characters(score_text, text_threshold) for score_text in score_texts]
+
+    return score_texts, score_links, char_counts
+
+def tile_size_for_memory(max_memory_bytes, num_workers=1, multiple=32) -> int:
+    """Side of the largest square tile whose activations, num_workers at a time, fit in max_memory_bytes
+    """
+    tile_pixels = max_memory_bytes // (CRAFT_BYTES_PER_PIXEL * num_workers)
+    tile_size = int(math.sqrt(tile_pixels)) // multiple * multiple
+
+    return max(multiple, tile_size)
+
+def _tile_starts(length, tile, stride):
+    if length <= tile:
+        return [0]
+
+    starts = list(range(0, length - tile, stride))
+    #the last tile ends on the border. Starts stay even so that every tile lands on whole score map
+    #pixels, on an odd length the last tile is one pixel shorter
+    starts.append((length - tile + 1) // 2 * 2)
+    return starts
+
+def _blend_window(height, width, ramp):
+    """Weights rising linearly over ramp pixels from every tile border, strictly positive
+    """
+    def profile(length):
+        distance = np.minimum(np.arange(length), np.arange(length)[::-1]) + 1
+        return np.minimum(1.0, distance / float(ramp + 1)).astype(np.float32)
+
+    return np.outer(profile(height), profile(width))
+
+def craft_score_maps_tiled(image, tile_size=None, overlap=64, max_memory_bytes=None, num_workers=1, target_device=None, craft_model=None):
+    """Run CRAFT on overlapping tiles of a large image and blend the score maps across the seams
+
+    Peak activation memory is about num_workers tiles, so the whole sensor can be scored in a
+    fixed budget. Overlapping tile borders are cross faded with linear ramps.
+
+    Args:
+        image (np.ndarray): uint8 HxW or HxWx3 image
+        tile_size (int, optional): tile side in pixels, derived from max_memory_bytes when None. Defaults to None.
+        overlap (int, optional): overlap between neighbouring tiles in pixels. Defaults to 64.
+        max_memory_bytes (int, optional): activation budget for all workers, half the free memory when None. Defaults to None.
+        num_workers (int, optional): tiles run in parallel on a thread pool when above 1. Defaults to 1.
+        target_device (torch.device, optional): device to run on, device when None. Defaults to None.
+        craft_model (torch.nn.Module, optional): model to run, get_craft_model() when None. Defaults to None.
+
+    Returns:
+        tuple: (region score map, affinity score map) at half the image resolution
+    """
+    if tile_size is None:
+        if max_memory_bytes is None:
+            max_memory_bytes = available_memory_bytes(target_device) // 2
+        tile_size = tile_size_for_memory(max_memory_bytes, num_workers)
+
+    #tiles stay a multiple of 2 so that they land on whole score map pixels
+    overlap = min(overlap, tile_size // 2) // 2 * 2
+    stride = tile_size - overlap
+
+    height, width = image.shape[:2]
+    tiles = [(y, x) for y in _tile_starts(height, tile_size, stride) for x in _tile_starts(width, tile_size, stride)]
+
+    map_height = (height + 1) // 2
+    map_width = (width + 1) // 2
+    text_sum = np.zeros((map_height, map_width), dtype=np.float32)
+    link_sum = np.zeros((map_height, map_width), dtype=np.float32)
+    weight_sum = np.zeros((map_height, map_width), dtype=np.float32)
+    windows = {}
+
+    def run_tile(origin):
+        y, x = origin
+        tile = image[y:y + tile_size, x:x + tile_size]
+        score_texts, score_links, _ = craft_score_maps_batch([tile], batch_size=1, target_device=target_device, craft_model=craft_model)
+        return origin, score_texts[0], score_links[0]
+
+    def accumulate(origin, score_text, score_link):
+        y, x = origin[0] // 2, origin[1] // 2
+        h, w = score_text.shape
+        if (h, w) not in windows:
+            windows[(h, w)] = _blend_window(h, w, overlap // 2)
+        window = windows[(h, w)]
+
+        text_sum[y:y + h, x:x + w] += score_text * window
+        link_sum[y:y + h, x:x + w] += score_link * window
+        weight_sum[y:y + h, x:x + w] += window
+
+    if num_workers > 1 and len(tiles) > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            for result in executor.map(run_tile, tiles):
+                accumulate(*result)
+    else:
+        for origin in tiles:
+            accumulate(*run_tile(origin))
+
+    #every score map pixel is covered by a tile, the guard only keeps a gap from turning into NaN
+    np.divide(text_sum, weight_sum, out=text_sum, where=weight_sum > 0)
+    np.divide(link_sum, weight_sum, out=link_sum, where=weight_sum > 0)
+
+    return text_sum, link_sum
+
+def benchmark_batch(num_frames=8, height=512, width=512, target_device=None):
+    """Compare one craft_text_characters call per frame with craft_score_maps_batch and print the results
+    """
+    import time
+
+    frames = [np.random.default_rng(seed).integers(0, 256, (height, width), dtype=np.uint8) for seed in range(num_frames)]
+
+    #warm up, also builds the model
+    craft_score_maps_batch(frames[:1], batch_size=1, target_device=target_device)
+
+    start = time.perf_counter()
+    for frame in frames:
+        craft_text_characters(frame)
+    single_ms = (time.perf_counter() - start) * 1000.0 / num_frames
+
+    start = time.perf_counter()
+    craft_score_maps_batch(frames, target_device=target_device)
+    batch_ms = (time.perf_counter() - start) * 1000.0 / num_frames
+
+    print('CRAFT {} frames of {}x{}, batch size {}'.format(num_frames, width, height, auto_batch_size(height, width, target_device)))
+    print('{:<10s} {:8.1f} ms/frame'.format('single', single_ms))
+    print('{:<10s} {:8.1f} ms/frame'.format('batched', batch_ms))
+
+def benchmark_stages(height=1024, width=1224, iterations=5, target_device=None):
+    """Time the preprocessing, inference and heatmap stages of craft_text_characters on a grayscale frame, old and new paths
+    """
+    import time
+
+    if target_device is None:
+        target_device = device
+
+    image = np.random.default_rng(0).integers(0, 256, (height, width), dtype=np.uint8)
+    craft_model = get_craft_model(target_device=target_device, grayscale=True)
+    preprocessor = CraftPreprocessor(target_device)
+
+    def legacy_preprocess():
+        image_bchw = transforms.ToTensor()(image).to(target_device).unsqueeze(0)
+        return normalize_mean_variance_tensor_single_channel(torch.clamp(image_bchw, min=0, max=1) * 255)
+
+    def inference():
+        with torch.no_grad():
+            return craft_model(preprocessor(image))[0]
+
+    score_maps = inference()
+    gray_bgr = cv.cvtColor(image, cv.COLOR_GRAY2BGR)
+
+    def synchronize():
+        if torch.device(target_device).type == 'cuda':
+            torch.cuda.synchronize()
+
+    stages = (('preprocess (ToTensor + normalize)', legacy_preprocess),
+              ('preprocess (fused)', lambda: preprocessor(image)),
+              ('inference', inference),
+              ('heatmap (host)', lambda: create_heatmap_blended_image(gray_bgr, score_maps)),
+              ('heatmap (device)', lambda: create_heatmap_blended_image_on_device(preprocessor.staged_image, score_maps)))
+
+    print('CRAFT stage benchmark, {}x{} grayscale on {}'.format(width, height, target_device))
+    for name, stage in stages:
+        #warm up
+        stage()
+        synchronize()
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            stage()
+        synchronize()
+        elapsed_ms = (time.perf_counter() - start) * 1000.0 / iterations
+
+        print('{:<36s} {:8.2f} ms'.format(name, elapsed_ms))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'stages':
+        benchmark_stages()
+    else:
+        benchmark_batch()
@@ -6,7 +6,7 @@ import sys
 import os 
 import cv2
 import numpy as np
-import requests
+import queue
 
 #add root folder to path.  
 currentFilePath = os.path.dirname(os.path.abspath(__file__))  #this will be controller folder
@@ -15,12 +15,42 @@ sys.path.append(topSrcFolder)
 sys.path.append(os.path.join(topSrcFolder, 'camera'))
 
 from gui.generated.ui_polarcam import Ui_PolarCam
-from camera.FLIRPolarCam import PolarCam
+from camera.polarCamBase import PolarCamBase
+from camera.replayPolarCam import ReplayPolarCam
+
+#PySpin is only needed for the FLIR camera, without it the GUI runs on the replay camera
+try:
+    from camera.FLIRPolarCam import PolarCam
+except ImportError as ex:
+    print('FLIR camera backend unavailable: {}'.format(ex))
+    PolarCam = None
+
 from utils.imageUtils import save_images_to_folder, save_image_to_folder
-from enhancement.imageEnhancements import exposureFusion, clahe
-from enhancement.textLossDisplay import craft_text_characters
+from utils.imageWriter import AsyncImageWriter
+from enhancement.imageEnhancements import exposureFusion, clahe, ExposureFusionAccumulator
+import enhancement
 
 import utils.utils
+from utils.ocrClient import OcrClient
+
+def create_polar_cam():
+    """Camera backend selected by the POLARCAM_BACKEND environment variable
+
+    flir runs the FLIR camera, replay serves the recording in POLARCAM_REPLAY (a synthetic scene
+    when unset) and auto, the default, uses the FLIR camera when one is connected and replay otherwise.
+    """
+    backend = os.environ.get('POLARCAM_BACKEND', 'auto')
+    replay_source = os.environ.get('POLARCAM_REPLAY') or None
+
+    if backend in ('auto', 'flir') and PolarCam is not None:
+        polar_cam = PolarCam()
+        if polar_cam.num_cameras > 0 or backend == 'flir':
+            return polar_cam
+
+        print('No FLIR camera connected, using the replay camera')
+        polar_cam.release()
+
+    return ReplayPolarCam(replay_source)
 
 class VideoPreviewCapture(QThread):
     change_pixmap_signal = pyqtSignal(np.ndarray)
@@ -64,12 +94,13 @@ class VideoSequenceCapture(QThread):
         #display and resize images
         #concat image to a column. 
          #perform sequence capture. 
-        image_result_array = self.polar_cam.grab_sequence(self.num_frames_in_seq)
+        frame_records = self.polar_cam.grab_sequence(self.num_frames_in_seq)
+        image_result_array = [record.image for record in frame_records]
 
         if len(image_result_array) > 0:
             np_top_pair = image_result_array[0]
 
-            for i in range(1, self.num_frames_in_seq):
+            for i in range(1, len(image_result_array)):
                 np_top_pair = np.concatenate((np_top_pair, image_result_array[i]), axis=1)
 
             self.change_pixmap_signal.emit(np_top_pair, image_result_array) #emit signal. 
@@ -84,13 +115,164 @@ class VideoSequenceCapture(QThread):
 
         print('Thread Stop')
 
+class VideoHDRStream(QThread):
+    """Live HDR: keeps the sequencer looping and emits one fused frame per completed bracket.
+
+    Every exposure is folded into an ExposureFusionAccumulator as soon as it is grabbed, and its
+    stream buffer released, so the weights of one exposure are computed while the next is exposed.
+    Streaming approximates Mertens fusion, see ExposureFusionAccumulator. Captures are fused exactly.
+    """
+    change_pixmap_signal = pyqtSignal(np.ndarray)
+
+    def __init__(self, polar_cam, sequence):
+        super().__init__()
+
+        self.polar_cam = polar_cam
+        self.sequence = sequence
+        self._run_flag = False
+
+    def run(self):
+
+        self._run_flag = True
+
+        if not self.polar_cam.configure_image_sequence(self.sequence):
+            print('Failed to configure sequencer')
+            return
+
+        print("Start HDR Stream")
+        self.polar_cam.start_acquisition()
+
+        bracket_size = len(self.sequence)
+        #the camera does not move between brackets, MTB shifts are computed once per bracket position
+        accumulator = ExposureFusionAccumulator(align=True, cache_alignment=True)
+        previous_set = None
+        frame_count = 0
+
+        while self._run_flag:
+            frame = self.polar_cam.grab_image_lease()
+            if frame == None:
+                print("No image received")
+                continue
+
+            with frame:
+                #sequencer set from the chunk data, counted when chunk data is off
+                sequencer_set = frame.record.sequencer_set
+                if sequencer_set == None:
+                    sequencer_set = frame_count % bracket_size
+                frame_count += 1
+
+                #the set index wrapping around starts a new bracket, a partial bracket after a drop is discarded
+                if previous_set != None and sequencer_set <= previous_set:
+                    if accumulator.count > 0:
+                        print('Incomplete bracket of {} exposures dropped'.format(accumulator.count))
+                    accumulator.reset()
+                previous_set = sequencer_set
+
+                accumulator.add(frame.array)
+
+            if accumulator.count == bracket_size:
+                self.change_pixmap_signal.emit(accumulator.result())
+                accumulator.reset()
+                previous_set = None
+
+        self.polar_cam.stop_acquisition()
+
+        print('Stop HDR Stream')
+
+    def stop(self):
+        """Sets run flag to False and waits for thread to finish"""
+        self._run_flag = False
+        self.wait()
+
+        print('Thread Stop')
+
+class CraftInferenceWorker(QThread):
+    """Runs CRAFT on its own thread so that the GUI keeps the camera frame rate.
+
+    Frames are submitted to a bounded queue. When inference falls behind, the oldest pending frame
+    is dropped, a stale frame is never worth running. Each heatmap is emitted through result_signal,
+    then the frame ID, the frame itself and the word boxes found in it through boxes_signal, so that
+    the boxes are never paired with another frame.
+    """
+    result_signal = pyqtSignal(np.ndarray)
+    boxes_signal = pyqtSignal(int, np.ndarray, np.ndarray)
+
+    def __init__(self, max_pending=1, max_memory_bytes=None, num_workers=1):
+        super().__init__()
+
+        #frames whose activations exceed max_memory_bytes run tiled, see craft_score_maps_tiled
+        self.max_memory_bytes = max_memory_bytes
+        self.num_workers = num_workers
+
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.num_dropped = 0
+        self._run_flag = False
+
+    def submit(self, image, frame_id=0):
+        """Queue image for inference without blocking, returns False when an older frame had to be dropped
+
+        frame_id is emitted back with the word boxes of image.
+        """
+        dropped = False
+        while True:
+            try:
+                self.pending.put_nowait((frame_id, image))
+                return not dropped
+            except queue.Full:
+                try:
+                    self.pending.get_nowait()
+                    self.num_dropped += 1
+                    dropped = True
+                except queue.Empty:
+                    pass
+
+    def run(self):
+
+        self._run_flag = True
+
+        #torch and the model are loaded here rather than at GUI startup
+        try:
+            enhancement.get_craft_model()
+        except Exception as ex:
+            print('Error: {} loading CRAFT model'.format(ex))
+            return
+
+        while self._run_flag:
+            try:
+                frame_id, image = self.pending.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            #one bad frame (odd shape, out of memory on a large capture) must not end the thread, submit would then queue frames nobody reads
+            try:
+                heatmap_img, score_text, score_link = enhancement.craft_text_characters(image, self.max_memory_bytes, self.num_workers, return_score_maps=True)
+                _, word_boxes = enhancement.extract_text_boxes(score_text, score_link, downsample=2)
+            except Exception as ex:
+                print('Error: {} running CRAFT on frame {}'.format(ex, frame_id))
+                continue
+
+            self.result_signal.emit(heatmap_img)
+            self.boxes_signal.emit(frame_id, image, word_boxes)
+
+    def stop(self):
+        """Sets run flag to False and waits for thread to finish"""
+        self._run_flag = False
+        self.wait()
+
+        print('Inference Thread Stop, {} stale frames dropped'.format(self.num_dropped))
+
 class VideoPreviewPolarCam(QThread):
     change_pixmap_signal = pyqtSignal(np.ndarray)
 
-    def __init__(self, polar_cam):
+    def __init__(self, polar_cam, num_panel_buffers=3, ring_capacity=8):
         super().__init__()
-        
+
         self.polar_cam = polar_cam
+        self.num_panel_buffers = num_panel_buffers
+        self.ring_capacity = ring_capacity
+
+        #acquisition engine of the running preview. Other consumers (recorder, OCR) can attach to it with engine.add_consumer
+        self.engine = None
 
     def run(self):
 
@@ -103,19 +285,45 @@ class VideoPreviewPolarCam(QThread):
         print("Start Thread")
         self.polar_cam.start_acquisition()
 
+        #GetNextImage runs on the engine thread, a slow preview only makes this consumer skip frames
+        self.engine = self.polar_cam.create_acquisition_engine(self.ring_capacity)
+        if self.engine == None:
+            print("No camera available")
+            self.polar_cam.stop_acquisition()
+            return
+
+        preview_reader = self.engine.add_consumer('preview')
+        self.engine.start()
+
+        raw_image = np.empty(self.engine.ring.frames.shape[1:], dtype=np.uint8)
+
+        #panels are reused round robin, the GUI copies whatever it keeps when the signal is received
+        panels = []
+        panel_index = 0
+
         while self._run_flag:
-            image_result = self.polar_cam.grab_image()
+            frame = preview_reader.read(raw_image, timeout=1.0, latest=True)
 
-            if image_result == None:
+            if frame == None:
                 print("No image received")
                 continue
-            
+
             #extract polarized image
-            image_polarized_i0, image_polarized_i45, image_polarized_i90, image_polarized_i135, image_dolp, image_deglared = self.polar_cam.grab_all_polarized_image(image_result)
-            image_display = PolarCam.append_images_to_panel(image_polarized_i0, image_polarized_i45, image_polarized_i90, image_polarized_i135, image_dolp, image_deglared)
-        
+            image_polarized_i0, image_polarized_i45, image_polarized_i90, image_polarized_i135, image_dolp, image_deglared = self.polar_cam.grab_all_polarized_image(raw_image)
+
+            h, w = image_polarized_i0.shape
+            if len(panels) == 0 or panels[0].shape != (2*h, 3*w):
+                panels = [np.empty((2*h, 3*w), dtype=np.uint8) for _ in range(self.num_panel_buffers)]
+
+            image_display = PolarCamBase.append_images_to_panel(image_polarized_i0, image_polarized_i45, image_polarized_i90, image_polarized_i135, image_dolp, image_deglared, out=panels[panel_index])
+            panel_index = (panel_index + 1) % self.num_panel_buffers
+
             self.change_pixmap_signal.emit(image_display)
-        
+
+        self.engine.stop()
+        print('Acquisition stats: ', self.engine.stats())
+        self.engine = None
+
         # shut down capture system
         self.polar_cam.stop_acquisition()
 
@@ -136,7 +344,7 @@ class PolarCamMainApp(QtWidgets.QWidget):
         self.ui = Ui_PolarCam() #link to the UI class
         self.ui.setupUi(self)
 
-        self.polar_cam = PolarCam()
+        self.polar_cam = create_polar_cam()
 
         #define config variables
         self.imageParams = {}
@@ -153,10 +361,26 @@ class PolarCamMainApp(QtWidgets.QWidget):
         #create thread
         self.thread = VideoPreviewPolarCam(self.polar_cam)
         self.thread_sequence = VideoSequenceCapture(self.polar_cam, len(self.sequence))
+        self.thread_hdr = VideoHDRStream(self.polar_cam, self.sequence)
+        #whether the preview ran when the HDR stream started, it is restarted when the stream stops
+        self.preview_before_hdr = False
 
         # connect its signal to the update_image slot
         self.thread.change_pixmap_signal.connect(self.update_image)
         self.thread_sequence.change_pixmap_signal.connect(self.update_image_seq)
+        self.thread_hdr.change_pixmap_signal.connect(self.update_image_hdr)
+
+        #CRAFT runs off the GUI thread, see update_image
+        self.craft_worker = CraftInferenceWorker()
+        self.craft_worker.result_signal.connect(self.update_craft_result)
+        self.craft_worker.boxes_signal.connect(self.update_text_boxes)
+        self.craft_worker.start()
+
+        #uploads to the OCR reader run on the client threads, the server is set with OCR_SERVER_URL
+        self.ocr_client = OcrClient()
+
+        #captures are encoded and written on the writer threads, the preview never waits on the disk
+        self.image_writer = AsyncImageWriter()
 
         self.bCaptureImgFlag = False
         self.sequence_images = []
@@ -165,6 +389,11 @@ class PolarCamMainApp(QtWidgets.QWidget):
         self.last_deglared_image = np.zeros([])
         self.filtered_polarized_image = np.zeros([])
 
+        #word boxes (x, y, w, h) of filtered_polarized_image, only these regions are sent to OCR
+        self.filtered_text_boxes = np.zeros((0, 4), dtype=np.int32)
+        #ID of the last capture sent to the inference thread, boxes of older captures are ignored
+        self.capture_id = 0
+
     def closeEvent(self, event):
         reply = QMessageBox.question(self, 'Window Close', 'Are you sure you want to close the window?',
 				QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
@@ -177,6 +406,11 @@ class PolarCamMainApp(QtWidgets.QWidget):
 
         self.thread.stop()
         self.thread_sequence.stop()
+        self.thread_hdr.stop()
+        self.craft_worker.stop()
+        self.ocr_client.close(timeout=10.0)
+        self.image_writer.close()
+        print('Image writer: ', self.image_writer.metrics())
         self.polar_cam.release()
 
     def setupEventHandlers(self):
@@ -186,6 +420,7 @@ class PolarCamMainApp(QtWidgets.QWidget):
         self.ui.ConfigureSequenceBtn.clicked.connect(self.setupSequenceCapture)
         self.ui.startSequenceBtn.clicked.connect(self.startSequenceCapture)
         self.ui.resetSequenceBtn.clicked.connect(self.resetSequence)
+        self.ui.hdrStreamBtn.clicked.connect(self.toggleHDRStream)
         self.ui.saveSeqToFileBtn.clicked.connect(self.saveSequence)
         self.ui.sendImageToOCR_Btn.clicked.connect(self.clean_up_image)
 
@@ -322,6 +557,30 @@ class PolarCamMainApp(QtWidgets.QWidget):
         self.displayImageOnQLabel(cv_img)
         self.sequence_images = cv_img_seq
 
+    @pyqtSlot(np.ndarray)
+    def update_image_hdr(self, cv_img):
+        #display on label
+        self.displayImageOnQLabel(cv_img)
+
+    @pyqtSlot(np.ndarray)
+    def update_craft_result(self, heatmap_img):
+        self.last_deglared_image = heatmap_img
+
+    @pyqtSlot(int, np.ndarray, np.ndarray)
+    def update_text_boxes(self, capture_id, right_image, word_boxes):
+        #boxes of a capture taken before the last one, clean_up_image already uses the newer image
+        if capture_id != self.capture_id:
+            return
+
+        #CRAFT ran on the whole right panel, keep its bottom half and move the boxes into it
+        top = right_image.shape[0] // 2
+        boxes = word_boxes[word_boxes[:, 1] + word_boxes[:, 3] > top].copy()
+        boxes[:, 3] -= np.maximum(0, top - boxes[:, 1])
+        boxes[:, 1] = np.maximum(0, boxes[:, 1] - top)
+
+        self.filtered_polarized_image = right_image[top:].copy()
+        self.filtered_text_boxes = boxes
+
     @pyqtSlot(np.ndarray)
     def update_image(self, cv_img):
         #display on label
@@ -332,24 +591,29 @@ class PolarCamMainApp(QtWidgets.QWidget):
         if self.bCaptureImgFlag:
             #extract first 4 quarter.     
             
-            #run through text loss
+            #run through text loss on the inference thread, the heatmap arrives in update_craft_result and
+            #the boxes, with the image they were found in, in update_text_boxes. Until then the whole image is sent
+            self.capture_id += 1
             self.filtered_polarized_image = right_image[h//2:h, 0:w].copy()
-            self.last_deglared_image = craft_text_characters(right_image)
+            self.filtered_text_boxes = np.zeros((0, 4), dtype=np.int32)
+            self.craft_worker.submit(right_image.copy(), self.capture_id)
 
             #output_img = cv_img[0:h, 0:(2*w)//3]
             #save_image_to_folder(output_img)
 
-            save_image_to_folder(cv_img)
+            #cv_img is a preview panel the preview thread reuses, the writer queues a copy of it
+            save_image_to_folder(cv_img, self.image_writer)
 
             self.bCaptureImgFlag = False
         
         self.drawTextOnImage(right_image, "Original", origin=(100, h//2 - 30), font = cv2.FONT_HERSHEY_SIMPLEX, fontScale=3, color=(255, 0, 0), thickness=2)
         self.drawTextOnImage(right_image, "Deglare", origin=(100, h - 30), font = cv2.FONT_HERSHEY_SIMPLEX, fontScale=3, color=(255, 0, 0), thickness=2)
 
-        if not self.bDisplayCapture:
+        #until the first heatmap comes back from the inference thread, keep showing the live image
+        if not self.bDisplayCapture or self.last_deglared_image.ndim < 2:
             self.displayImageOnQLabel(right_image)
         else:
-            self.displayImageOnQLabel(self.last_deglared_image) #run through craft model GPU
+            self.displayImageOnQLabel(self.last_deglared_image)
 
     def drawTextOnImage(self, input_img, text_str: str, origin: tuple, font, fontScale, color, thickness):
 
@@ -366,9 +630,6 @@ class PolarCamMainApp(QtWidgets.QWidget):
 
         print('Performing cleanup')
 
-        #convert self.last_deglared_image to byte array
-        #send to flask endpoint for image cleanup. Pack image to byte array and send. 
-
         print(self.filtered_polarized_image.shape)
         h, w = self.filtered_polarized_image.shape
 
@@ -376,20 +637,22 @@ class PolarCamMainApp(QtWidgets.QWidget):
         tile_grid_size_1 = (20, 20)
         clahe_1 = clahe(self.filtered_polarized_image, clip_limit_1, tile_grid_size_1)
 
-        #save image to file. To be tested.. 
-        cv2.imwrite(os.path.join(topSrcFolder, 'tmp/tempImg.png'), clahe_1)
-
-        files = {
-            'file': open(os.path.join(topSrcFolder, 'tmp/tempImg.png'), 'rb')
-        }
-
-        response = requests.post('http://192.168.1.101:8080/', files=files) 
+        #only the text regions found by CRAFT are encoded, in memory, and sent. The whole image when none were found
+        print('Sending {} text regions'.format(len(self.filtered_text_boxes)))
+        if not self.ocr_client.submit(clahe_1, self.filtered_text_boxes, callback=self.on_ocr_response, error_callback=self.on_ocr_error):
+            print('[Error] OCR upload queue full, image not sent')
 
+    def on_ocr_response(self, response):
+        #called on an OCR client thread
         if response.status_code == 200: 
             print('[Info] Sent Deglared image to OCR Reader Success ')
         else:
             print('[Error] Failed to send request. Error Code: ', response.status_code)
 
+    def on_ocr_error(self, ex):
+        #called on an OCR client thread
+        print('[Error] Failed to send request: ', ex)
+
 
     def setSliderBar(self, slider_type, min_val, max_val, single_step):
         if slider_type == 'gain':
@@ -414,6 +677,22 @@ class PolarCamMainApp(QtWidgets.QWidget):
         self.polar_cam.configure_image_sequence(self.sequence)
         self.thread_sequence.start()
 
+    def toggleHDRStream(self):
+        if self.thread_hdr.isRunning():
+            self.thread_hdr.stop()
+            #back to a single exposure, then resume the preview the HDR stream took the camera from
+            self.polar_cam.reset_sequencer()
+            if self.preview_before_hdr:
+                self.thread.start()
+            self.ui.hdrStreamBtn.setText('Start HDR Stream')
+            return
+
+        #the preview and the HDR stream cannot share the camera
+        self.preview_before_hdr = self.thread.isRunning()
+        self.thread.stop()
+        self.thread_hdr.start()
+        self.ui.hdrStreamBtn.setText('Stop HDR Stream')
+
     def resetSequence(self):
         #return camera back to auto gain and auto exposure
         self.polar_cam.reset_sequencer()
@@ -421,7 +700,7 @@ class PolarCamMainApp(QtWidgets.QWidget):
     def saveSequence(self):
         fused_img = exposureFusion(self.sequence_images)
         self.sequence_images.append(fused_img)
-        save_images_to_folder(self.sequence_images)
+        save_images_to_folder(self.sequence_images, self.image_writer)
     
     def displayCaptureStateChanged(self):
         self.bDisplayCapture = self.ui.view_captureCheckBox.isChecked()
@@ -69,6 +69,10 @@ class Ui_PolarCam(object):
         self.resetSequenceBtn.setEnabled(False)
         self.resetSequenceBtn.setGeometry(QtCore.QRect(10, 130, 171, 25))
         self.resetSequenceBtn.setObjectName("resetSequenceBtn")
+        self.hdrStreamBtn = QtWidgets.QPushButton(self.frame)
+        self.hdrStreamBtn.setEnabled(False)
+        self.hdrStreamBtn.setGeometry(QtCore.QRect(10, 160, 171, 25))
+        self.hdrStreamBtn.setObjectName("hdrStreamBtn")
         self.captureSeqBtn = QtWidgets.QPushButton(self.frame)
         self.captureSeqBtn.setEnabled(False)
         self.captureSeqBtn.setGeometry(QtCore.QRect(10, 190, 171, 25))
@@ -156,6 +160,7 @@ class Ui_PolarCam(object):
         self.ConfigureSequenceBtn.setText(_translate("PolarCam", "Configure Sequence"))
         self.startSequenceBtn.setText(_translate("PolarCam", "Start Sequence Mode"))
         self.resetSequenceBtn.setText(_translate("PolarCam", "Reset Sequence"))
+        self.hdrStreamBtn.setText(_translate("PolarCam", "Start HDR Stream"))
         self.captureSeqBtn.setText(_translate("PolarCam", "Capture"))
         self.viewCaptureSeqBtn.setText(_translate("PolarCam", "View Capture Sequence"))
         self.SequenceModeLabel.setText(_translate("PolarCam", "Sequence Mode"))
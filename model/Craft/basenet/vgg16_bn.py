@@ -21,7 +21,8 @@ def init_weights(modules):
 class vgg16_bn(torch.nn.Module):
     def __init__(self, pretrained=True, freeze=True):
         super(vgg16_bn, self).__init__()
-        vgg_pretrained_features = models.vgg16_bn(weights='IMAGENET1K_V1').features
+        #without pretrained the ImageNet weights would be overwritten anyway, e.g. by a full CRAFT state dict, skip the download and load
+        vgg_pretrained_features = models.vgg16_bn(weights='IMAGENET1K_V1' if pretrained else None).features
         self.slice1 = torch.nn.Sequential()
         self.slice2 = torch.nn.Sequential()
         self.slice3 = torch.nn.Sequential()
@@ -28,6 +28,8 @@ import torch.nn as nn
 import torch.nn.functional as F
 from torchvision import transforms
 import math 
+import copy
+import sys
 
 from .basenet.vgg16_bn import vgg16_bn, init_weights
 from collections import OrderedDict
@@ -92,13 +94,17 @@ class CRAFT(nn.Module):
         self.basenet.eval()
         self.basenet.requires_grad_(False)
 
+        #channels of the input the basenet takes, 1 once folded. A plain attribute, the basenet is
+        #no longer indexable once quantized
+        self.in_channels = 3
+
             
     def forward(self, x):
         """ Base network """
 
         x_in = None
-        #check if x channels is equal to 1 (grayscale), duplicate across channel. 
-        if x.shape[1] == 1:
+        #check if x channels is equal to 1 (grayscale), duplicate across channel. Not needed once folded, see fold_grayscale_input
+        if x.shape[1] == 1 and self.in_channels == 3:
             #duplicate tensor across channel
             x_in = x.repeat(1, 3, 1, 1)
         else:
@@ -126,8 +132,58 @@ class CRAFT(nn.Module):
 
         return y.permute(0,2,3,1), feature
 
+def fold_grayscale_input(model):
+    """Returns a copy of model taking 1 channel input directly
+
+    Feeding a grayscale image repeated over 3 channels to the first conv equals feeding the image
+    once to a conv whose weights are summed over the input channels. The copy skips the repeat,
+    a third of the input memory and first layer compute.
+    """
+    folded = copy.deepcopy(model)
+
+    first_conv = folded.basenet.slice1[0]
+    single_conv = nn.Conv2d(1, first_conv.out_channels, kernel_size=first_conv.kernel_size, stride=first_conv.stride,
+                            padding=first_conv.padding, dilation=first_conv.dilation, bias=first_conv.bias is not None)
+    with torch.no_grad():
+        single_conv.weight.copy_(first_conv.weight.sum(dim=1, keepdim=True))
+        if first_conv.bias is not None:
+            single_conv.bias.copy_(first_conv.bias)
+    single_conv.weight.requires_grad_(first_conv.weight.requires_grad)
+    if first_conv.bias is not None:
+        single_conv.bias.requires_grad_(first_conv.bias.requires_grad)
+
+    folded.basenet.slice1[0] = single_conv.to(first_conv.weight.device)
+    folded.in_channels = 1
+
+    return folded
+
+def check_grayscale_fold(model, height=96, width=128, batch_size=2, atol=1e-4):
+    """Numerical equivalence of fold_grayscale_input against the repeat path of model
+
+    Returns:
+        tuple: (passed, largest absolute difference of the score maps)
+    """
+    folded = fold_grayscale_input(model).eval()
+    model_device = next(model.parameters()).device
+    x = torch.randn(batch_size, 1, height, width, device=model_device)
+
+    was_training = model.training
+    model.eval()
+    with torch.no_grad():
+        reference, _ = model(x)
+        output, _ = folded(x)
+    model.train(was_training)
+
+    max_abs_diff = (reference - output).abs().max().item()
+
+    return max_abs_diff <= atol, max_abs_diff
+
 if __name__ == '__main__':
-    model = CRAFT(pretrained=True).cuda()
-    output, _ = model(torch.randn(1, 3, 768, 768).cuda())
-    print(output.shape)
+    #check of fold_grayscale_input against the repeat path, on random weights. From the root folder:
+    #   python -m model.Craft.craft
+    torch.manual_seed(0)
+    model = CRAFT(pretrained=False)
+    passed, max_abs_diff = check_grayscale_fold(model)
+    print('Grayscale fold max abs difference {:.3e}: {}'.format(max_abs_diff, 'ok' if passed else 'FAILED'))
+    sys.exit(0 if passed else 1)
 
@@ -0,0 +1,163 @@
+import argparse
+import os, sys
+import time
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+
+#Export CRAFT to a frozen TorchScript module and an ONNX graph.
+#
+#Run from the root folder:
+#
+#   python -m model.Craft.exportCraft --benchmark
+#
+#By default the graphs take 1xHxW grayscale input, with the grayscale repeat folded into the
+#first conv (see fold_grayscale_input). Use --rgb to export the 3 channel graph. The graphs
+#output the region / affinity score maps only, as (batch, height/2, width/2, 2).
+#enhancement.textLossDisplay loads them with backend='torchscript' or backend='onnx'.
+
+topSrcFolder = str(Path(os.path.dirname(os.path.abspath(__file__))).parents[1])
+sys.path.append(topSrcFolder)
+
+from model.Craft.craft import CRAFT, copyStateDict, fold_grayscale_input
+
+
+class CraftScoreMaps(nn.Module):
+    """CRAFT without the feature output, the only output the exported graphs need
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        y, _ = self.model(x)
+        return y
+
+
+def load_craft(weights_path, grayscale=True):
+    """Float32 CPU CRAFT in eval mode, folded for 1 channel input when grayscale
+    """
+    model = CRAFT(pretrained=False, freeze=True)
+    model.load_state_dict(copyStateDict(torch.load(weights_path, map_location='cpu')))
+    model.eval()
+
+    if grayscale:
+        model = fold_grayscale_input(model)
+
+    return model
+
+
+def export_torchscript(model, path, example_input):
+    """Trace, freeze and save model
+    """
+    with torch.no_grad():
+        traced = torch.jit.trace(CraftScoreMaps(model).eval(), example_input)
+    frozen = torch.jit.freeze(traced)
+    frozen.save(path)
+
+    return path
+
+
+def export_onnx(model, path, example_input, opset_version=None):
+    """Export model to ONNX with dynamic batch, height and width
+
+    Args:
+        opset_version (int, optional): ONNX opset, the exporter default when None. Defaults to None.
+    """
+    kwargs = {} if opset_version is None else {'opset_version': opset_version}
+
+    with torch.no_grad():
+        torch.onnx.export(CraftScoreMaps(model).eval(), (example_input,), path,
+                          input_names=['image'], output_names=['score_maps'],
+                          dynamic_axes={'image': {0: 'batch', 2: 'height', 3: 'width'},
+                                        'score_maps': {0: 'batch', 1: 'map_height', 2: 'map_width'}},
+                          **kwargs)
+
+    return path
+
+
+def benchmark(weights_path, torchscript_path, onnx_path, grayscale=True, height=768, width=768, iterations=5):
+    """Print the load time and latency of the eager model and of the exported graphs
+    """
+    from enhancement.textLossDisplay import load_exported_craft_model
+
+    channels = 1 if grayscale else 3
+    example_input = torch.randn(1, channels, height, width)
+
+    loaders = [('eager', lambda: load_craft(weights_path, grayscale))]
+    if torchscript_path is not None and os.path.exists(torchscript_path):
+        loaders.append(('torchscript', lambda: load_exported_craft_model(torchscript_path)))
+    if onnx_path is not None and os.path.exists(onnx_path):
+        loaders.append(('onnxruntime', lambda: load_exported_craft_model(onnx_path)))
+
+    print('CRAFT runtime benchmark, {}x{}x{} input, {} iterations'.format(channels, height, width, iterations))
+    for name, loader in loaders:
+        try:
+            start = time.perf_counter()
+            craft_model = loader()
+            startup_ms = (time.perf_counter() - start) * 1000.0
+        except ImportError as ex:
+            print('{:<12s} unavailable: {}'.format(name, ex))
+            continue
+
+        with torch.no_grad():
+            #warm up, the first run of a graph also optimizes it
+            start = time.perf_counter()
+            craft_model(example_input)
+            first_ms = (time.perf_counter() - start) * 1000.0
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                craft_model(example_input)
+            latency_ms = (time.perf_counter() - start) * 1000.0 / iterations
+
+        print('{:<12s} startup {:8.1f} ms  first run {:8.1f} ms  latency {:8.1f} ms'.format(name, startup_ms, first_ms, latency_ms))
+
+
+def main():
+    default_weights = os.path.join(topSrcFolder, 'pretrained_models/craft/craft_mlt_25k.pth')
+
+    parser = argparse.ArgumentParser(description='Export CRAFT to TorchScript and ONNX')
+    parser.add_argument('--weights', default=default_weights, help='CRAFT state dict')
+    parser.add_argument('--out-dir', default=None, help='output folder, next to the weights when not given')
+    parser.add_argument('--rgb', action='store_true', help='export the 3 channel graph instead of the folded grayscale one')
+    parser.add_argument('--height', type=int, default=768, help='height of the tracing / benchmark input')
+    parser.add_argument('--width', type=int, default=768, help='width of the tracing / benchmark input')
+    parser.add_argument('--opset', type=int, default=None, help='ONNX opset, the exporter default when not given')
+    parser.add_argument('--skip-onnx', action='store_true', help='only export TorchScript')
+    parser.add_argument('--benchmark', action='store_true', help='compare the exported graphs with eager mode after exporting')
+    args = parser.parse_args()
+
+    grayscale = not args.rgb
+    out_dir = args.out_dir if args.out_dir is not None else os.path.dirname(args.weights)
+    os.makedirs(out_dir, exist_ok=True)
+
+    #same naming as the default paths of enhancement.textLossDisplay.get_craft_model
+    stem = os.path.splitext(os.path.basename(args.weights))[0]
+    torchscript_path = os.path.join(out_dir, stem + '_script.pt')
+    onnx_path = os.path.join(out_dir, stem + '.onnx')
+
+    model = load_craft(args.weights, grayscale)
+    example_input = torch.randn(1, 1 if grayscale else 3, args.height, args.width)
+
+    print('Exporting TorchScript to {}'.format(torchscript_path))
+    export_torchscript(model, torchscript_path, example_input)
+
+    if not args.skip_onnx:
+        print('Exporting ONNX to {}'.format(onnx_path))
+        try:
+            export_onnx(model, onnx_path, example_input, args.opset)
+        except Exception as ex:
+            print('Error: {} exporting ONNX'.format(ex))
+            onnx_path = None
+    else:
+        onnx_path = None
+
+    if args.benchmark:
+        benchmark(args.weights, torchscript_path, onnx_path, grayscale, args.height, args.width)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,13 @@ import cv2
 from datetime import datetime
 
 
-def save_images_to_folder(input_image_np: list):
+def save_images_to_folder(input_image_np: list, writer=None):
+    """Save a sequence of images in a new timestamped folder
+
+    Args:
+        input_image_np (list): images to save
+        writer (AsyncImageWriter, optional): queue copies of the images on writer instead of writing them here. Defaults to None.
+    """
     #generate directory based on timestamp
 
     #now = datetime.now() # current date and time
@@ -15,15 +21,31 @@ def save_images_to_folder(input_image_np: list):
 
     #save each individual image
     for index, image in enumerate(input_image_np):
-        cv2.imwrite(output_folder+'/image_' + str(index) + '.png', image) 
-
-def save_image_to_folder(input_image_np):
+        path_stem = output_folder+'/image_' + str(index)
+        if writer is not None:
+            if writer.write(image, path_stem) is None:
+                print('Error: writer queue full, dropped ', path_stem)
+        else:
+            cv2.imwrite(path_stem + '.png', image)
+
+def save_image_to_folder(input_image_np, writer=None):
+    """Save an image in the folder of the day
+
+    Args:
+        input_image_np (np.ndarray): image to save
+        writer (AsyncImageWriter, optional): queue a copy of the image on writer instead of writing it here. Defaults to None.
+    """
     output_folder = os.path.join('output', generate_date_for_output_folder())
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
     print('saving image in folder: ', output_folder)
-    cv2.imwrite(output_folder+'/image_' + generate_timestamp_for_image() + '.png', input_image_np)
+    path_stem = output_folder+'/image_' + generate_timestamp_for_image()
+    if writer is not None:
+        if writer.write(input_image_np, path_stem) is None:
+            print('Error: writer queue full, dropped ', path_stem)
+    else:
+        cv2.imwrite(path_stem + '.png', input_image_np)
 
 def generate_date_for_output_folder():
     now = datetime.now() # current date and time
@@ -33,6 +55,7 @@ def generate_date_for_output_folder():
 
 def generate_timestamp_for_image():
     now = datetime.now() # current date and time
-    date_time = now.strftime("%m_%d_%Y__%H-%M-%S")
+    #microseconds, captures less than a second apart must not overwrite each other
+    date_time = now.strftime("%m_%d_%Y__%H-%M-%S-%f")
 
-    return date_time
\ No newline at end of file
+    return date_time
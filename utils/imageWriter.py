@@ -0,0 +1,235 @@
+import io
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+#Asynchronous image writer.
+#
+#Encoding and disk I/O run on a pool of writer threads (cv2 releases the GIL while encoding),
+#fed by a bounded queue, so that capturing never waits on the disk. Codecs:
+#
+#   png     PNG, level is the zlib compression 0-9. Defaults to 1, most of the size win for a fraction of the time
+#   webp    lossless WebP, the smallest files but by far the slowest to encode
+#   tiff    TIFF, level is the libtiff compression scheme: 1 none, 5 LZW, 8 deflate. Defaults to 5
+#   raw     numpy .npy, no encoding at all
+#
+#Run from the root folder to compare the codecs: python -m utils.imageWriter
+
+CODECS = ('png', 'webp', 'tiff', 'raw')
+
+_EXTENSIONS = {'png': '.png', 'webp': '.webp', 'tiff': '.tiff', 'raw': '.npy'}
+
+
+def _encode_params(codec, level):
+    if codec == 'png':
+        return [cv2.IMWRITE_PNG_COMPRESSION, 1 if level is None else level]
+    if codec == 'webp':
+        #quality above 100 selects lossless
+        return [cv2.IMWRITE_WEBP_QUALITY, 101]
+    if codec == 'tiff':
+        return [cv2.IMWRITE_TIFF_COMPRESSION, 5 if level is None else level]
+
+    raise ValueError('Unknown codec {}, expected one of {}'.format(codec, CODECS))
+
+
+def encode_image_file(image, codec='png', level=None) -> bytes:
+    """Encode image in memory as the contents of a codec file
+    """
+    if codec == 'raw':
+        buffer = io.BytesIO()
+        np.save(buffer, image)
+        return buffer.getvalue()
+
+    ok, buffer = cv2.imencode(_EXTENSIONS[codec], image, _encode_params(codec, level))
+    if not ok:
+        raise ValueError('Could not encode image as {}'.format(codec))
+
+    return buffer.tobytes()
+
+
+def join_queue(pending, timeout=None) -> bool:
+    """Wait until every item put on the queue.Queue pending is marked done, returns False on timeout
+    """
+    if timeout is None:
+        pending.join()
+        return True
+
+    #Queue.join has no timeout, wait on the condition it notifies once the last task is done
+    deadline = time.perf_counter() + timeout
+    with pending.all_tasks_done:
+        while pending.unfinished_tasks > 0:
+            remaining_s = deadline - time.perf_counter()
+            if remaining_s <= 0:
+                return False
+            pending.all_tasks_done.wait(remaining_s)
+
+    return True
+
+
+class AsyncImageWriter:
+    """Writes images to disk from a pool of threads
+
+    Args:
+        codec (str, optional): one of CODECS. Defaults to 'png'.
+        level (int, optional): codec compression level, see the codec table above. Defaults to None.
+        num_workers (int, optional): writer threads. Defaults to 2.
+        max_pending (int, optional): images waiting to be written before write() refuses or blocks. Defaults to 64.
+        block (bool, optional): block write() while the queue is full instead of dropping the image. Defaults to False.
+    """
+
+    def __init__(self, codec='png', level=None, num_workers=2, max_pending=64, block=False):
+        if codec not in CODECS:
+            raise ValueError('Unknown codec {}, expected one of {}'.format(codec, CODECS))
+
+        self.codec = codec
+        self.level = level
+        self.block = block
+        self.extension = _EXTENSIONS[codec]
+
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.num_written = 0
+        self.num_dropped = 0
+        self.num_failed = 0
+        self.bytes_written = 0
+        self.busy_s = 0.0
+        self._start_time = time.perf_counter()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(num_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def write(self, image, path_stem, copy=True):
+        """Queue image to be written to path_stem + the codec extension
+
+        Args:
+            image (np.ndarray): image to write
+            path_stem (str): file path without extension
+            copy (bool, optional): queue a copy of image. Pass False only when the caller owns image and
+                                   never modifies it afterwards, e.g. not a reused preview panel. Defaults to True.
+
+        Returns:
+            str: the file path, None when the image was dropped because the queue was full
+        """
+        if self._closed.is_set():
+            raise RuntimeError('AsyncImageWriter is closed')
+
+        path = path_stem + self.extension
+        if copy:
+            #the encode runs later on a worker, the caller may reuse its buffer meanwhile
+            image = image.copy()
+        try:
+            self.pending.put((image, path), block=self.block)
+        except queue.Full:
+            with self._lock:
+                self.num_dropped += 1
+            return None
+
+        return path
+
+    def flush(self, timeout=None) -> bool:
+        """Wait until every queued image is on disk, returns False on timeout
+        """
+        return join_queue(self.pending, timeout)
+
+    def close(self, timeout=None):
+        """Write what is queued, then stop the workers
+        """
+        self.flush(timeout)
+        self._closed.set()
+        for worker in self._workers:
+            worker.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def metrics(self) -> dict:
+        """Throughput since the writer started
+
+        Returns:
+            dict: written, dropped, failed, pending, frames_per_s, mb_per_s and
+                  ms_per_frame, the encode + write time of one image on one worker
+        """
+        with self._lock:
+            elapsed_s = max(time.perf_counter() - self._start_time, 1e-9)
+            return {'written': self.num_written,
+                    'dropped': self.num_dropped,
+                    'failed': self.num_failed,
+                    'pending': self.pending.qsize(),
+                    'frames_per_s': self.num_written / elapsed_s,
+                    'mb_per_s': self.bytes_written / elapsed_s / 1e6,
+                    'ms_per_frame': self.busy_s * 1000.0 / max(self.num_written, 1)}
+
+    def _work(self):
+        while not self._closed.is_set():
+            try:
+                image, path = self.pending.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            try:
+                start = time.perf_counter()
+                data = encode_image_file(image, self.codec, self.level)
+                with open(path, 'wb') as file:
+                    file.write(data)
+                busy_s = time.perf_counter() - start
+
+                with self._lock:
+                    self.num_written += 1
+                    self.bytes_written += len(data)
+                    self.busy_s += busy_s
+            except Exception as ex:
+                with self._lock:
+                    self.num_failed += 1
+                print('Error: {} writing {}'.format(ex, path))
+            finally:
+                self.pending.task_done()
+
+
+def benchmark(num_frames=16, height=2048, width=2448, num_workers=2):
+    """Compare blocking cv2.imwrite with AsyncImageWriter for every codec on camera sized frames
+    """
+    rng = np.random.default_rng(0)
+    #smooth scene plus sensor noise, compresses like a capture rather than like pure noise
+    scene = cv2.resize(rng.integers(0, 256, (height // 64, width // 64), dtype=np.uint8), (width, height), interpolation=cv2.INTER_CUBIC)
+    frames = [np.clip(scene + rng.normal(0, 3, scene.shape), 0, 255).astype(np.uint8) for _ in range(4)]
+
+    out_dir = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        for index in range(num_frames):
+            cv2.imwrite(os.path.join(out_dir, 'sync_{}.png'.format(index)), frames[index % len(frames)])
+        sync_ms = (time.perf_counter() - start) * 1000.0 / num_frames
+
+        print('Image writer benchmark, {} frames of {}x{}, {} workers'.format(num_frames, width, height, num_workers))
+        print('{:<18s} blocks the caller {:8.2f} ms/frame'.format('cv2.imwrite png', sync_ms))
+
+        for codec in CODECS:
+            with AsyncImageWriter(codec, num_workers=num_workers, max_pending=num_frames) as writer:
+                submit_s = 0.0
+                for index in range(num_frames):
+                    start = time.perf_counter()
+                    writer.write(frames[index % len(frames)], os.path.join(out_dir, '{}_{}'.format(codec, index)))
+                    submit_s += time.perf_counter() - start
+                writer.flush()
+                metrics = writer.metrics()
+
+            print('{:<18s} blocks the caller {:8.3f} ms/frame  {:6.1f} frames/s  {:7.1f} MB/s  {:5.1f} MB/frame'.format(
+                'async ' + codec, submit_s * 1000.0 / num_frames, metrics['frames_per_s'], metrics['mb_per_s'],
+                metrics['mb_per_s'] / max(metrics['frames_per_s'], 1e-9)))
+    finally:
+        shutil.rmtree(out_dir)
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,191 @@
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.imageWriter import join_queue
+from utils.ocrUpload import post_text_regions, StandInOcrServer, make_synthetic_label
+
+#Asynchronous OCR client.
+#
+#Captures are submitted to a bounded queue and posted by worker threads, each holding a
+#keep-alive requests.Session, so that the GUI thread never waits on the network. Failed posts
+#(connection errors, timeouts, 5xx answers) are retried with exponential backoff. The outcome of
+#every submission comes back through its callbacks, called on a worker thread. An exception raised
+#by a callback is printed, the worker carries on.
+#
+#The server is taken from the OCR_SERVER_URL environment variable. Run the throughput benchmark
+#from the root folder with:
+#
+#   python -m utils.ocrClient
+
+OCR_SERVER_URL = os.environ.get('OCR_SERVER_URL', 'http://192.168.1.101:8080/')
+
+
+class OcrClient:
+    """Posts images, or their text regions, to the OCR server from a pool of worker threads
+
+    Args:
+        url (str, optional): OCR server, OCR_SERVER_URL when None. Defaults to None.
+        num_workers (int, optional): worker threads, one keep-alive connection each. Defaults to 2.
+        max_pending (int, optional): submissions waiting for a worker before submit() refuses more. Defaults to 16.
+        timeout (float, optional): seconds per request. Defaults to 10.0.
+        max_retries (int, optional): retries of a failed post. Defaults to 3.
+        backoff_s (float, optional): wait before the first retry, doubled at every retry. Defaults to 0.25.
+    """
+
+    def __init__(self, url=None, num_workers=2, max_pending=16, timeout=10.0, max_retries=3, backoff_s=0.25):
+        self.url = url if url is not None else OCR_SERVER_URL
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.num_sent = 0
+        self.num_failed = 0
+        self.num_retries = 0
+        self.num_rejected = 0
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(num_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, image, boxes=None, callback=None, error_callback=None, padding=4, ext='.png') -> bool:
+        """Queue image for upload without blocking
+
+        Args:
+            image (np.ndarray): image to send
+            boxes (np.ndarray, optional): (x, y, w, h) text regions to send instead of the whole image. Defaults to None.
+            callback (callable, optional): called with the requests.Response once the server answered 2xx/4xx. Defaults to None.
+            error_callback (callable, optional): called with the last exception once all retries failed. Defaults to None.
+
+        Returns:
+            bool: False when the queue is full or the client closed, the image is not sent
+        """
+        if self._closed.is_set():
+            return False
+
+        if boxes is None:
+            boxes = np.zeros((0, 4), dtype=np.int32)
+
+        try:
+            self.pending.put_nowait((image, boxes, padding, ext, callback, error_callback))
+        except queue.Full:
+            with self._lock:
+                self.num_rejected += 1
+            return False
+
+        return True
+
+    def flush(self, timeout=None) -> bool:
+        """Wait until every submission was sent or failed, returns False on timeout
+        """
+        return join_queue(self.pending, timeout)
+
+    def close(self, timeout=None):
+        """Send what is queued, then stop the workers
+        """
+        self.flush(timeout)
+        self._closed.set()
+        for worker in self._workers:
+            worker.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _post(self, session, image, boxes, padding, ext):
+        delay_s = self.backoff_s
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = post_text_regions(self.url, image, boxes, padding, ext, self.timeout, session)
+                if response.status_code < 500:
+                    return response
+                error = requests.HTTPError('Server error {}'.format(response.status_code), response=response)
+            except (requests.ConnectionError, requests.Timeout) as ex:
+                error = ex
+
+            if attempt == self.max_retries or self._closed.is_set():
+                raise error
+
+            with self._lock:
+                self.num_retries += 1
+            time.sleep(delay_s)
+            delay_s *= 2
+
+    def _work(self):
+        with requests.Session() as session:
+            session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+            while not self._closed.is_set():
+                try:
+                    image, boxes, padding, ext, callback, error_callback = self.pending.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+
+                try:
+                    response = self._post(session, image, boxes, padding, ext)
+                except Exception as ex:
+                    with self._lock:
+                        self.num_failed += 1
+                    if error_callback is not None:
+                        self._call(error_callback, ex)
+                    else:
+                        print('Error: {} sending image to OCR'.format(ex))
+                else:
+                    with self._lock:
+                        self.num_sent += 1
+                    if callback is not None:
+                        self._call(callback, response)
+                finally:
+                    self.pending.task_done()
+
+    @staticmethod
+    def _call(callback, argument):
+        #an exception of a user callback must not end the worker, flush() would then wait forever
+        try:
+            callback(argument)
+        except Exception as ex:
+            print('Error: {} in OCR callback {}'.format(ex, getattr(callback, '__name__', callback)))
+
+
+def benchmark(num_requests=64, delay_s=0.02, worker_counts=(1, 2, 4, 8)):
+    """Throughput of blocking posts and of OcrClient against the stand-in server
+
+    delay_s is the server time per request, a stand-in for the OCR reader.
+    """
+    image, boxes = make_synthetic_label()
+
+    print('OCR upload benchmark, {} requests, {:.0f} ms server delay'.format(num_requests, delay_s * 1000.0))
+    with StandInOcrServer(delay_s=delay_s) as server:
+        #the previous clean_up_image: a new connection and a blocking post per capture
+        start = time.perf_counter()
+        for _ in range(num_requests):
+            post_text_regions(server.url, image, boxes, timeout=10.0)
+        elapsed_s = time.perf_counter() - start
+        print('{:<24s} {:8.1f} req/s  blocks the caller {:6.1f} ms/req'.format('blocking post', num_requests / elapsed_s, elapsed_s * 1000.0 / num_requests))
+
+        for num_workers in worker_counts:
+            with OcrClient(server.url, num_workers=num_workers, max_pending=num_requests) as client:
+                start = time.perf_counter()
+                for _ in range(num_requests):
+                    client.submit(image, boxes)
+                submit_s = time.perf_counter() - start
+                client.flush()
+                elapsed_s = time.perf_counter() - start
+
+            print('{:<24s} {:8.1f} req/s  blocks the caller {:6.3f} ms/req'.format('OcrClient {} workers'.format(num_workers),
+                                                                                  num_requests / elapsed_s, submit_s * 1000.0 / num_requests))
+
+
+if __name__ == '__main__':
+    benchmark()
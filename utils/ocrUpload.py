@@ -0,0 +1,206 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from email.parser import BytesParser
+from email.policy import default as default_policy
+
+import cv2
+import numpy as np
+import requests
+
+#Region of interest OCR upload.
+#
+#Instead of a full image, only the detected text regions are cropped, encoded in memory and sent
+#as the parts of one multipart request:
+#
+#   file                  the first crop, or the whole image when there is no box. The field the
+#                         OCR server always read, a server unaware of regions keeps working
+#   file_1, file_2, ...   the other crops, added
+#   boxes                 JSON list of the [x, y, w, h] of every crop in the source image, added
+#
+#StandInOcrServer accepts the same requests on localhost, for testing without the OCR reader.
+
+
+def crop_text_regions(image, boxes, padding=4) -> tuple:
+    """Crop the text boxes out of image
+
+    Args:
+        image (np.ndarray): source image
+        boxes (np.ndarray): (x, y, w, h) rows, e.g. word boxes from extract_text_boxes
+        padding (int, optional): pixels added around every box. Defaults to 4.
+
+    Returns:
+        tuple: (crops, clipped boxes), crops are views into image
+    """
+    height, width = image.shape[:2]
+
+    crops = []
+    clipped_boxes = []
+    for x, y, w, h in np.asarray(boxes).reshape(-1, 4):
+        x0 = max(0, int(x) - padding)
+        y0 = max(0, int(y) - padding)
+        x1 = min(width, int(x + w) + padding)
+        y1 = min(height, int(y + h) + padding)
+        if x1 <= x0 or y1 <= y0:
+            continue
+
+        crops.append(image[y0:y1, x0:x1])
+        clipped_boxes.append([x0, y0, x1 - x0, y1 - y0])
+
+    return crops, clipped_boxes
+
+
+def encode_image(image, ext='.png') -> bytes:
+    """Encode image in memory, no temporary file
+    """
+    ok, buffer = cv2.imencode(ext, image)
+    if not ok:
+        raise ValueError('Could not encode image as {}'.format(ext))
+
+    return buffer.tobytes()
+
+
+def build_region_request(image, boxes, padding=4, ext='.png') -> tuple:
+    """Multipart files and form data of one request holding every text region of image
+
+    Returns:
+        tuple: (files, data) to pass to requests.post
+    """
+    crops, clipped_boxes = crop_text_regions(image, boxes, padding)
+
+    mime_type = 'image/' + ext.lstrip('.').replace('jpg', 'jpeg')
+    files = [('file' if index == 0 else 'file_{}'.format(index), ('region_{}{}'.format(index, ext), encode_image(crop, ext), mime_type))
+             for index, crop in enumerate(crops)]
+    data = {'boxes': json.dumps(clipped_boxes)}
+
+    return files, data
+
+
+def post_text_regions(url, image, boxes, padding=4, ext='.png', timeout=10.0, session=None):
+    """Send the text regions of image to the OCR server in one request
+
+    Falls back to the whole image, as the single file part, when there is no box.
+
+    Returns:
+        requests.Response: the server response
+    """
+    if len(boxes) == 0:
+        height, width = image.shape[:2]
+        boxes = [[0, 0, width, height]]
+        padding = 0
+
+    files, data = build_region_request(image, boxes, padding, ext)
+
+    poster = session if session is not None else requests
+    return poster.post(url, files=files, data=data, timeout=timeout)
+
+
+class StandInOcrServer:
+    """Local HTTP server accepting the region requests, to measure uploads without the OCR reader
+
+    Every request is answered with JSON {"regions": number of file parts}. The totals of the
+    requests received are kept in num_requests, num_regions and num_bytes.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, delay_s=0.0):
+        stand_in = self
+        self.delay_s = delay_s
+        self.num_requests = 0
+        self.num_regions = 0
+        self.num_bytes = 0
+        self._lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            #keep-alive: headers and body leave in one segment, not delayed by Nagle / delayed ACK
+            disable_nagle_algorithm = True
+            wbufsize = -1
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                message = BytesParser(policy=default_policy).parsebytes(
+                    b'Content-Type: ' + self.headers.get('Content-Type', '').encode() + b'\r\n\r\n' + body)
+
+                num_regions = 0
+                if message.is_multipart():
+                    num_regions = sum(1 for part in message.iter_parts() if part.get_filename() is not None)
+
+                if stand_in.delay_s > 0:
+                    threading.Event().wait(stand_in.delay_s)
+
+                with stand_in._lock:
+                    stand_in.num_requests += 1
+                    stand_in.num_regions += num_regions
+                    stand_in.num_bytes += len(body)
+
+                response = json.dumps({'regions': num_regions}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return 'http://{}:{}/'.format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def make_synthetic_label(height=1024, width=1224, num_lines=6, seed=0) -> tuple:
+    """Returns a grayscale parcel label like image and the boxes of its text lines
+    """
+    rng = np.random.default_rng(seed)
+    image = np.clip(rng.normal(170, 12, (height, width)), 0, 255).astype(np.uint8)
+
+    boxes = []
+    for line in range(num_lines):
+        text = ''.join(rng.choice(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'), 10))
+        origin = (int(rng.integers(20, width // 3)), 80 + line * (height - 120) // num_lines)
+        (text_width, text_height), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 1.5, 3)
+        cv2.putText(image, text, origin, cv2.FONT_HERSHEY_SIMPLEX, 1.5, 30, 3, cv2.LINE_AA)
+        boxes.append([origin[0], origin[1] - text_height, text_width, text_height + baseline])
+
+    return image, np.array(boxes, dtype=np.int32)
+
+
+def demo():
+    """Compare uploading a whole label with uploading its text regions, against the stand-in server
+    """
+    image, boxes = make_synthetic_label()
+
+    with StandInOcrServer() as server:
+        with requests.Session() as session:
+            post_text_regions(server.url, image, [], session=session)
+            full_bytes = server.num_bytes
+
+            post_text_regions(server.url, image, boxes, session=session)
+            region_bytes = server.num_bytes - full_bytes
+
+    print('Full image upload:   {:8d} bytes'.format(full_bytes))
+    print('Text region upload:  {:8d} bytes in {} regions ({:.1f}x smaller)'.format(region_bytes, len(boxes), full_bytes / max(region_bytes, 1)))
+
+
+if __name__ == '__main__':
+    demo()